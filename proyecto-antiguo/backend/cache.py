@@ -0,0 +1,101 @@
+"""
+Cachés en proceso (thread-safe) para datos estáticos o de vida corta.
+
+FastAPI ejecuta los endpoints síncronos en un threadpool, así que todas las
+operaciones van protegidas por un Lock. Cada caché lleva contadores de
+aciertos/fallos para poder exponerlos en diagnóstico.
+"""
+
+import threading
+import time
+from collections import OrderedDict
+from typing import Any, Callable, Dict, Hashable, Optional, Tuple
+
+_MISSING = object()
+
+
+class TTLCache:
+    """
+    Caché clave -> valor con caducidad (TTL) y tamaño máximo opcional (LRU).
+
+    - ttl_seconds: vida por defecto de cada entrada; set() admite expires_at propio.
+    - maxsize: si se supera, se expulsa la entrada usada hace más tiempo.
+    """
+
+    def __init__(self, ttl_seconds: float, maxsize: Optional[int] = None) -> None:
+        self._ttl = float(ttl_seconds)
+        self._maxsize = maxsize
+        self._data: "OrderedDict[Hashable, Tuple[Any, float]]" = OrderedDict()
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    @property
+    def ttl_seconds(self) -> float:
+        return self._ttl
+
+    def get(self, key: Hashable, default: Any = None) -> Any:
+        """Devuelve el valor si existe y no ha caducado; si no, default (cuenta como fallo)."""
+        now = time.monotonic()
+        with self._lock:
+            entry = self._data.get(key, _MISSING)
+            if entry is not _MISSING:
+                value, expires_at = entry
+                if expires_at > now:
+                    self._data.move_to_end(key)
+                    self.hits += 1
+                    return value
+                del self._data[key]
+            self.misses += 1
+            return default
+
+    def set(self, key: Hashable, value: Any, expires_at: Optional[float] = None) -> None:
+        """
+        Guarda value. expires_at es un instante de time.monotonic(); por defecto now + ttl.
+        """
+        if expires_at is None:
+            expires_at = time.monotonic() + self._ttl
+        with self._lock:
+            self._data[key] = (value, expires_at)
+            self._data.move_to_end(key)
+            if self._maxsize is not None:
+                while len(self._data) > self._maxsize:
+                    self._data.popitem(last=False)
+
+    def get_or_load(self, key: Hashable, loader: Callable[[], Any]) -> Any:
+        """Devuelve el valor cacheado o lo carga con loader() y lo guarda."""
+        value = self.get(key, _MISSING)
+        if value is not _MISSING:
+            return value
+        value = loader()
+        self.set(key, value)
+        return value
+
+    def invalidate(self, key: Hashable) -> None:
+        """Elimina una entrada (no falla si no existe)."""
+        with self._lock:
+            self._data.pop(key, None)
+
+    def invalidate_where(self, predicate: Callable[[Hashable, Any], bool]) -> int:
+        """Elimina las entradas para las que predicate(key, value) es True. Devuelve cuántas."""
+        with self._lock:
+            keys = [k for k, (v, _exp) in self._data.items() if predicate(k, v)]
+            for k in keys:
+                del self._data[k]
+        return len(keys)
+
+    def clear(self) -> None:
+        with self._lock:
+            self._data.clear()
+
+    def stats(self) -> Dict[str, Any]:
+        """Contadores para diagnóstico: hits, misses, tamaño actual y TTL."""
+        with self._lock:
+            size = len(self._data)
+        return {
+            "hits": self.hits,
+            "misses": self.misses,
+            "size": size,
+            "maxsize": self._maxsize,
+            "ttl_seconds": self._ttl,
+        }
@@ -5,6 +5,8 @@ from typing import Dict, Any
 from dotenv import load_dotenv
 from supabase import Client, create_client
 
+from backend.cache import TTLCache
+
 # Cargar .env desde la raíz del proyecto (donde se ejecuta uvicorn)
 _env_path = Path(__file__).resolve().parent.parent / ".env"
 load_dotenv(dotenv_path=_env_path)
@@ -21,6 +23,53 @@ SKIP_AUTH: bool = os.environ.get("SKIP_AUTH", "").lower() in ("true", "1", "yes"
 # Producción: si False, los 500 no exponen el detail real (solo "Internal Server Error").
 DEBUG: bool = os.environ.get("DEBUG", "").lower() in ("true", "1", "yes")
 
+# Segundos que se reutilizan los maestros (tbl_estados, tbl_tipolicitacion) antes de releerlos.
+# 0 desactiva la caché (cada llamada consulta Supabase, como antes).
+MAESTROS_TTL_SECONDS: float = float(os.environ.get("MAESTROS_TTL_SECONDS", "600"))
+
+# Segundos de vida del snapshot de KPIs del dashboard por organización. Las escrituras de la API
+# lo refrescan al momento; el TTL recoge cambios hechos fuera (scripts, PHP). 0 lo desactiva.
+KPI_SNAPSHOT_TTL_SECONDS: float = float(os.environ.get("KPI_SNAPSHOT_TTL_SECONDS", "300"))
+
+# Series diarias de precio por producto (backend.services.price_series). 0 = sin caché.
+PRICE_SERIES_TTL_SECONDS: float = float(os.environ.get("PRICE_SERIES_TTL_SECONDS", "600"))
+
+# Índice de nombres de producto por organización (backend.services.product_index). Al caducar se
+# relee tbl_productos, así se recogen las altas hechas fuera de la API. 0 = sin caché.
+PRODUCT_INDEX_TTL_SECONDS: float = float(os.environ.get("PRODUCT_INDEX_TTL_SECONDS", "300"))
+# Mínimo de segundos entre dos reconstrucciones del índice de productos de una organización
+# (se reconstruye en segundo plano al caducar o tras un fallo).
+PRODUCT_INDEX_REFRESH_DEBOUNCE_SECONDS: float = float(os.environ.get("PRODUCT_INDEX_REFRESH_DEBOUNCE_SECONDS", "5"))
+
+# Bitmap de productos con histórico de precios por organización (PriceHistoryRepository). Las
+# escrituras de la API lo mantienen al momento; al caducar se reconstruye en segundo plano
+# recorriendo tbl_precios_referencia y tbl_licitaciones_detalle. 0 = sin bitmap (consulta en lote).
+PRICE_HISTORY_TTL_SECONDS: float = float(os.environ.get("PRICE_HISTORY_TTL_SECONDS", "900"))
+
+# Tope de puntos por serie en las gráficas de precio (/analytics/product, /analytics/material-trends)
+# cuando la petición no pasa max_puntos: por encima se reduce con LTTB. 0 = sin tope.
+CHART_MAX_POINTS: int = int(os.environ.get("CHART_MAX_POINTS", "2000"))
+
+# Máximo de líneas por petición en POST /analytics/price-deviation-check/bulk (un presupuesto).
+PRICE_DEVIATION_BULK_MAX_ITEMS: int = int(os.environ.get("PRICE_DEVIATION_BULK_MAX_ITEMS", "1000"))
+
+# Hilos para lanzar en paralelo consultas independientes a Supabase (backend.query_executor). 1 = en serie.
+QUERY_POOL_WORKERS: int = int(os.environ.get("QUERY_POOL_WORKERS", "8"))
+
+# Filas por página en las lecturas paginadas (BaseTenantRepository.iter_pages). Debe ser <= max-rows
+# de PostgREST (1000 por defecto en Supabase); si no, las páginas llegan recortadas y se corta la lectura.
+SUPABASE_PAGE_SIZE: int = int(os.environ.get("SUPABASE_PAGE_SIZE", "1000"))
+
+# Nº máximo de valores por filtro .in_() en BaseTenantRepository.get_in: la URL de PostgREST tiene
+# longitud limitada (~8 KB en la mayoría de proxies); 200 ids enteros caben holgadamente.
+SUPABASE_IN_CHUNK_SIZE: int = int(os.environ.get("SUPABASE_IN_CHUNK_SIZE", "200"))
+
+# Filas por petición en las importaciones masivas (insert en lote a Supabase).
+IMPORT_BATCH_SIZE: int = int(os.environ.get("IMPORT_BATCH_SIZE", "500"))
+
+# Filas que se leen del Excel por trozo (lectura en streaming con openpyxl read_only).
+IMPORT_READ_CHUNK_ROWS: int = int(os.environ.get("IMPORT_READ_CHUNK_ROWS", "5000"))
+
 
 def init_connection() -> Client:
     """
@@ -49,12 +98,34 @@ def init_connection() -> Client:
 supabase_client: Client = init_connection()
 
 
+_maestros_cache = TTLCache(ttl_seconds=MAESTROS_TTL_SECONDS, maxsize=1)
+
+
 def get_maestros(client: Client) -> Dict[str, Any]:
     """
     Carga los diccionarios de Estados y Tipos de Licitación.
 
     Lógica adaptada desde `src/config.py::get_maestros`, eliminando dependencias de Streamlit.
+    Los catálogos son casi estáticos: se sirven desde una caché de proceso con TTL
+    (MAESTROS_TTL_SECONDS) que se invalida con invalidate_maestros().
     """
+    if MAESTROS_TTL_SECONDS <= 0:
+        return _load_maestros(client)
+    return _maestros_cache.get_or_load("maestros", lambda: _load_maestros(client))
+
+
+def invalidate_maestros() -> None:
+    """Descarta los maestros cacheados. Llamar tras escribir en tbl_estados o tbl_tipolicitacion."""
+    _maestros_cache.invalidate("maestros")
+
+
+def get_maestros_cache_stats() -> Dict[str, Any]:
+    """Aciertos/fallos de la caché de maestros (diagnóstico)."""
+    return _maestros_cache.stats()
+
+
+def _load_maestros(client: Client) -> Dict[str, Any]:
+    """Lee tbl_estados y tbl_tipolicitacion y construye los mapeos."""
     estados_db = client.table("tbl_estados").select("*").execute().data or []
     tipos_db = client.table("tbl_tipolicitacion").select("*").execute().data or []
 
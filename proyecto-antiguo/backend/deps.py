@@ -2,24 +2,112 @@
 Dependencias de seguridad para FastAPI.
 
 Valida el JWT de Supabase Auth y enriquece el usuario con organization_id
-y role desde public.profiles. Sin caché en proceso (stateless; cada request
-consulta Supabase). Para alto tráfico puede añadirse caché externo (Redis) o
-functools.lru_cache con TTL según necesidad.
+y role desde public.profiles.
+
+Caché en proceso (por worker):
+- Tokens verificados: LRU acotado por hash SHA-256 del token; cada entrada
+  caduca en el `exp` del propio JWT, así que un token caducado nunca se sirve.
+- Perfiles (organization_id, role): TTL corto por user_id.
+Los endpoints de routers/auth.py que cambian rol, contraseña o borran usuarios
+llaman a invalidate_user_cache() para que el cambio se aplique de inmediato.
 """
 
-from typing import Annotated
+import hashlib
+import os
+import time
+from typing import Annotated, Any, Dict, Optional
 from uuid import UUID
 
 import jwt
 from fastapi import Depends, HTTPException, status
 from fastapi.security import HTTPAuthorizationCredentials, HTTPBearer
 
+from backend.cache import TTLCache
 from backend.config import SKIP_AUTH, SUPABASE_JWT_SECRET, supabase_client
 from backend.schemas.auth import CurrentUser
 from backend.roles import normalize_role
 
 security = HTTPBearer(auto_error=False)
 
+# Máximo de tokens verificados en memoria y TTL de perfiles (segundos; 0 desactiva).
+AUTH_TOKEN_CACHE_SIZE: int = int(os.environ.get("AUTH_TOKEN_CACHE_SIZE", "1024"))
+AUTH_PROFILE_TTL_SECONDS: float = float(os.environ.get("AUTH_PROFILE_TTL_SECONDS", "60"))
+# Vida máxima de un token validado por la API de Supabase cuando no se puede leer su exp.
+_TOKEN_FALLBACK_TTL_SECONDS = 300.0
+
+_token_cache = TTLCache(ttl_seconds=_TOKEN_FALLBACK_TTL_SECONDS, maxsize=AUTH_TOKEN_CACHE_SIZE)
+_profile_cache = TTLCache(ttl_seconds=AUTH_PROFILE_TTL_SECONDS, maxsize=AUTH_TOKEN_CACHE_SIZE)
+
+
+def _token_key(token: str) -> str:
+    """Clave de caché: nunca se guarda el token en claro."""
+    return hashlib.sha256(token.encode("utf-8")).hexdigest()
+
+
+def _token_expires_at(token: str, payload: Dict[str, Any]) -> Optional[float]:
+    """
+    Instante (time.monotonic) en que caduca el token según su claim exp.
+    Si el payload no lo trae (validación vía API), se lee sin verificar firma.
+    """
+    exp = payload.get("exp")
+    if exp is None:
+        try:
+            exp = jwt.decode(token, options={"verify_signature": False}).get("exp")
+        except jwt.InvalidTokenError:
+            exp = None
+    if exp is None:
+        return time.monotonic() + _TOKEN_FALLBACK_TTL_SECONDS
+    try:
+        remaining = float(exp) - time.time()
+    except (TypeError, ValueError):
+        return None
+    if remaining <= 0:
+        return None
+    return time.monotonic() + remaining
+
+
+def _cache_token_payload(token: str, payload: Dict[str, Any]) -> None:
+    if AUTH_TOKEN_CACHE_SIZE <= 0:
+        return
+    expires_at = _token_expires_at(token, payload)
+    if expires_at is not None:
+        _token_cache.set(_token_key(token), payload, expires_at=expires_at)
+
+
+def _get_profile(user_id: str) -> Optional[Dict[str, Any]]:
+    """Perfil (organization_id, role) desde caché o public.profiles. None si no existe."""
+    if AUTH_PROFILE_TTL_SECONDS > 0:
+        cached = _profile_cache.get(user_id)
+        if cached is not None:
+            return cached
+    profile_resp = (
+        supabase_client.table("profiles")
+        .select("organization_id, role")
+        .eq("id", user_id)
+        .execute()
+    )
+    if not profile_resp.data or len(profile_resp.data) == 0:
+        return None
+    profile = profile_resp.data[0]
+    if AUTH_PROFILE_TTL_SECONDS > 0:
+        _profile_cache.set(user_id, profile)
+    return profile
+
+
+def invalidate_user_cache(user_id: str) -> None:
+    """
+    Descarta el perfil cacheado y los tokens verificados de un usuario.
+    Llamar tras cambiar su rol, su contraseña o eliminarlo.
+    """
+    uid = str(user_id).strip()
+    _profile_cache.invalidate(uid)
+    _token_cache.invalidate_where(lambda _k, payload: str(payload.get("sub", "")) == uid)
+
+
+def get_auth_cache_stats() -> Dict[str, Any]:
+    """Aciertos/fallos de las cachés de token y perfil (diagnóstico)."""
+    return {"tokens": _token_cache.stats(), "profiles": _profile_cache.stats()}
+
 
 def _get_dummy_user() -> CurrentUser:
     """Usuario dummy para desarrollo cuando SKIP_AUTH=true."""
@@ -44,8 +132,8 @@ async def get_current_user(
 
     1. Si SKIP_AUTH=true y no hay token, devuelve usuario dummy (desarrollo).
     2. Extrae el token del header Authorization.
-    3. Verifica el token con el JWT secret de Supabase.
-    4. Obtiene el profile (organization_id, role) desde public.profiles.
+    3. Verifica el token con el JWT secret de Supabase (o lo toma de la caché de tokens).
+    4. Obtiene el profile (organization_id, role) desde la caché o public.profiles.
     5. Devuelve CurrentUser enriquecido.
     """
     if credentials is None:
@@ -65,9 +153,12 @@ async def get_current_user(
             detail="SUPABASE_JWT_SECRET no configurado. Añade la variable en .env.",
         )
 
+    # Token ya verificado en este proceso (caduca con su exp)
+    payload = _token_cache.get(_token_key(token)) if AUTH_TOKEN_CACHE_SIZE > 0 else None
+
     # Intentar Supabase Auth (aud=authenticated) o token legacy (aud=veraleza-legacy)
-    payload = None
-    for audience in ("authenticated", "veraleza-legacy"):
+    audiences = ("authenticated", "veraleza-legacy") if payload is None else ()
+    for audience in audiences:
         try:
             payload = jwt.decode(
                 token,
@@ -75,6 +166,7 @@ async def get_current_user(
                 audience=audience,
                 algorithms=["HS256"],
             )
+            _cache_token_payload(token, payload)
             break
         except jwt.InvalidAudienceError:
             continue
@@ -95,6 +187,7 @@ async def get_current_user(
                 user_id = str(user_resp.user.id)
                 email = user_resp.user.email or ""
                 payload = {"sub": user_id, "email": email, "aud": "authenticated"}
+                _cache_token_payload(token, payload)
             else:
                 raise HTTPException(
                     status_code=status.HTTP_401_UNAUTHORIZED,
@@ -137,27 +230,21 @@ async def get_current_user(
             headers={"WWW-Authenticate": "Bearer"},
         )
 
-    # Obtener profile (organization_id, role) desde public.profiles
+    # Obtener profile (organization_id, role) desde caché o public.profiles
     try:
-        profile_resp = (
-            supabase_client.table("profiles")
-            .select("organization_id, role")
-            .eq("id", user_id)
-            .execute()
-        )
+        profile = _get_profile(str(user_id))
     except Exception as e:
         raise HTTPException(
             status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
             detail=f"Error obteniendo perfil: {e!s}",
         ) from e
 
-    if not profile_resp.data or len(profile_resp.data) == 0:
+    if profile is None:
         raise HTTPException(
             status_code=status.HTTP_403_FORBIDDEN,
             detail="No existe perfil para este usuario. Contacta al administrador.",
         )
 
-    profile = profile_resp.data[0]
     org_id = profile.get("organization_id")
     role = normalize_role(profile.get("role"))
 
@@ -57,6 +57,8 @@ app.add_middleware(
     allow_credentials=True,
     allow_methods=["*"],
     allow_headers=["*"],
+    # Cursor de paginación keyset (GET /deliveries?limit=...)
+    expose_headers=["X-Next-Cursor"],
 )
 
 
@@ -0,0 +1,113 @@
+"""
+Ejecución concurrente de consultas independientes a Supabase (PostgREST).
+
+Los endpoints síncronos de FastAPI corren en un threadpool y cada consulta es una
+petición HTTP bloqueante: lanzar en paralelo las que no dependen entre sí hace que
+la latencia se acerque a la de la consulta más lenta en vez de a la suma.
+
+Cada consulta se cronometra; los tiempos se registran en el log (DEBUG) y se
+acumulan por etiqueta para diagnóstico (get_query_stats).
+"""
+
+import logging
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any, Callable, Dict, Mapping, Optional, Tuple, TypeVar
+
+from backend.config import QUERY_POOL_WORKERS
+
+logger = logging.getLogger(__name__)
+
+T = TypeVar("T")
+
+_executor: Optional[ThreadPoolExecutor] = None
+_executor_lock = threading.Lock()
+_stats: Dict[str, Dict[str, float]] = {}
+_stats_lock = threading.Lock()
+# Marca los hilos del pool: una llamada anidada se ejecuta en serie para no bloquear el pool
+# esperando a tareas que no tienen hilo libre.
+_local = threading.local()
+
+
+def _get_executor() -> ThreadPoolExecutor:
+    global _executor
+    with _executor_lock:
+        if _executor is None:
+            _executor = ThreadPoolExecutor(
+                max_workers=QUERY_POOL_WORKERS,
+                thread_name_prefix="supabase-query",
+                initializer=_mark_worker,
+            )
+        return _executor
+
+
+def _mark_worker() -> None:
+    _local.in_pool = True
+
+
+def _timed(fn: Callable[[], T]) -> Tuple[T, float]:
+    t0 = time.perf_counter()
+    value = fn()
+    return value, (time.perf_counter() - t0) * 1000
+
+
+def _record(label: str, timings: Dict[str, float]) -> None:
+    with _stats_lock:
+        for key, ms in timings.items():
+            s = _stats.setdefault(f"{label}.{key}" if label else key, {"count": 0, "total_ms": 0.0, "max_ms": 0.0})
+            s["count"] += 1
+            s["total_ms"] += ms
+            s["max_ms"] = max(s["max_ms"], ms)
+
+
+def run_parallel(queries: Mapping[str, Callable[[], T]], label: str = "") -> Dict[str, T]:
+    """
+    Ejecuta en paralelo funciones sin argumentos (cada una, una o varias consultas
+    encadenadas) y devuelve {clave: resultado} con las mismas claves.
+
+    Si alguna falla se espera al resto y se relanza la primera excepción (en el orden
+    de las claves), igual que si se hubieran ejecutado una tras otra.
+    Con QUERY_POOL_WORKERS <= 1, una sola consulta o desde dentro del pool se ejecuta en serie.
+    """
+    t0 = time.perf_counter()
+    outcomes: Dict[str, Tuple[bool, Any, float]] = {}
+    if len(queries) <= 1 or QUERY_POOL_WORKERS <= 1 or getattr(_local, "in_pool", False):
+        for key, fn in queries.items():
+            try:
+                value, ms = _timed(fn)
+                outcomes[key] = (True, value, ms)
+            except Exception as e:
+                outcomes[key] = (False, e, 0.0)
+                break
+    else:
+        pool = _get_executor()
+        futures = {key: pool.submit(_timed, fn) for key, fn in queries.items()}
+        for key, fut in futures.items():
+            try:
+                value, ms = fut.result()
+                outcomes[key] = (True, value, ms)
+            except Exception as e:
+                outcomes[key] = (False, e, 0.0)
+
+    timings = {key: ms for key, (ok, _v, ms) in outcomes.items() if ok}
+    _record(label, timings)
+    logger.debug(
+        "Consultas %s: total %.1f ms; %s",
+        label or "-",
+        (time.perf_counter() - t0) * 1000,
+        ", ".join(f"{k}={ms:.1f} ms" for k, ms in timings.items()),
+    )
+    for key, (ok, value, _ms) in outcomes.items():
+        if not ok:
+            raise value
+    return {key: value for key, (_ok, value, _ms) in outcomes.items()}
+
+
+def get_query_stats() -> Dict[str, Dict[str, float]]:
+    """Tiempos acumulados por "etiqueta.clave": count, total_ms, max_ms y avg_ms."""
+    with _stats_lock:
+        return {
+            k: {**v, "avg_ms": round(v["total_ms"] / v["count"], 2) if v["count"] else 0.0}
+            for k, v in _stats.items()
+        }
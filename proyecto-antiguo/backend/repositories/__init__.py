@@ -6,6 +6,7 @@ siempre el filtro organization_id para evitar fugas de datos entre organizacione
 """
 
 from backend.repositories.base_repository import BaseTenantRepository
+from backend.repositories.price_history_repository import PriceHistoryRepository
 from backend.repositories.tenders_repository import TendersRepository
 
-__all__ = ["BaseTenantRepository", "TendersRepository"]
+__all__ = ["BaseTenantRepository", "PriceHistoryRepository", "TendersRepository"]
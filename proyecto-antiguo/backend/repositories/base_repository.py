@@ -6,10 +6,20 @@ organization_id, evitando fugas de datos entre organizaciones.
 No expone el client sin el filtro; las operaciones se realizan siempre en el ámbito del tenant.
 """
 
-from typing import Any, Dict, List, Optional
+from typing import Any, Callable, Dict, Iterable, Iterator, List, Optional, Tuple
 
 from supabase import Client
 
+from backend.config import QUERY_POOL_WORKERS, SUPABASE_IN_CHUNK_SIZE, SUPABASE_PAGE_SIZE
+from backend.query_executor import run_parallel
+from backend.utils import chunked
+
+
+def _valor_filtro(valor: Any) -> str:
+    """Valor entre comillas para un filtro or=(...) de PostgREST (comas y paréntesis son reservados)."""
+    texto = str(valor).replace("\\", "\\\\").replace('"', '\\"')
+    return f'"{texto}"'
+
 
 class BaseTenantRepository:
     """
@@ -65,6 +75,203 @@ class BaseTenantRepository:
         response = query.execute()
         return list(response.data or [])
 
+    def _paged_query(
+        self,
+        select: str,
+        order_by: Optional[str],
+        order_desc: bool,
+        query_filter: Optional[Callable[[Any], Any]],
+        extra_eq: Dict[str, Any],
+        count: Optional[str] = None,
+    ):
+        """Consulta scoped por organization_id con orden estable (siempre termina en la PK)."""
+        query = (
+            self._table()
+            .select(select, count=count)
+            .eq("organization_id", self._organization_id)
+        )
+        for key, value in extra_eq.items():
+            query = query.eq(key, value)
+        if query_filter is not None:
+            query = query_filter(query)
+        if order_by and order_by != self._pk_column:
+            query = query.order(order_by, desc=order_desc)
+            query = query.order(self._pk_column, desc=order_desc)
+        else:
+            query = query.order(self._pk_column, desc=order_desc)
+        return query
+
+    def iter_pages(
+        self,
+        select: str = "*",
+        order_by: Optional[str] = None,
+        order_desc: bool = False,
+        page_size: Optional[int] = None,
+        parallel: bool = False,
+        query_filter: Optional[Callable[[Any], Any]] = None,
+        **extra_eq: Any,
+    ) -> Iterator[List[Dict[str, Any]]]:
+        """
+        Lee todas las filas de la organización por páginas (.range(), cabecera Range de PostgREST),
+        sin el tope de filas por respuesta de Supabase (1000 por defecto). Generador de páginas.
+
+        - page_size: filas por petición; no debe superar el max-rows del servidor (SUPABASE_PAGE_SIZE).
+        - parallel: la primera página pide el total (count=exact) y el resto se descarga en
+          tandas de QUERY_POOL_WORKERS páginas concurrentes; se siguen devolviendo en orden.
+        - query_filter: función que recibe la consulta y añade filtros (in_, ilike, gte...).
+        - extra_eq: filtros .eq(key, value) como en get_all.
+        """
+        size = page_size or SUPABASE_PAGE_SIZE
+
+        def _page(start: int, count: Optional[str] = None):
+            query = self._paged_query(select, order_by, order_desc, query_filter, extra_eq, count=count)
+            return query.range(start, start + size - 1).execute()
+
+        first = _page(0, count="exact" if parallel else None)
+        rows = list(first.data or [])
+        if rows:
+            yield rows
+        if len(rows) < size:
+            return
+
+        total = getattr(first, "count", None) if parallel else None
+        if total is None:
+            start = size
+            while True:
+                rows = list(_page(start).data or [])
+                if rows:
+                    yield rows
+                if len(rows) < size:
+                    return
+                start += size
+
+        starts = list(range(size, int(total), size))
+        window = max(QUERY_POOL_WORKERS, 1)
+        for i in range(0, len(starts), window):
+            batch = starts[i:i + window]
+            pages = run_parallel(
+                {str(st): (lambda st=st: _page(st)) for st in batch},
+                label=f"paged.{self._table_name}",
+            )
+            for st in batch:
+                rows = list(pages[str(st)].data or [])
+                if rows:
+                    yield rows
+
+    def iter_all(self, select: str = "*", **kwargs: Any) -> Iterator[Dict[str, Any]]:
+        """Como iter_pages pero fila a fila (mismos argumentos)."""
+        for page in self.iter_pages(select, **kwargs):
+            yield from page
+
+    def get_page_after(
+        self,
+        select: str,
+        order_by: str,
+        after: Optional[Tuple[Any, Any]] = None,
+        limit: Optional[int] = None,
+        order_desc: bool = True,
+        query_filter: Optional[Callable[[Any], Any]] = None,
+        **extra_eq: Any,
+    ) -> List[Dict[str, Any]]:
+        """
+        Una página por keyset: filas ordenadas por (order_by, PK), con las NULL de order_by al
+        final, a continuación de la fila after = (valor de order_by, PK). A diferencia de .range(),
+        no hay offset: cada página cuesta lo mismo y no se saltan ni repiten filas si entran otras.
+        select debe incluir order_by y la PK (para el after de la página siguiente).
+        """
+        op = "lt" if order_desc else "gt"
+        pk = self._pk_column
+        query = (
+            self._table()
+            .select(select)
+            .eq("organization_id", self._organization_id)
+        )
+        for key, value in extra_eq.items():
+            query = query.eq(key, value)
+        if query_filter is not None:
+            query = query_filter(query)
+        if after is not None:
+            valor, pk_valor = after
+            if valor is None:
+                query = getattr(query.is_(order_by, "null"), op)(pk, pk_valor)
+            else:
+                v, pv = _valor_filtro(valor), _valor_filtro(pk_valor)
+                query = query.or_(f"{order_by}.{op}.{v},{order_by}.is.null,and({order_by}.eq.{v},{pk}.{op}.{pv})")
+        query = query.order(order_by, desc=order_desc, nullsfirst=False).order(pk, desc=order_desc)
+        return list(query.limit(limit or SUPABASE_PAGE_SIZE).execute().data or [])
+
+    def iter_keyset(
+        self,
+        select: str,
+        order_by: str,
+        after: Optional[Tuple[Any, Any]] = None,
+        page_size: Optional[int] = None,
+        order_desc: bool = True,
+        query_filter: Optional[Callable[[Any], Any]] = None,
+        **extra_eq: Any,
+    ) -> Iterator[Dict[str, Any]]:
+        """
+        Todas las filas desde after, fila a fila, pidiendo páginas con get_page_after. Generador:
+        solo retiene una página, así que sirve para exportaciones en streaming de tablas grandes.
+        """
+        size = page_size or SUPABASE_PAGE_SIZE
+        while True:
+            rows = self.get_page_after(
+                select, order_by, after=after, limit=size, order_desc=order_desc,
+                query_filter=query_filter, **extra_eq,
+            )
+            yield from rows
+            if len(rows) < size:
+                return
+            after = (rows[-1].get(order_by), rows[-1].get(self._pk_column))
+
+    def get_in(
+        self,
+        column: str,
+        values: Iterable[Any],
+        select: str = "*",
+        order_by: Optional[str] = None,
+        order_desc: bool = False,
+        chunk_size: Optional[int] = None,
+        query_filter: Optional[Callable[[Any], Any]] = None,
+        **extra_eq: Any,
+    ) -> List[Dict[str, Any]]:
+        """
+        Filas con column IN values para listas de ids de cualquier tamaño.
+
+        Los valores se deduplican y se parten en trozos de SUPABASE_IN_CHUNK_SIZE (la URL de
+        PostgREST tiene longitud limitada); los trozos se consultan en paralelo, cada uno
+        paginado con iter_pages, y se concatenan. Con order_by y varios trozos se reordena
+        el resultado en memoria (NULL al final en ascendente, como PostgreSQL).
+        """
+        unicos = list(dict.fromkeys(v for v in values if v is not None))
+        if not unicos:
+            return []
+        trozos = list(chunked(unicos, chunk_size or SUPABASE_IN_CHUNK_SIZE))
+
+        def _fetch(ids: List[Any]) -> List[Dict[str, Any]]:
+            def _filtro(query):
+                query = query.in_(column, ids)
+                return query_filter(query) if query_filter is not None else query
+
+            return list(self.iter_all(
+                select, order_by=order_by, order_desc=order_desc, query_filter=_filtro, **extra_eq,
+            ))
+
+        res = run_parallel(
+            {str(i): (lambda ids=ids: _fetch(ids)) for i, ids in enumerate(trozos)},
+            label=f"in.{self._table_name}",
+        )
+        rows = [r for i in range(len(trozos)) for r in res[str(i)]]
+        if len(trozos) > 1:
+            pk = self._pk_column
+            claves = [order_by, pk] if order_by and order_by != pk else [pk]
+            rows.sort(
+                key=lambda r: tuple((r.get(c) is None, r.get(c) if r.get(c) is not None else 0) for c in claves),
+                reverse=order_desc,
+            )
+        return rows
+
     def get_by_id(
         self,
         pk_value: Any,
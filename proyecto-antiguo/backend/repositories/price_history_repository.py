@@ -0,0 +1,264 @@
+"""
+Repositorio de "productos con histórico de precios" por organización.
+
+Un producto tiene histórico si tiene alguna fila en tbl_precios_referencia o alguna partida activa
+en tbl_licitaciones_detalle. El buscador histórico (/search) y el combobox de productos
+(/productos/search?only_with_precios_referencia=true) filtran por esto cada candidato, así que
+se mantiene por organización un bitmap sobre los ids de producto (pertenencia O(1)):
+
+- se construye recorriendo una vez las dos tablas (solo id_producto, páginas en paralelo) en un
+  hilo aparte; mientras no está listo, el filtro consulta los candidatos en lote (IN troceado);
+- las escrituras de la API lo mantienen al momento: mark_added() marca productos que acaban de
+  ganar histórico (precio de referencia insertado, partida activa) y mark_changed() apunta los
+  que pueden haberlo perdido (partida borrada, desactivada o cambiada de producto), que se
+  recomprueban en un solo lote en la siguiente lectura;
+- al caducar (PRICE_HISTORY_TTL_SECONDS) se reconstruye en segundo plano para recoger lo escrito
+  fuera de la API (PHP, scripts), sirviendo mientras tanto el bitmap actual.
+"""
+
+import itertools
+import logging
+import threading
+import time
+from typing import Any, Dict, Iterable, List, Optional, Set, Tuple
+
+import numpy as np
+
+from backend.config import PRICE_HISTORY_TTL_SECONDS
+from backend.query_executor import run_parallel
+from backend.repositories.base_repository import BaseTenantRepository
+
+logger = logging.getLogger(__name__)
+
+
+class ProductBitmap:
+    """Conjunto de ids de producto como bitmap (un byte por id): pertenencia, alta y baja O(1)."""
+
+    __slots__ = ("_bits",)
+
+    def __init__(self, product_ids: Iterable[int] = ()) -> None:
+        ids = np.fromiter((i for i in product_ids if i >= 0), dtype=np.int64)
+        bits = np.zeros(int(ids.max()) + 1 if len(ids) else 0, dtype=np.uint8)
+        bits[ids] = 1
+        self._bits = bytearray(bits.tobytes())
+
+    def __contains__(self, product_id: int) -> bool:
+        return 0 <= product_id < len(self._bits) and self._bits[product_id] == 1
+
+    def __len__(self) -> int:
+        return self._bits.count(1)
+
+    def add(self, product_id: int) -> None:
+        if product_id < 0:
+            return
+        if product_id >= len(self._bits):
+            self._bits.extend(bytes(product_id + 1 - len(self._bits)))
+        self._bits[product_id] = 1
+
+    def discard(self, product_id: int) -> None:
+        if 0 <= product_id < len(self._bits):
+            self._bits[product_id] = 0
+
+
+class _PriceHistorySets:
+    """
+    Un ProductBitmap por organización, compartido por todo el proceso (los repositorios se crean
+    por petición). Como mucho una reconstrucción por organización a la vez.
+    """
+
+    def __init__(self, ttl_seconds: float) -> None:
+        self._ttl = float(ttl_seconds)
+        # org -> (bitmap, instante de construcción en time.monotonic())
+        self._bitmaps: Dict[str, Tuple[ProductBitmap, float]] = {}
+        # org -> productos que pueden haber perdido el histórico (se recomprueban al leer).
+        self._revisar: Dict[str, Set[int]] = {}
+        # org -> productos tocados mientras se reconstruye (su estado se copia del bitmap anterior).
+        self._tocados: Dict[str, Set[int]] = {}
+        self._reconstruyendo: Set[str] = set()
+        self._lock = threading.Lock()
+        self.builds = 0
+        self.fallbacks = 0
+
+    def get(self, repo: "PriceHistoryRepository") -> Optional[ProductBitmap]:
+        """Bitmap de la organización al día, o None si aún no está construido (o sin caché)."""
+        if self._ttl <= 0:
+            return None
+        org_id = repo.organization_id
+        with self._lock:
+            entry = self._bitmaps.get(org_id)
+        if entry is None or time.monotonic() - entry[1] >= self._ttl:
+            self._programar_reconstruccion(repo)
+        if entry is None:
+            return None
+        self._aplicar_revisiones(repo, entry[0])
+        return entry[0]
+
+    def _aplicar_revisiones(self, repo: "PriceHistoryRepository", bitmap: ProductBitmap) -> None:
+        org_id = repo.organization_id
+        with self._lock:
+            ids = self._revisar.pop(org_id, set())
+        if not ids:
+            return
+        try:
+            con = repo.products_with_history(sorted(ids))
+        except Exception:
+            with self._lock:
+                self._revisar.setdefault(org_id, set()).update(ids)
+            raise
+        with self._lock:
+            for pid in ids:
+                if pid in con:
+                    bitmap.add(pid)
+                else:
+                    bitmap.discard(pid)
+
+    def _programar_reconstruccion(self, repo: "PriceHistoryRepository") -> None:
+        org_id = repo.organization_id
+        with self._lock:
+            if org_id in self._reconstruyendo:
+                return
+            self._reconstruyendo.add(org_id)
+            self._tocados[org_id] = set()
+        threading.Thread(
+            target=self._reconstruir, args=(repo,), name=f"price-history-{org_id}", daemon=True,
+        ).start()
+
+    def _reconstruir(self, repo: "PriceHistoryRepository") -> None:
+        org_id = repo.organization_id
+        try:
+            bitmap = ProductBitmap(repo.product_ids_with_history())
+            self.builds += 1
+            with self._lock:
+                anterior = self._bitmaps.get(org_id)
+                # Lo escrito durante el recorrido puede no estar en él: vale lo del bitmap anterior.
+                for pid in self._tocados.get(org_id, ()):
+                    if anterior is not None and pid in anterior[0]:
+                        bitmap.add(pid)
+                    else:
+                        bitmap.discard(pid)
+                        self._revisar.setdefault(org_id, set()).add(pid)
+                self._bitmaps[org_id] = (bitmap, time.monotonic())
+            logger.debug("Histórico de precios org %s: %d productos", org_id, len(bitmap))
+        except Exception:
+            logger.exception("Error construyendo el histórico de precios de la org %s", org_id)
+        finally:
+            with self._lock:
+                self._reconstruyendo.discard(org_id)
+                self._tocados.pop(org_id, None)
+
+    def add(self, org_id: str, product_ids: Set[int]) -> None:
+        with self._lock:
+            entry = self._bitmaps.get(org_id)
+            if entry is not None:
+                for pid in product_ids:
+                    entry[0].add(pid)
+            if org_id in self._reconstruyendo:
+                self._tocados[org_id].update(product_ids)
+
+    def changed(self, org_id: str, product_ids: Set[int]) -> None:
+        with self._lock:
+            if org_id in self._bitmaps or org_id in self._reconstruyendo:
+                self._revisar.setdefault(org_id, set()).update(product_ids)
+            if org_id in self._reconstruyendo:
+                self._tocados[org_id].update(product_ids)
+
+    def invalidate(self, org_id: Optional[str] = None) -> None:
+        with self._lock:
+            if org_id is None:
+                self._bitmaps.clear()
+                self._revisar.clear()
+            else:
+                self._bitmaps.pop(str(org_id), None)
+                self._revisar.pop(str(org_id), None)
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            return {
+                "size": len(self._bitmaps),
+                "products": {org: len(b) for org, (b, _) in self._bitmaps.items()},
+                "builds": self.builds,
+                "fallbacks": self.fallbacks,
+                "pending_checks": sum(len(v) for v in self._revisar.values()),
+                "rebuilding": len(self._reconstruyendo),
+                "ttl_seconds": self._ttl,
+            }
+
+
+_history_sets = _PriceHistorySets(ttl_seconds=PRICE_HISTORY_TTL_SECONDS)
+
+
+def _ids(product_ids: Iterable[Any]) -> Set[int]:
+    return {int(i) for i in product_ids if i is not None}
+
+
+class PriceHistoryRepository(BaseTenantRepository):
+    """
+    Productos con histórico de precios (precios de referencia o partidas activas) de una organización.
+    Las consultas van a tbl_precios_referencia y tbl_licitaciones_detalle; has_history() y
+    filter_with_history() responden desde el bitmap compartido en cuanto está construido.
+    """
+
+    TABLE_REFERENCIA = "tbl_precios_referencia"
+    TABLE_DETALLE = "tbl_licitaciones_detalle"
+
+    def __init__(self, client, organization_id: str) -> None:
+        super().__init__(client, organization_id, self.TABLE_REFERENCIA, "id")
+
+    def _detalle(self) -> BaseTenantRepository:
+        return BaseTenantRepository(self._client, self._organization_id, self.TABLE_DETALLE, "id_detalle")
+
+    def product_ids_with_history(self) -> Set[int]:
+        """Recorre las dos tablas (solo id_producto) y devuelve todos los productos con histórico."""
+        # Cada recorrido ya descarga sus páginas en paralelo (run_parallel no anida): uno tras otro.
+        filas = itertools.chain(
+            self.iter_all("id_producto", parallel=True),
+            self._detalle().iter_all("id_producto", parallel=True, activo=True),
+        )
+        return {int(r["id_producto"]) for r in filas if r.get("id_producto") is not None}
+
+    def products_with_history(self, product_ids: List[int]) -> Set[int]:
+        """Cuáles de los productos tienen histórico, consultándolo en lote (IN troceado)."""
+        if not product_ids:
+            return set()
+        filas = run_parallel({
+            "referencia": lambda: self.get_in("id_producto", product_ids, "id_producto"),
+            "detalle": lambda: self._detalle().get_in("id_producto", product_ids, "id_producto", activo=True),
+        }, label="price_history")
+        return {
+            int(r["id_producto"])
+            for r in itertools.chain(filas["referencia"], filas["detalle"])
+            if r.get("id_producto") is not None
+        }
+
+    def filter_with_history(self, product_ids: Iterable[int]) -> Set[int]:
+        """Los productos (de la lista) con histórico: O(1) por candidato con el bitmap construido."""
+        ids = list(product_ids)
+        bitmap = _history_sets.get(self)
+        if bitmap is None:
+            _history_sets.fallbacks += 1
+            return self.products_with_history(ids)
+        return {pid for pid in ids if pid in bitmap}
+
+    def has_history(self, product_id: int) -> bool:
+        return bool(self.filter_with_history([int(product_id)]))
+
+    def mark_added(self, product_ids: Iterable[Any]) -> None:
+        """Productos que acaban de ganar histórico (precio de referencia o partida activa insertados)."""
+        ids = _ids(product_ids)
+        if ids:
+            _history_sets.add(self._organization_id, ids)
+
+    def mark_changed(self, product_ids: Iterable[Any]) -> None:
+        """Productos que pueden haber perdido el histórico: se recomprueban en la siguiente lectura."""
+        ids = _ids(product_ids)
+        if ids:
+            _history_sets.changed(self._organization_id, ids)
+
+
+def invalidate_price_history(org_id: Optional[str] = None) -> None:
+    """Descarta el bitmap (de una organización o de todas): se reconstruye en la siguiente lectura."""
+    _history_sets.invalidate(org_id)
+
+
+def price_history_stats() -> Dict[str, Any]:
+    return _history_sets.stats()
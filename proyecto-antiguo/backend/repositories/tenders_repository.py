@@ -3,14 +3,18 @@ Repositorio de licitaciones (tbl_licitaciones) y partidas (tbl_licitaciones_deta
 
 Todas las operaciones están scoped por organization_id vía BaseTenantRepository.
 Métodos específicos de dominio: get_tender_with_details, get_active_budget_total.
+Las escrituras de partidas mantienen el conjunto de productos con histórico de precios
+(PriceHistoryRepository).
 """
 
+import heapq
 from datetime import date, timedelta
 from decimal import Decimal
-from typing import Any, Dict, List
+from typing import Any, Dict, Iterator, List, Optional
 
 from backend.schemas.tenders import EstadoLicitacion
 from backend.repositories.base_repository import BaseTenantRepository
+from backend.repositories.price_history_repository import PriceHistoryRepository
 
 
 class TendersRepository(BaseTenantRepository):
@@ -33,6 +37,19 @@ class TendersRepository(BaseTenantRepository):
             table_name=self.TABLE_LICITACIONES,
             pk_column=self.PK_LICITACION,
         )
+        self._price_history = PriceHistoryRepository(client, organization_id)
+
+    def delete(self, pk_value: Any, pk_column: Optional[str] = None) -> None:
+        """Elimina una licitación; sus productos se recomprueban en el histórico de precios."""
+        response = (
+            self._client.table(self.TABLE_DETALLE)
+            .select("id_producto")
+            .eq("organization_id", self._organization_id)
+            .eq(self.PK_LICITACION, pk_value)
+            .execute()
+        )
+        super().delete(pk_value, pk_column)
+        self._price_history.mark_changed(r.get("id_producto") for r in response.data or [])
 
     def list_tenders(
         self,
@@ -42,66 +59,81 @@ class TendersRepository(BaseTenantRepository):
     ) -> List[Dict[str, Any]]:
         """Lista licitaciones raíz y, excepcionalmente, derivados en análisis con
         fecha de presentación en ≤5 días. Filtros opcionales; orden id_licitacion desc."""
-        query_raiz = (
+        return list(self.iter_tenders(estado_id=estado_id, nombre=nombre, pais=pais))
+
+    def iter_tenders(
+        self,
+        estado_id: int | None = None,
+        nombre: str | None = None,
+        pais: str | None = None,
+    ) -> Iterator[Dict[str, Any]]:
+        """Como list_tenders, pero generador: las licitaciones raíz se leen por páginas (sin el tope
+        de 1000 filas) y se intercalan con los derivados urgentes manteniendo el orden id desc."""
+
+        def _filtro_raiz(query):
+            query = query.is_("id_licitacion_padre", "null")
+            if estado_id is not None:
+                query = query.eq("id_estado", estado_id)
+            if nombre and nombre.strip():
+                query = query.ilike("nombre", f"%{nombre.strip()}%")
+            if pais and pais.strip():
+                query = query.eq("pais", pais.strip())
+            return query
+
+        derivados = self._derivados_urgentes(estado_id=estado_id, nombre=nombre, pais=pais)
+        raiz = self.iter_all("*", order_desc=True, query_filter=_filtro_raiz)
+        # Evitar duplicados por id: heapq.merge los deja seguidos (primero el de la raíz).
+        ultimo = None
+        for row in heapq.merge(raiz, derivados, key=lambda x: x[self.PK_LICITACION], reverse=True):
+            if row[self.PK_LICITACION] != ultimo:
+                ultimo = row[self.PK_LICITACION]
+                yield row
+
+    def _derivados_urgentes(
+        self,
+        estado_id: int | None = None,
+        nombre: str | None = None,
+        pais: str | None = None,
+    ) -> List[Dict[str, Any]]:
+        """Derivados (hijos AM/SDA) en análisis con presentación en ≤5 días, orden id desc."""
+        if estado_id is not None and estado_id != EstadoLicitacion.EN_ANALISIS.value:
+            return []
+        today = date.today()
+        end = today + timedelta(days=5)
+        start_iso = today.isoformat()
+        end_iso = end.isoformat()
+        query_deriv = (
             self._client.table(self.TABLE_LICITACIONES)
             .select("*")
             .eq("organization_id", self._organization_id)
-            .is_("id_licitacion_padre", "null")
+            .not_.is_("id_licitacion_padre", "null")
+            .eq("id_estado", EstadoLicitacion.EN_ANALISIS.value)
+            .gte("fecha_presentacion", start_iso)
+            .lte("fecha_presentacion", end_iso)
             .order(self.PK_LICITACION, desc=True)
+            .execute()
         )
-        if estado_id is not None:
-            query_raiz = query_raiz.eq("id_estado", estado_id)
+        derivados_urgentes = list(query_deriv.data or [])
+        # Filtrar por nombre/pais si aplican
         if nombre and nombre.strip():
-            query_raiz = query_raiz.ilike("nombre", f"%{nombre.strip()}%")
+            n = nombre.strip().lower()
+            derivados_urgentes = [d for d in derivados_urgentes if n in (d.get("nombre") or "").lower()]
         if pais and pais.strip():
-            query_raiz = query_raiz.eq("pais", pais.strip())
-        response_raiz = query_raiz.execute()
-        raiz_list = list(response_raiz.data or [])
+            p = pais.strip()
+            derivados_urgentes = [d for d in derivados_urgentes if d.get("pais") == p]
 
-        # Excepción: incluir derivados (hijos AM/SDA) solo si están en análisis y presentación en ≤5 días
-        derivados_urgentes: List[Dict[str, Any]] = []
-        if estado_id is None or estado_id == EstadoLicitacion.EN_ANALISIS.value:
-            today = date.today()
-            end = today + timedelta(days=5)
-            start_iso = today.isoformat()
-            end_iso = end.isoformat()
-            query_deriv = (
-                self._client.table(self.TABLE_LICITACIONES)
-                .select("*")
-                .eq("organization_id", self._organization_id)
-                .not_.is_("id_licitacion_padre", "null")
-                .eq("id_estado", EstadoLicitacion.EN_ANALISIS.value)
-                .gte("fecha_presentacion", start_iso)
-                .lte("fecha_presentacion", end_iso)
-                .order(self.PK_LICITACION, desc=True)
-                .execute()
-            )
-            derivados_urgentes = list(query_deriv.data or [])
-            # Filtrar por nombre/pais si aplican
-            if nombre and nombre.strip():
-                n = nombre.strip().lower()
-                derivados_urgentes = [d for d in derivados_urgentes if n in (d.get("nombre") or "").lower()]
-            if pais and pais.strip():
-                p = pais.strip()
-                derivados_urgentes = [d for d in derivados_urgentes if d.get("pais") == p]
-            # Restringir a fecha realmente en ventana (por si el campo es timestamp)
-            def _date_in_window(row: Dict[str, Any]) -> bool:
-                fp = row.get("fecha_presentacion")
-                if not fp:
-                    return False
-                try:
-                    d = date.fromisoformat(str(fp).split("T")[0])
-                    return today <= d <= end
-                except (ValueError, TypeError):
-                    return False
-            derivados_urgentes = [d for d in derivados_urgentes if _date_in_window(d)]
+        # Restringir a fecha realmente en ventana (por si el campo es timestamp)
+        def _date_in_window(row: Dict[str, Any]) -> bool:
+            fp = row.get("fecha_presentacion")
+            if not fp:
+                return False
+            try:
+                d = date.fromisoformat(str(fp).split("T")[0])
+                return today <= d <= end
+            except (ValueError, TypeError):
+                return False
 
-        # Evitar duplicados por id y ordenar por id desc
-        seen = {r["id_licitacion"] for r in raiz_list}
-        extra = [d for d in derivados_urgentes if d["id_licitacion"] not in seen]
-        merged = raiz_list + extra
-        merged.sort(key=lambda x: x[self.PK_LICITACION], reverse=True)
-        return merged
+        return [d for d in derivados_urgentes if _date_in_window(d)]
 
     def get_contratos_derivados(self, id_licitacion_padre: int) -> List[Dict[str, Any]]:
         """Licitaciones hijo (CONTRATO_BASADO) cuyo id_licitacion_padre es el dado."""
@@ -242,11 +274,18 @@ class TendersRepository(BaseTenantRepository):
         response = self._client.table(self.TABLE_DETALLE).insert(payload).execute()
         if not response.data:
             raise RuntimeError("Insert partida no devolvió datos.")
-        return response.data[0]
+        partida = response.data[0]
+        if partida.get("activo", True):
+            self._price_history.mark_added([partida.get("id_producto")])
+        return partida
 
     def update_partida(self, tender_id: int, detalle_id: int, data: Dict[str, Any]) -> Dict[str, Any]:
         """Actualiza una partida; solo si pertenece a la organización."""
         payload = {k: v for k, v in data.items() if k != "organization_id"}
+        # Si cambia el producto o activo, el producto anterior puede quedarse sin histórico.
+        anterior = None
+        if "id_producto" in payload or "activo" in payload:
+            anterior = self.get_partida(tender_id, detalle_id)
         response = (
             self._client.table(self.TABLE_DETALLE)
             .update(payload)
@@ -257,7 +296,14 @@ class TendersRepository(BaseTenantRepository):
         )
         if not response.data:
             raise ValueError("Partida no encontrada.")
-        return response.data[0]
+        partida = response.data[0]
+        if anterior is not None:
+            self._price_history.mark_changed([anterior.get("id_producto")])
+            if partida.get("activo", True):
+                self._price_history.mark_added([partida.get("id_producto")])
+            else:
+                self._price_history.mark_changed([partida.get("id_producto")])
+        return partida
 
     def delete_partida(self, tender_id: int, detalle_id: int) -> None:
         """Elimina una partida; solo si pertenece a la organización."""
@@ -271,6 +317,7 @@ class TendersRepository(BaseTenantRepository):
         )
         if response.data is not None and len(response.data) == 0:
             raise ValueError("Partida no encontrada.")
+        self._price_history.mark_changed(r.get("id_producto") for r in response.data or [])
 
     def get_parent_tenders(self) -> List[Dict[str, Any]]:
         """
@@ -10,7 +10,7 @@ from typing import Any
 from fastapi import APIRouter, Depends, HTTPException, status
 
 from backend.config import supabase_client
-from backend.deps import get_current_user
+from backend.deps import get_current_user, invalidate_user_cache
 from backend.schemas.auth import CurrentUser, UserLogin, UserResponse
 from backend.roles import DEFAULT_ROLE, ROLES_VALIDOS, can_delete_user, normalize_role
 from pydantic import BaseModel, Field
@@ -204,6 +204,7 @@ def create_user(
         }).eq("id", user.id).execute()
     except Exception:
         pass
+    invalidate_user_cache(str(user.id))
 
     return {
         "id": user.id,
@@ -327,6 +328,7 @@ def update_user_role(
             status_code=status.HTTP_404_NOT_FOUND,
             detail="Usuario no encontrado o no pertenece a tu organización.",
         )
+    invalidate_user_cache(uid)
     return {"id": uid, "role": payload.role}
 
 
@@ -371,6 +373,7 @@ def update_user_password(
             status_code=status.HTTP_400_BAD_REQUEST,
             detail=f"No se pudo actualizar la contraseña: {e!s}",
         ) from e
+    invalidate_user_cache(user_id)
 
     return {"id": user_id, "message": "Contraseña actualizada correctamente."}
 
@@ -418,6 +421,7 @@ def delete_user(
         supabase_client.table("profiles").delete().eq("id", user_id).execute()
     except Exception:
         pass
+    invalidate_user_cache(user_id)
 
 
 @router.get("/me", response_model=UserResponse)
@@ -455,4 +459,5 @@ def update_my_password(
             status_code=status.HTTP_400_BAD_REQUEST,
             detail=f"No se pudo actualizar la contraseña: {e!s}",
         ) from e
+    invalidate_user_cache(current_user.user_id)
     return {"message": "Contraseña actualizada correctamente."}
\ No newline at end of file
@@ -4,15 +4,21 @@ Migrado desde src/logic/deliveries.py.
 Endpoint transaccional: cabecera + líneas; rollback si falla.
 """
 
-from typing import Any, Dict, List, Optional
+import itertools
+from datetime import date
+from typing import Any, Dict, Iterator, List, Optional, Tuple
 
-from fastapi import APIRouter, HTTPException, Query, status
+from fastapi import APIRouter, HTTPException, Query, Response, status
 
-from backend.config import supabase_client
+from backend.config import SUPABASE_IN_CHUNK_SIZE, SUPABASE_PAGE_SIZE, supabase_client
 from backend.deps import CurrentUserDep
+from backend.repositories.base_repository import BaseTenantRepository
 from backend.schemas.auth import CurrentUser
 from backend.schemas.deliveries import DeliveryCreate, DeliveryLineUpdate
 from backend.schemas.tenders import ESTADOS_PERMITEN_ENTREGAS
+from backend.services.kpi_snapshot import notify_tenders_changed
+from backend.streaming import STREAM_FORMATS_PATTERN, stream_response
+from backend.utils import chunked
 
 
 router = APIRouter(prefix="/deliveries", tags=["deliveries"])
@@ -23,54 +29,119 @@ def _org_str(user: CurrentUser) -> str:
     return str(user.org_id)
 
 
+def _parse_cursor(cursor: str) -> Tuple[Optional[str], int]:
+    """Cursor de paginación 'fecha_entrega|id_entrega' (el de X-Next-Cursor); fecha vacía = sin fecha."""
+    try:
+        fecha, id_str = cursor.rsplit("|", 1)
+        fecha = fecha.strip()
+        if fecha:
+            date.fromisoformat(fecha)
+        return fecha or None, int(id_str)
+    except (ValueError, AttributeError):
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail="Cursor inválido. Formato esperado: 'YYYY-MM-DD|id_entrega'.",
+        ) from None
+
+
+def _get_lineas_by_entrega(id_entregas: List[int], org_id: str) -> Dict[Any, List[dict]]:
+    """
+    Líneas (tbl_licitaciones_real) de varias entregas con un .in_("id_entrega", ...) troceado
+    y concurrente (BaseTenantRepository.get_in), agrupadas en memoria por id_entrega y ordenadas por id_real.
+    """
+    repo = BaseTenantRepository(supabase_client, org_id, "tbl_licitaciones_real", "id_real")
+    por_entrega: Dict[Any, List[dict]] = {}
+    for lin in repo.get_in("id_entrega", id_entregas, "*, tbl_productos(nombre), tbl_tipos_gasto(nombre)"):
+        prod = lin.get("tbl_productos") or {}
+        tipo_gasto = lin.get("tbl_tipos_gasto") or {}
+        por_entrega.setdefault(lin.get("id_entrega"), []).append({
+            **{k: v for k, v in lin.items() if k not in ("tbl_productos", "tbl_tipos_gasto")},
+            "product_nombre": prod.get("nombre") or tipo_gasto.get("nombre"),
+        })
+    for lineas in por_entrega.values():
+        lineas.sort(key=lambda lin: lin.get("id_real") or 0)
+    return por_entrega
+
+
+def _iter_deliveries(
+    org_id: str, licitacion_id: Optional[int], after: Optional[Tuple[str, int]], limit: Optional[int],
+) -> Iterator[dict]:
+    """
+    Entregas (fecha_entrega desc, id_entrega desc) con sus líneas, como generador: las entregas se
+    leen por keyset y las líneas se cargan por tandas de SUPABASE_IN_CHUNK_SIZE entregas.
+    """
+    repo = BaseTenantRepository(supabase_client, org_id, "tbl_entregas", "id_entrega")
+    eq = {"id_licitacion": licitacion_id} if licitacion_id is not None else {}
+    page_size = min(limit, SUPABASE_PAGE_SIZE) if limit is not None else None
+    entregas = repo.iter_keyset("*", "fecha_entrega", after=after, page_size=page_size, **eq)
+    if limit is not None:
+        entregas = itertools.islice(entregas, limit)
+    for tanda in chunked(entregas, SUPABASE_IN_CHUNK_SIZE):
+        id_entregas = [ent["id_entrega"] for ent in tanda if ent.get("id_entrega") is not None]
+        lineas_por_entrega = _get_lineas_by_entrega(id_entregas, org_id) if id_entregas else {}
+        for ent in tanda:
+            yield {**ent, "lineas": lineas_por_entrega.get(ent.get("id_entrega"), [])}
+
+
 @router.get("", response_model=List[dict])
 def list_deliveries(
     current_user: CurrentUserDep,
+    response: Response,
     licitacion_id: Optional[int] = Query(None, description="Filtrar por licitación."),
+    limit: Optional[int] = Query(None, ge=1, le=500, description="Máximo de entregas por página (sin límite si se omite)."),
+    cursor: Optional[str] = Query(
+        None,
+        description="Cursor 'fecha_entrega|id_entrega' devuelto en la cabecera X-Next-Cursor de la página anterior.",
+    ),
+    stream: Optional[str] = Query(
+        None,
+        pattern=STREAM_FORMATS_PATTERN,
+        description="Respuesta en streaming: 'ndjson' (una línea JSON por entrega) o 'json' (array JSON por trozos).",
+    ),
 ) -> List[dict]:
     """
     Lista entregas. Si se pasa licitacion_id, devuelve solo las de esa licitación
     con sus líneas (tbl_entregas + tbl_licitaciones_real).
 
+    Las líneas se cargan en lote (una petición por cada SUPABASE_IN_CHUNK_SIZE entregas),
+    no una por entrega. Paginación opcional por keyset (fecha_entrega desc, id_entrega desc):
+    si la página viene llena, la cabecera X-Next-Cursor trae el cursor de la siguiente.
+    Con stream las entregas se escriben según se leen (sin X-Next-Cursor: el cursor de la
+    siguiente página es la fecha e id de la última entrega recibida).
+
     GET /deliveries
     GET /deliveries?licitacion_id=1
+    GET /deliveries?licitacion_id=1&limit=50&cursor=2024-05-01|812
+    GET /deliveries?stream=ndjson
     """
     try:
-        query = (
-            supabase_client.table("tbl_entregas")
-            .select("*")
-            .eq("organization_id", _org_str(current_user))
-            .order("fecha_entrega", desc=True)
-        )
-        if licitacion_id is not None:
-            query = query.eq("id_licitacion", licitacion_id)
-        response = query.execute()
-        entregas = response.data or []
-        result: List[dict] = []
-        for ent in entregas:
-            id_e = ent.get("id_entrega")
-            lineas_resp = (
-                supabase_client.table("tbl_licitaciones_real")
-                .select("*, tbl_productos(nombre), tbl_tipos_gasto(nombre)")
-                .eq("id_entrega", id_e)
-                .eq("organization_id", _org_str(current_user))
-                .order("id_real")
-                .execute()
-            )
-            raw_lineas = lineas_resp.data or []
-            lineas: List[dict] = []
-            for lin in raw_lineas:
-                prod = lin.get("tbl_productos") or {}
-                tipo_gasto = lin.get("tbl_tipos_gasto") or {}
-                lineas.append({
-                    **{k: v for k, v in lin.items() if k not in ("tbl_productos", "tbl_tipos_gasto")},
-                    "product_nombre": prod.get("nombre") or tipo_gasto.get("nombre"),
-                })
-            result.append({
-                **ent,
-                "lineas": lineas,
-            })
+        org_s = _org_str(current_user)
+        after = _parse_cursor(cursor) if cursor else None
+        if stream:
+            return stream_response(_iter_deliveries(org_s, licitacion_id, after, limit), stream)
+        repo = BaseTenantRepository(supabase_client, org_s, "tbl_entregas", "id_entrega")
+        eq = {"id_licitacion": licitacion_id} if licitacion_id is not None else {}
+        # Mismo orden que el streaming (fecha_entrega desc con las NULL al final, id_entrega desc).
+        if limit is not None:
+            entregas = repo.get_page_after("*", "fecha_entrega", after=after, limit=limit, **eq)
+        else:
+            entregas = list(repo.iter_keyset("*", "fecha_entrega", after=after, **eq))
+
+        id_entregas = [ent["id_entrega"] for ent in entregas if ent.get("id_entrega") is not None]
+        lineas_por_entrega = _get_lineas_by_entrega(id_entregas, org_s) if id_entregas else {}
+        result: List[dict] = [
+            {**ent, "lineas": lineas_por_entrega.get(ent.get("id_entrega"), [])}
+            for ent in entregas
+        ]
+
+        if limit is not None and len(entregas) == limit:
+            last = entregas[-1]
+            fecha_last = str(last.get("fecha_entrega") or "").split("T")[0]
+            if last.get("id_entrega") is not None:
+                response.headers["X-Next-Cursor"] = f"{fecha_last}|{last['id_entrega']}"
         return result
+    except HTTPException:
+        raise
     except Exception as e:
         raise HTTPException(
             status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
@@ -102,18 +173,11 @@ def _get_presupuestado_by_detalle(licitacion_id: int, org_id: str, id_detalles:
     if not ids:
         return {}
 
-    response = (
-        supabase_client.table("tbl_licitaciones_detalle")
-        .select("id_detalle, unidades")
-        .eq("id_licitacion", licitacion_id)
-        .eq("organization_id", org_id)
-        .eq("activo", True)
-        .in_("id_detalle", ids)
-        .execute()
-    )
+    repo = BaseTenantRepository(supabase_client, org_id, "tbl_licitaciones_detalle", "id_detalle")
+    rows = repo.get_in("id_detalle", ids, "id_detalle, unidades", id_licitacion=licitacion_id, activo=True)
 
     out: Dict[int, float] = {}
-    for row in response.data or []:
+    for row in rows:
         id_det = row.get("id_detalle")
         if id_det is None:
             continue
@@ -127,17 +191,11 @@ def _get_entregado_by_detalle(licitacion_id: int, org_id: str, id_detalles: List
     if not ids:
         return {}
 
-    response = (
-        supabase_client.table("tbl_licitaciones_real")
-        .select("id_detalle, cantidad")
-        .eq("id_licitacion", licitacion_id)
-        .eq("organization_id", org_id)
-        .in_("id_detalle", ids)
-        .execute()
-    )
+    repo = BaseTenantRepository(supabase_client, org_id, "tbl_licitaciones_real", "id_real")
+    rows = repo.get_in("id_detalle", ids, "id_detalle, cantidad", id_licitacion=licitacion_id)
 
     out: Dict[int, float] = {}
-    for row in response.data or []:
+    for row in rows:
         id_det = row.get("id_detalle")
         if id_det is None:
             continue
@@ -328,6 +386,7 @@ def create_delivery(payload: DeliveryCreate, current_user: CurrentUserDep) -> di
             detail=f"Error guardando líneas; entrega cancelada: {e!s}",
         ) from e
 
+    notify_tenders_changed(_org_str(current_user), [payload.id_licitacion])
     return {
         "id_entrega": new_id_entrega,
         "message": f"Documento guardado con {len(lineas_a_insertar)} líneas.",
@@ -349,13 +408,15 @@ def update_delivery_line(id_real: int, payload: DeliveryLineUpdate, current_user
     if not updates:
         return {"id_real": id_real, "message": "Nada que actualizar."}
     try:
-        (
+        org_s = _org_str(current_user)
+        resp = (
             supabase_client.table("tbl_licitaciones_real")
             .update(updates)
             .eq("id_real", id_real)
-            .eq("organization_id", _org_str(current_user))
+            .eq("organization_id", org_s)
             .execute()
         )
+        notify_tenders_changed(org_s, {r.get("id_licitacion") for r in resp.data or []})
         return {"id_real": id_real, "message": "Línea actualizada."}
     except Exception as e:
         raise HTTPException(
@@ -372,12 +433,15 @@ def delete_delivery(delivery_id: int, current_user: CurrentUserDep) -> None:
     """
     try:
         org_s = _org_str(current_user)
-        supabase_client.table("tbl_licitaciones_real").delete().eq(
+        lineas = supabase_client.table("tbl_licitaciones_real").delete().eq(
             "id_entrega", delivery_id
         ).eq("organization_id", org_s).execute()
-        supabase_client.table("tbl_entregas").delete().eq(
+        cab = supabase_client.table("tbl_entregas").delete().eq(
             "id_entrega", delivery_id
         ).eq("organization_id", org_s).execute()
+        notify_tenders_changed(
+            org_s, {r.get("id_licitacion") for r in (lineas.data or []) + (cab.data or [])}
+        )
     except Exception as e:
         raise HTTPException(
             status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
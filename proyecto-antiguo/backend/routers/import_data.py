@@ -2,28 +2,202 @@
 Importación de Excel a tbl_licitaciones_detalle y tbl_precios_referencia.
 Basado estrictamente en src/logic/excel_import.py.
 
-- Recibe UploadFile, usa pandas (+ openpyxl para .xlsx) para leer el Excel.
+- Recibe UploadFile y lo lee por trozos (openpyxl read_only para .xlsx, pandas para .xls),
+  de modo que la memoria no depende del tamaño del fichero.
 - Aplica la misma lógica de limpieza que analizar_excel_licitacion
-  (normalización de columnas, limpieza de NaN, get_clean_number para precios).
-- Inserta los datos limpios en tbl_licitaciones_detalle o tbl_precios_referencia vía Supabase.
+  (normalización de columnas, limpieza de NaN, get_clean_number para precios),
+  vectorizada por columnas (backend.utils.clean_*_series) en lugar de fila a fila.
+- Inserta los datos limpios en tbl_licitaciones_detalle o tbl_precios_referencia vía Supabase,
+  en lotes de IMPORT_BATCH_SIZE filas; si un lote falla se borran los ya insertados.
 """
 
-import io
-from datetime import datetime
-from typing import Any, Dict, List, Optional, Tuple
+import itertools
+import logging
+from typing import Any, BinaryIO, Callable, Dict, Iterator, List, Optional, Set, Tuple
 
+import openpyxl
 import pandas as pd
-from fastapi import APIRouter, File, HTTPException, UploadFile, status
+from fastapi import APIRouter, File, HTTPException, Query, UploadFile, status
 
-from backend.config import supabase_client
+from backend.config import IMPORT_BATCH_SIZE, IMPORT_READ_CHUNK_ROWS, supabase_client
 from backend.deps import CurrentUserDep
-from backend.utils import get_clean_number, normalize_excel_columns
+from backend.repositories.base_repository import BaseTenantRepository
+from backend.repositories.price_history_repository import PriceHistoryRepository
+from backend.services.kpi_snapshot import notify_tenders_changed
+from backend.services.price_series import notify_products_changed
+from backend.utils import (
+    chunked,
+    clean_date_series,
+    clean_number_series,
+    clean_text_series,
+    normalize_excel_columns,
+)
 
-# Para .xlsx pandas usa openpyxl; asegurar que esté instalado: pip install openpyxl
+# .xlsx se lee en streaming con openpyxl (read_only); .xls con pandas: pip install openpyxl
 
 
 router = APIRouter(prefix="/import", tags=["import"])
 
+logger = logging.getLogger(__name__)
+
+# Nº de ids por petición al borrar lo insertado si un lote falla
+_ROLLBACK_IN_CHUNK = 200
+
+
+class BulkInsertError(Exception):
+    """
+    Fallo en un lote de la inserción masiva; los lotes previos se han compensado.
+    rows_not_rolled_back: ids que no se pudieron borrar en la compensación (quedan en la tabla).
+    """
+
+    def __init__(
+        self,
+        message: str,
+        batch_index: int,
+        rows_rolled_back: int,
+        rows_not_rolled_back: Optional[List[Any]] = None,
+    ) -> None:
+        self.message = message
+        self.batch_index = batch_index
+        self.rows_rolled_back = rows_rolled_back
+        self.rows_not_rolled_back = rows_not_rolled_back or []
+        super().__init__(message)
+
+
+def _mensaje_compensacion(borradas: int, pendientes: List[Any]) -> str:
+    """Texto para el usuario con el resultado de deshacer lo ya insertado."""
+    if not pendientes:
+        return f"Se han deshecho las {borradas} filas ya insertadas."
+    muestra = ", ".join(str(i) for i in pendientes[:50])
+    if len(pendientes) > 50:
+        muestra += f", ... (+{len(pendientes) - 50})"
+    return (
+        f"La compensación falló: se deshicieron {borradas} filas, pero quedan "
+        f"{len(pendientes)} filas insertadas que hay que borrar a mano (ids: {muestra})."
+    )
+
+
+class _BulkInserter:
+    """
+    Inserción masiva por lotes con compensación.
+
+    add() acumula filas y envía una petición por cada batch_size filas; flush() envía el resto.
+    on_batch(n_lote, filas_insertadas) se llama tras cada lote correcto (progreso).
+    Si un lote falla, borra las filas ya insertadas por los lotes anteriores (por pk_column)
+    y lanza BulkInsertError, de modo que la importación es todo o nada.
+    Como solo retiene un lote pendiente, sirve para alimentarlo por trozos (streaming).
+    """
+
+    def __init__(
+        self,
+        table: str,
+        pk_column: str,
+        org_id: str,
+        batch_size: int,
+        on_batch: Optional[Callable[[int, int], None]] = None,
+    ) -> None:
+        self._table = table
+        self._pk_column = pk_column
+        self._org_id = org_id
+        self._batch_size = batch_size
+        self._on_batch = on_batch
+        self._pending: List[Dict[str, Any]] = []
+        self.inserted_ids: List[Any] = []
+        self.rows_inserted = 0
+        self.batches = 0
+
+    def add(self, rows: List[Dict[str, Any]]) -> None:
+        self._pending.extend(rows)
+        while len(self._pending) >= self._batch_size:
+            batch = self._pending[: self._batch_size]
+            del self._pending[: self._batch_size]
+            self._send(batch)
+
+    def flush(self) -> None:
+        if self._pending:
+            batch, self._pending = self._pending, []
+            self._send(batch)
+
+    def rollback(self) -> Tuple[int, List[Any]]:
+        """
+        Deshace lo insertado hasta ahora (p. ej. si falla la lectura del Excel a mitad).
+        Devuelve (filas borradas, ids que no se pudieron borrar).
+        """
+        self._pending = []
+        borradas, pendientes = _compensar_insercion(self._table, self._pk_column, self._org_id, self.inserted_ids)
+        self.inserted_ids = []
+        self.rows_inserted = 0
+        return borradas, pendientes
+
+    def _send(self, batch: List[Dict[str, Any]]) -> None:
+        n_lote = self.batches + 1
+        try:
+            resp = supabase_client.table(self._table).insert(batch).execute()
+        except Exception as e:
+            rolled_back, pendientes = self.rollback()
+            logger.warning(
+                "Importación en %s: lote %d falló; compensadas %d filas, sin compensar %d. Error: %s",
+                self._table, n_lote, rolled_back, len(pendientes), e,
+            )
+            raise BulkInsertError(
+                f"Error en el lote {n_lote} ({len(batch)} filas): {e!s}. "
+                + _mensaje_compensacion(rolled_back, pendientes),
+                batch_index=n_lote,
+                rows_rolled_back=rolled_back,
+                rows_not_rolled_back=pendientes,
+            ) from e
+        self.batches = n_lote
+        self.rows_inserted += len(batch)
+        self.inserted_ids.extend(
+            r[self._pk_column] for r in (resp.data or []) if r.get(self._pk_column) is not None
+        )
+        logger.info("Importación en %s: lote %d OK (%d filas)", self._table, n_lote, self.rows_inserted)
+        if self._on_batch is not None:
+            self._on_batch(n_lote, self.rows_inserted)
+
+
+def _insert_en_lotes(
+    table: str,
+    rows: List[Dict[str, Any]],
+    pk_column: str,
+    org_id: str,
+    batch_size: int,
+    on_batch: Optional[Callable[[int, int], None]] = None,
+) -> List[Any]:
+    """Inserta rows en lotes de batch_size (todo o nada). Devuelve las claves primarias insertadas."""
+    inserter = _BulkInserter(table, pk_column, org_id, batch_size, on_batch)
+    inserter.add(rows)
+    inserter.flush()
+    return inserter.inserted_ids
+
+
+def _compensar_insercion(
+    table: str, pk_column: str, org_id: str, ids: List[Any],
+) -> Tuple[int, List[Any]]:
+    """
+    Borra (org-scoped) las filas insertadas antes del fallo.
+    Devuelve (filas borradas de verdad, ids que siguen en la tabla porque su borrado falló).
+    """
+    borradas = 0
+    pendientes: List[Any] = []
+    for ids_chunk in chunked(ids, _ROLLBACK_IN_CHUNK):
+        try:
+            resp = (
+                supabase_client.table(table)
+                .delete()
+                .eq("organization_id", org_id)
+                .in_(pk_column, ids_chunk)
+                .execute()
+            )
+        except Exception as e:
+            logger.error("No se pudieron borrar %d filas de %s tras el fallo: %s", len(ids_chunk), table, e)
+            pendientes.extend(ids_chunk)
+            continue
+        borradas += len(resp.data or [])
+    if pendientes:
+        logger.error("Compensación incompleta en %s: quedan los ids %s", table, pendientes)
+    return borradas, pendientes
+
 
 def _find_column(cols: List[str], alternatives: List[str]) -> Optional[str]:
     """Devuelve la primera columna que coincida (case-insensitive) con alguna alternativa."""
@@ -51,157 +225,268 @@ def _find_column_fuzzy(
     return None
 
 
-def _analizar_excel_albaranes(file_content: bytes) -> Tuple[bool, Any]:
+def _dedup_cabecera(header: List[Any]) -> List[Any]:
     """
-    Lee Excel de albaranes de compra (formato típico: Fecha, Nº Albarán, Ref. Artículo, Artículo, Cantidad, Precio).
-    Retorna (True, DataFrame con columnas normalizadas) o (False, str error).
+    Renombra las cabeceras repetidas como pd.read_excel: "X", "X.1", "X.2"... saltando los sufijos
+    que ya son otra cabecera del Excel, para que .xlsx y .xls den las mismas columnas.
     """
-    try:
-        buf = io.BytesIO(file_content)
-        try:
-            df = pd.read_excel(buf, engine="openpyxl")
-        except ValueError:
-            df = pd.read_excel(io.BytesIO(file_content))
+    out = list(header)
+    vistos: Dict[Any, int] = {}
+    for i, col in enumerate(header):
+        n = vistos.get(col, 0)
+        nuevo = col
+        while n > 0:
+            vistos[col] = n + 1
+            nuevo = f"{col}.{n}"
+            n = n + 1 if nuevo in header else vistos.get(nuevo, 0)
+        out[i] = nuevo
+        vistos[nuevo] = n + 1
+    return out
+
+
+def _iter_excel_chunks(fileobj: BinaryIO, filename: str, chunk_rows: int) -> Iterator[pd.DataFrame]:
+    """
+    Lee el Excel por trozos de chunk_rows filas (DataFrames con columnas normalizadas).
+
+    .xlsx: openpyxl en modo read_only (como importar_albaranes.py), sin cargar el libro
+    entero en memoria; la primera fila es la cabecera, igual que pd.read_excel.
+    .xls: openpyxl no lo soporta; se lee con pandas y se trocea.
+    Siempre produce al menos un DataFrame (vacío si solo hay cabecera) para poder validar columnas.
+    """
+    if filename.lower().endswith(".xls"):
+        df = pd.read_excel(fileobj)
         df.columns = normalize_excel_columns(df.columns)
-        cols = list(df.columns)
-
-        col_articulo = _find_column(cols, ["Artículo", "Articulo", "Artculo", "Producto", "Planta"])
-        if not col_articulo:
-            # Artículo = nombre producto; excluir "ref" para no coger "Ref. Artículo"
-            col_articulo = _find_column_fuzzy(cols, ["art", "culo"], exclude_substr="ref")
-        col_ref = _find_column(cols, ["Ref. Artículo", "Ref. Articulo", "Ref Articulo", "Referencia", "Ref"])
-        if not col_ref:
-            col_ref = _find_column_fuzzy(cols, ["ref", "art"])  # Ref. Artículo
-        col_cantidad = _find_column(cols, ["Cantidad", "Unidades", "N.º Unidades", "N Unidades"])
-        col_precio = _find_column(cols, ["Precio", "PCU", "Precio coste unitario", "Precio Coste"])
-        col_fecha = _find_column(cols, ["Fecha", "Fecha Albarán", "Fecha presupuesto"])
-        col_albaran = _find_column(cols, ["Nº Albarán", "N Albarán", "N. Albarán", "Albarán", "N Albaran"])
-        if not col_albaran:
-            col_albaran = _find_column_fuzzy(cols, ["albar"])
-
-        if not col_articulo and not col_ref:
-            return False, "Se requiere la columna 'Artículo' o 'Ref. Artículo' (o 'Producto'/'Referencia')."
-
-        if not col_precio:
-            return False, "Se requiere la columna 'Precio'."
-
-        data_clean: List[dict[str, Any]] = []
-
-        for _idx, row in df.iterrows():
-            art = str(row.get(col_articulo or "", "")).strip() if col_articulo else ""
-            ref = str(row.get(col_ref or "", "")).strip() if col_ref else ""
-            if (not art or art.lower() == "nan") and (not ref or ref.lower() == "nan"):
-                continue
+        if df.empty:
+            yield df
+        for start in range(0, len(df), chunk_rows):
+            yield df.iloc[start : start + chunk_rows]
+        return
 
-            precio_val = get_clean_number(row, col_precio, cols) if col_precio else 0.0
-            if precio_val <= 0:
+    wb = openpyxl.load_workbook(fileobj, read_only=True, data_only=True)
+    try:
+        rows = wb.active.iter_rows(values_only=True)
+        header = next(rows, None)
+        if header is None:
+            return
+        columns = normalize_excel_columns(
+            _dedup_cabecera([c if c is not None else f"Unnamed: {i}" for i, c in enumerate(header)])
+        )
+        width = len(columns)
+        buf: List[tuple] = []
+        yielded = False
+        for row in rows:
+            if all(v is None for v in row):
                 continue
+            row = tuple(row[:width]) + (None,) * (width - len(row))
+            buf.append(row)
+            if len(buf) >= chunk_rows:
+                yield pd.DataFrame(buf, columns=columns)
+                buf = []
+                yielded = True
+        if buf or not yielded:
+            yield pd.DataFrame(buf, columns=columns)
+    finally:
+        wb.close()
+
+
+def _num_col(df: pd.DataFrame, col: Optional[str]) -> pd.Series:
+    """Columna numérica limpia (get_clean_number vectorizado); 0.0 si la columna no existe."""
+    if col and col in df.columns:
+        return clean_number_series(df[col])
+    return pd.Series(0.0, index=df.index)
+
+
+def _text_col(df: pd.DataFrame, col: Optional[str]) -> pd.Series:
+    """Columna de texto limpia; cadena vacía si la columna no existe."""
+    if col and col in df.columns:
+        return clean_text_series(df[col])
+    return pd.Series("", index=df.index, dtype=object)
+
+
+def _none_col(df: pd.DataFrame) -> pd.Series:
+    """Columna de None (no NaN) para que to_dict('records') devuelva None."""
+    return pd.Series([None] * len(df), index=df.index, dtype=object)
+
+
+def _empty_to_none(series: pd.Series) -> pd.Series:
+    """'' -> None (columnas de objetos para que to_dict('records') devuelva None)."""
+    obj = series.astype(object)
+    return obj.where(obj != "", None)
+
 
-            cantidad_val = get_clean_number(row, col_cantidad, cols) if col_cantidad else None
-            if cantidad_val == 0.0:
-                cantidad_val = None
-
-            fecha_val = None
-            if col_fecha:
-                v = row.get(col_fecha)
-                if pd.notna(v) and v:
-                    try:
-                        if isinstance(v, datetime):
-                            fecha_val = v.strftime("%Y-%m-%d")
-                        elif isinstance(v, str) and len(v) >= 10:
-                            fecha_val = v[:10]
-                        else:
-                            fecha_val = str(v)[:10]
-                    except Exception:
-                        pass
-
-            albaran_val = str(row.get(col_albaran or "", "")).strip() if col_albaran else None
-            if albaran_val and albaran_val.lower() == "nan":
-                albaran_val = None
-
-            data_clean.append({
-                "articulo": art or None,
-                "ref_articulo": ref or None,
-                "cantidad": cantidad_val,
-                "precio": precio_val,
-                "fecha": fecha_val,
-                "albaran": albaran_val,
-            })
-
-        if not data_clean:
+def _detectar_columnas_albaranes(cols: List[str]) -> Tuple[bool, Any]:
+    """
+    Localiza las columnas del Excel de albaranes.
+    Retorna (True, dict de columnas) o (False, str error).
+    """
+    col_articulo = _find_column(cols, ["Artículo", "Articulo", "Artculo", "Producto", "Planta"])
+    if not col_articulo:
+        # Artículo = nombre producto; excluir "ref" para no coger "Ref. Artículo"
+        col_articulo = _find_column_fuzzy(cols, ["art", "culo"], exclude_substr="ref")
+    col_ref = _find_column(cols, ["Ref. Artículo", "Ref. Articulo", "Ref Articulo", "Referencia", "Ref"])
+    if not col_ref:
+        col_ref = _find_column_fuzzy(cols, ["ref", "art"])  # Ref. Artículo
+    col_cantidad = _find_column(cols, ["Cantidad", "Unidades", "N.º Unidades", "N Unidades"])
+    col_precio = _find_column(cols, ["Precio", "PCU", "Precio coste unitario", "Precio Coste"])
+    col_fecha = _find_column(cols, ["Fecha", "Fecha Albarán", "Fecha presupuesto"])
+    col_albaran = _find_column(cols, ["Nº Albarán", "N Albarán", "N. Albarán", "Albarán", "N Albaran"])
+    if not col_albaran:
+        col_albaran = _find_column_fuzzy(cols, ["albar"])
+
+    if not col_articulo and not col_ref:
+        return False, "Se requiere la columna 'Artículo' o 'Ref. Artículo' (o 'Producto'/'Referencia')."
+
+    if not col_precio:
+        return False, "Se requiere la columna 'Precio'."
+
+    return True, {
+        "articulo": col_articulo,
+        "ref": col_ref,
+        "cantidad": col_cantidad,
+        "precio": col_precio,
+        "fecha": col_fecha,
+        "albaran": col_albaran,
+    }
+
+
+def _limpiar_df_albaranes(df: pd.DataFrame, columnas: Dict[str, Optional[str]]) -> pd.DataFrame:
+    """
+    Limpieza vectorizada (columna a columna) de un DataFrame de albaranes.
+    Descarta filas sin artículo/referencia o con precio <= 0.
+    """
+    art = _text_col(df, columnas["articulo"])
+    ref = _text_col(df, columnas["ref"])
+    precio = _num_col(df, columnas["precio"])
+    valida = ((art != "") | (ref != "")) & (precio > 0)
+
+    if columnas["cantidad"]:
+        cantidad = _num_col(df, columnas["cantidad"]).astype(object)
+        cantidad = cantidad.where(cantidad != 0.0, None)
+    else:
+        cantidad = _none_col(df)
+
+    if columnas["fecha"]:
+        fecha = clean_date_series(df[columnas["fecha"]])
+    else:
+        fecha = _none_col(df)
+
+    if columnas["albaran"]:
+        albaran = _empty_to_none(_text_col(df, columnas["albaran"]))
+    else:
+        albaran = _none_col(df)
+
+    out = pd.DataFrame({
+        "articulo": _empty_to_none(art),
+        "ref_articulo": _empty_to_none(ref),
+        "cantidad": cantidad,
+        "precio": precio,
+        "fecha": fecha,
+        "albaran": albaran,
+    })
+    return out[valida].reset_index(drop=True)
+
+
+def _analizar_excel_albaranes(fileobj: BinaryIO, filename: str, chunk_rows: int) -> Tuple[bool, Any]:
+    """
+    Lee Excel de albaranes de compra (formato típico: Fecha, Nº Albarán, Ref. Artículo, Artículo, Cantidad, Precio).
+    Retorna (True, generador de DataFrames limpios por trozos) o (False, str error).
+    Las columnas se validan con la cabecera; los errores de lectura posteriores se propagan al iterar.
+    """
+    try:
+        chunks = _iter_excel_chunks(fileobj, filename, chunk_rows)
+        first = next(chunks, None)
+        if first is None:
             return False, "El Excel no contiene líneas válidas (producto + precio > 0)."
-        return True, pd.DataFrame(data_clean)
+        ok, columnas = _detectar_columnas_albaranes(list(first.columns))
+        if not ok:
+            return False, columnas
     except Exception as e:
         return False, f"Error leyendo archivo: {e!s}"
 
+    def _limpios() -> Iterator[pd.DataFrame]:
+        for chunk in itertools.chain([first], chunks):
+            limpio = _limpiar_df_albaranes(chunk, columnas)
+            if not limpio.empty:
+                yield limpio
+
+    return True, _limpios()
+
+
+def _detectar_columnas_licitacion(cols: List[str]) -> Tuple[bool, Any]:
+    """
+    Localiza las columnas de producto y lote del Excel de presupuesto.
+    Retorna (True, dict de columnas) o (False, str error).
+    """
+    col_prod = "Planta"
+    if col_prod not in cols and "Producto" in cols:
+        col_prod = "Producto"
+    if col_prod not in cols:
+        return False, "No se encuentra la columna 'Producto' o 'Planta' en el Excel."
+
+    col_lote = None
+    for cand in ["Lote", "lote", "Zona", "zona", "Grupo"]:
+        if cand in cols:
+            col_lote = cand
+            break
+    return True, {"producto": col_prod, "lote": col_lote}
+
+
+def _limpiar_df_licitacion(df: pd.DataFrame, columnas: Dict[str, Optional[str]], tipo_id: int) -> pd.DataFrame:
+    """
+    Limpieza vectorizada de un DataFrame de presupuesto (partidas).
+    Descarta filas sin producto; lote vacío -> "General".
+    """
+    prod = _text_col(df, columnas["producto"])
+    lote = _text_col(df, columnas["lote"])
+    lote = lote.mask(lote == "", "General")
+
+    if tipo_id == 2:
+        uds = _none_col(df)
+    else:
+        uds = _num_col(df, "N.º Unidades previstas")
+
+    out = pd.DataFrame({
+        "lote": lote,
+        "producto": prod,
+        "unidades": uds,
+        "pvu": _num_col(df, "Precio Venta Unitario"),
+        "pcu": _num_col(df, "Precio coste unitario"),
+        "pmaxu": _num_col(df, "Precio Máximo"),
+        "activo": True,
+    })
+    return out[prod != ""].reset_index(drop=True)
+
 
 def _analizar_excel_licitacion(
-    file_content: bytes,
+    fileobj: BinaryIO,
+    filename: str,
     tipo_id: int,
+    chunk_rows: int,
 ) -> Tuple[bool, Any]:
     """
     Lógica migrada de src/logic/excel_import.py::analizar_excel_licitacion.
-    Lee el Excel, normaliza columnas, aplica get_clean_number a precios/unidades.
-    Retorna (True, DataFrame) o (False, str error).
+    Lee el Excel por trozos, normaliza columnas, aplica get_clean_number (vectorizado) a precios/unidades.
+    Retorna (True, generador de DataFrames limpios por trozos) o (False, str error).
     """
     try:
-        buf = io.BytesIO(file_content)
-        try:
-            df = pd.read_excel(buf, engine="openpyxl")
-        except ValueError:
-            df = pd.read_excel(io.BytesIO(file_content))
-        df.columns = normalize_excel_columns(df.columns)
-
-        col_prod = "Planta"
-        if col_prod not in df.columns and "Producto" in df.columns:
-            col_prod = "Producto"
-        if col_prod not in df.columns:
-            return False, "No se encuentra la columna 'Producto' o 'Planta' en el Excel."
-
-        col_lote = None
-        for cand in ["Lote", "lote", "Zona", "zona", "Grupo"]:
-            if cand in df.columns:
-                col_lote = cand
-                break
-
-        data_clean: List[dict[str, Any]] = []
-        columns_list = list(df.columns)
-
-        for _index, row in df.iterrows():
-            prod = str(row[col_prod]).strip()
-            if not prod or prod.lower() == "nan":
-                continue
-            val_lote = "General"
-            if col_lote:
-                raw_lote = str(row[col_lote]).strip()
-                if raw_lote and raw_lote.lower() != "nan":
-                    val_lote = raw_lote
-
-            uds = (
-                None
-                if tipo_id == 2
-                else get_clean_number(row, "N.º Unidades previstas", columns_list)
-            )
-            p_max = get_clean_number(row, "Precio Máximo", columns_list)
-            pvu = get_clean_number(row, "Precio Venta Unitario", columns_list)
-            pcu = get_clean_number(row, "Precio coste unitario", columns_list)
-
-            data_clean.append({
-                "lote": val_lote,
-                "producto": prod,
-                "unidades": uds,
-                "pvu": pvu,
-                "pcu": pcu,
-                "pmaxu": p_max,
-                "activo": True,
-            })
-
-        if not data_clean:
+        chunks = _iter_excel_chunks(fileobj, filename, chunk_rows)
+        first = next(chunks, None)
+        if first is None:
             return False, "El Excel parece estar vacío o no tiene líneas válidas."
-        return True, pd.DataFrame(data_clean)
+        ok, columnas = _detectar_columnas_licitacion(list(first.columns))
+        if not ok:
+            return False, columnas
     except Exception as e:
         return False, f"Error leyendo archivo: {e!s}"
 
+    def _limpios() -> Iterator[pd.DataFrame]:
+        for chunk in itertools.chain([first], chunks):
+            limpio = _limpiar_df_licitacion(chunk, columnas, tipo_id)
+            if not limpio.empty:
+                yield limpio
+
+    return True, _limpios()
+
 
 @router.post("/excel/{licitacion_id}", status_code=status.HTTP_201_CREATED)
 def import_excel(
@@ -209,13 +494,15 @@ def import_excel(
     current_user: CurrentUserDep,
     file: UploadFile = File(...),
     tipo_id: int = 1,
+    batch_size: int = Query(IMPORT_BATCH_SIZE, ge=1, le=5000, description="Partidas por petición de inserción."),
 ) -> dict:
     """
     POST /import/excel/{licitacion_id}
 
     - Recibe un archivo Excel (UploadFile).
-    - Usa Pandas para leerlo y aplica la misma limpieza que analizar_excel_licitacion.
-    - Inserta las partidas en tbl_licitaciones_detalle.
+    - Lo lee por trozos de IMPORT_READ_CHUNK_ROWS filas y aplica la misma limpieza que analizar_excel_licitacion.
+    - Inserta las partidas en tbl_licitaciones_detalle en lotes de batch_size.
+      Si un lote falla se borran las partidas ya insertadas (la licitación no queda a medias).
 
     tipo_id: 1 = desglose con unidades, 2 = alzado (unidades omitidas).
     """
@@ -225,15 +512,15 @@ def import_excel(
             detail="Se requiere un archivo Excel (.xlsx o .xls).",
         )
 
-    content = file.file.read()
-    ok, result = _analizar_excel_licitacion(content, tipo_id)
+    # file.file es un SpooledTemporaryFile: se lee por trozos sin volcarlo entero a memoria.
+    ok, result = _analizar_excel_licitacion(file.file, file.filename, tipo_id, IMPORT_READ_CHUNK_ROWS)
     if not ok:
         raise HTTPException(
             status_code=status.HTTP_400_BAD_REQUEST,
             detail=str(result),
         )
 
-    df: pd.DataFrame = result
+    chunks: Iterator[pd.DataFrame] = result
     # Verificar licitación pertenece a la org del usuario
     lic_resp = (
         supabase_client.table("tbl_licitaciones")
@@ -248,59 +535,88 @@ def import_excel(
             detail="Licitación no encontrada o no pertenece a tu organización.",
         )
     org_id = str(current_user.org_id)
-    records = df.to_dict("records")
-    count = 0
+    progreso: List[dict] = []
+    inserter = _BulkInserter(
+        "tbl_licitaciones_detalle",
+        pk_column="id_detalle",
+        org_id=org_id,
+        batch_size=batch_size,
+        on_batch=lambda n, done: progreso.append({"lote": n, "filas": done}),
+    )
     try:
-        for row in records:
-            supabase_client.table("tbl_licitaciones_detalle").insert({
-                "id_licitacion": licitacion_id,
-                "organization_id": org_id,
-                "lote": row["lote"],
-                "producto": row["producto"],
-                "unidades": row["unidades"],
-                "pvu": row["pvu"],
-                "pcu": row["pcu"],
-                "pmaxu": row["pmaxu"],
-                "activo": row["activo"],
-            }).execute()
-            count += 1
-    except Exception as e:
+        for df in chunks:
+            inserter.add([
+                {
+                    "id_licitacion": licitacion_id,
+                    "organization_id": org_id,
+                    "lote": row["lote"],
+                    "producto": row["producto"],
+                    "unidades": row["unidades"],
+                    "pvu": row["pvu"],
+                    "pcu": row["pcu"],
+                    "pmaxu": row["pmaxu"],
+                    "activo": row["activo"],
+                }
+                for row in df.to_dict("records")
+            ])
+        inserter.flush()
+    except BulkInsertError as e:
         raise HTTPException(
             status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
-            detail=f"Error guardando en BD: {e!s}",
+            detail=f"Error guardando en BD: {e.message}",
         ) from e
+    except Exception as e:
+        # Fallo leyendo el Excel a mitad: no dejar la licitación con la mitad de las partidas.
+        borradas, pendientes = inserter.rollback()
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail=f"Error leyendo archivo: {e!s}"
+            + (f". {_mensaje_compensacion(borradas, pendientes)}" if pendientes else ""),
+        ) from e
+    count = inserter.rows_inserted
+    if count == 0:
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail="El Excel parece estar vacío o no tiene líneas válidas.",
+        )
+    notify_tenders_changed(org_id, [licitacion_id])
 
     return {
         "message": f"Se han importado correctamente {count} partidas.",
         "licitacion_id": licitacion_id,
         "rows_imported": count,
+        "batches": inserter.batches,
+        "progress": progreso,
     }
 
 
-def _build_producto_maps(org_id: str) -> Tuple[Dict[str, int], Dict[str, int]]:
+def _build_producto_maps(
+    org_id: str,
+) -> Tuple[Dict[str, Tuple[int, str]], Dict[str, Tuple[int, str]]]:
     """
-    Carga productos y devuelve mapas: referencia -> id_producto, nombre -> id_producto.
+    Carga el catálogo de la organización (lectura paginada, sin el tope de 1000 filas de
+    PostgREST) y devuelve mapas en memoria:
+    referencia -> (id_producto, nombre), nombre -> (id_producto, nombre).
     Prioridad: referencia (exacto), luego nombre (strip, case-insensitive para búsqueda).
+    Llevar el nombre evita volver a consultar tbl_productos por cada fila importada.
     """
-    resp = (
-        supabase_client.table("tbl_productos")
-        .select("id, nombre, referencia")
-        .eq("organization_id", org_id)
-        .execute()
-    )
-    ref_map: Dict[str, int] = {}
-    nom_map: Dict[str, int] = {}
-    for r in (resp.data or []):
+    repo = BaseTenantRepository(supabase_client, org_id, "tbl_productos", "id")
+    ref_map: Dict[str, Tuple[int, str]] = {}
+    nom_map: Dict[str, Tuple[int, str]] = {}
+    for r in repo.iter_all("id, nombre, referencia", parallel=True):
         pid = int(r["id"]) if r.get("id") is not None else None
         if not pid:
             continue
+        nom = (r.get("nombre") or "").strip()
+        if str(nom).lower() == "null":
+            nom = ""
+        entry = (pid, nom)
         ref = (r.get("referencia") or "").strip()
         if ref:
-            ref_map[ref] = pid
-        nom = (r.get("nombre") or "").strip()
-        if nom and str(nom).lower() != "null":
-            nom_map[nom] = pid
-            nom_map[nom.lower()] = pid  # búsqueda case-insensitive
+            ref_map[ref] = entry
+        if nom:
+            nom_map[nom] = entry
+            nom_map[nom.lower()] = entry  # búsqueda case-insensitive
     return ref_map, nom_map
 
 
@@ -308,15 +624,17 @@ def _build_producto_maps(org_id: str) -> Tuple[Dict[str, int], Dict[str, int]]:
 def import_precios_referencia(
     current_user: CurrentUserDep,
     file: UploadFile = File(...),
+    batch_size: int = Query(IMPORT_BATCH_SIZE, ge=1, le=5000, description="Líneas por petición de inserción."),
 ) -> dict:
     """
     POST /import/precios-referencia
 
     Importa albaranes de compra (Excel) como líneas de precios de referencia.
     Formato esperado: Fecha, Nº Albarán, Ref. Artículo, Artículo, Cantidad, Precio.
-    - Se busca id_producto por "Ref. Artículo" (referencia) o "Artículo" (nombre).
+    - Se busca id_producto por "Ref. Artículo" (referencia) o "Artículo" (nombre), en memoria.
     - PCU = Precio; Unidades = Cantidad; fecha_presupuesto = Fecha; proveedor/notas = Nº Albarán.
     - Las filas sin producto coincidente se omiten y se reportan.
+    - Las líneas se insertan en lotes de batch_size; si un lote falla se deshace la importación.
     """
     if not file.filename or not file.filename.lower().endswith((".xlsx", ".xls")):
         raise HTTPException(
@@ -324,79 +642,83 @@ def import_precios_referencia(
             detail="Se requiere un archivo Excel (.xlsx o .xls).",
         )
 
-    content = file.file.read()
-    ok, result = _analizar_excel_albaranes(content)
+    ok, result = _analizar_excel_albaranes(file.file, file.filename, IMPORT_READ_CHUNK_ROWS)
     if not ok:
         raise HTTPException(
             status_code=status.HTTP_400_BAD_REQUEST,
             detail=str(result),
         )
 
-    df: pd.DataFrame = result
+    chunks: Iterator[pd.DataFrame] = result
     org_s = str(current_user.org_id)
-    ref_map, nom_map = _build_producto_maps(org_s)
-    records = df.to_dict("records")
+    try:
+        ref_map, nom_map = _build_producto_maps(org_s)
+    except Exception as e:
+        raise HTTPException(
+            status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
+            detail=f"Error cargando productos: {e!s}",
+        ) from e
 
-    count = 0
     skipped: List[dict] = []
+    productos_importados: Set[int] = set()
+    inserter = _BulkInserter("tbl_precios_referencia", pk_column="id", org_id=org_s, batch_size=batch_size)
 
     try:
-        for row in records:
-            id_producto = None
-            ref_val = (row.get("ref_articulo") or "").strip()
-            art_val = (row.get("articulo") or "").strip()
-
-            if ref_val and ref_val in ref_map:
-                id_producto = ref_map[ref_val]
-            elif art_val:
-                id_producto = nom_map.get(art_val) or nom_map.get(art_val.lower())
-
-            if not id_producto:
-                skipped.append({
-                    "articulo": art_val or ref_val or "—",
-                    "precio": row.get("precio"),
+        for df in chunks:
+            insert_rows: List[Dict[str, Any]] = []
+            for row in df.to_dict("records"):
+                ref_val = (row.get("ref_articulo") or "").strip()
+                art_val = (row.get("articulo") or "").strip()
+
+                producto = None
+                if ref_val and ref_val in ref_map:
+                    producto = ref_map[ref_val]
+                elif art_val:
+                    producto = nom_map.get(art_val) or nom_map.get(art_val.lower())
+
+                if not producto:
+                    skipped.append({
+                        "articulo": art_val or ref_val or "—",
+                        "precio": row.get("precio"),
+                    })
+                    continue
+
+                id_producto, product_nombre = producto
+                productos_importados.add(int(id_producto))
+                insert_rows.append({
+                    "id_producto": id_producto,
+                    "producto": product_nombre,
+                    "organization_id": org_s,
+                    "pvu": None,
+                    "pcu": float(row.get("precio", 0)),
+                    "unidades": row.get("cantidad"),
+                    "proveedor": (row.get("albaran") or "").strip() or None,
+                    "notas": None,
+                    "fecha_presupuesto": (row.get("fecha") or "").strip() or None,
                 })
-                continue
-
-            prod_resp = (
-                supabase_client.table("tbl_productos")
-                .select("nombre, organization_id")
-                .eq("id", id_producto)
-                .eq("organization_id", org_s)
-                .limit(1)
-                .execute()
-            )
-            product_nombre = ""
-            org_id = None
-            if prod_resp.data and len(prod_resp.data) > 0:
-                p0 = prod_resp.data[0]
-                product_nombre = (p0.get("nombre") or "").strip()
-                org_id = p0.get("organization_id")
-
-            if not org_id:
-                skipped.append({"articulo": art_val or ref_val or "—", "precio": row.get("precio")})
-                continue
-
-            insert_row = {
-                "id_producto": id_producto,
-                "producto": product_nombre or "",
-                "organization_id": org_id,
-                "pvu": None,
-                "pcu": float(row.get("precio", 0)),
-                "unidades": row.get("cantidad"),
-                "proveedor": (row.get("albaran") or "").strip() or None,
-                "notas": None,
-                "fecha_presupuesto": (row.get("fecha") or "").strip() or None,
-            }
-
-            supabase_client.table("tbl_precios_referencia").insert(insert_row).execute()
-            count += 1
-
-    except Exception as e:
+            inserter.add(insert_rows)
+        inserter.flush()
+    except BulkInsertError as e:
         raise HTTPException(
             status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
-            detail=f"Error guardando en BD: {e!s}",
+            detail=f"Error guardando en BD: {e.message}",
         ) from e
+    except Exception as e:
+        borradas, pendientes = inserter.rollback()
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail=f"Error leyendo archivo: {e!s}"
+            + (f". {_mensaje_compensacion(borradas, pendientes)}" if pendientes else ""),
+        ) from e
+
+    count = inserter.rows_inserted
+    if count == 0 and not skipped:
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail="El Excel no contiene líneas válidas (producto + precio > 0).",
+        )
+    notify_products_changed(org_s, productos_importados)
+    PriceHistoryRepository(supabase_client, org_s).mark_added(productos_importados)
 
     return {
         "message": f"Se han importado {count} líneas de precios de referencia."
@@ -4,48 +4,158 @@ Líneas de producto con precios que no pertenecen a ninguna licitación.
 Aparecen en el buscador histórico junto a las partidas de licitaciones.
 """
 
-from typing import List
+import itertools
+from datetime import date
+from typing import Any, Callable, Dict, List, Optional, Tuple
 
-from fastapi import APIRouter, HTTPException, status
+from fastapi import APIRouter, HTTPException, Query, Response, status
+from fastapi.responses import StreamingResponse
 
-from backend.config import supabase_client
+from backend.config import SUPABASE_PAGE_SIZE, supabase_client
 from backend.deps import CurrentUserDep
+from backend.repositories.base_repository import BaseTenantRepository
+from backend.repositories.price_history_repository import PriceHistoryRepository
+from backend.schemas.auth import CurrentUser
 from backend.schemas.products import PrecioReferencia, PrecioReferenciaCreate
+from backend.services.price_series import notify_products_changed
+from backend.services.price_stats import notify_reference_prices
+from backend.streaming import STREAM_FORMATS_PATTERN, stream_response
 
 
 router = APIRouter(prefix="/precios-referencia", tags=["precios-referencia"])
 
 
+_SELECT = "id, id_producto, pvu, pcu, unidades, proveedor, notas, fecha_presupuesto, tbl_productos(nombre)"
+
+
+def _precio_dict(r: Dict[str, Any]) -> Dict[str, Any]:
+    """Fila de tbl_precios_referencia (con el join de tbl_productos) con la forma de PrecioReferencia."""
+    return {
+        "id": str(r["id"]),
+        "id_producto": int(r["id_producto"]),
+        "product_nombre": (r.get("tbl_productos") or {}).get("nombre"),
+        "pvu": float(r["pvu"]) if r.get("pvu") is not None else None,
+        "pcu": float(r["pcu"]) if r.get("pcu") is not None else None,
+        "unidades": float(r["unidades"]) if r.get("unidades") is not None else None,
+        "proveedor": r.get("proveedor"),
+        "notas": r.get("notas"),
+        "fecha_presupuesto": r.get("fecha_presupuesto"),
+    }
+
+
+def _parse_cursor(cursor: str) -> Tuple[Optional[str], str]:
+    """Cursor de paginación 'fecha_presupuesto|id' (el de X-Next-Cursor); fecha vacía = sin fecha."""
+    try:
+        fecha, id_str = cursor.rsplit("|", 1)
+        fecha = fecha.strip()
+        if fecha:
+            date.fromisoformat(fecha)
+        if not id_str.strip():
+            raise ValueError(cursor)
+        return fecha or None, id_str.strip()
+    except (ValueError, AttributeError):
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail="Cursor inválido. Formato esperado: 'YYYY-MM-DD|id'.",
+        ) from None
+
+
+def _filtro(
+    proveedor: Optional[str], desde: Optional[str], hasta: Optional[str],
+) -> Optional[Callable[[Any], Any]]:
+    """query_filter con proveedor (contiene, sin distinguir mayúsculas) y la ventana de fechas; 400 si no es válida."""
+    try:
+        d = date.fromisoformat(desde) if desde else None
+        h = date.fromisoformat(hasta) if hasta else None
+    except ValueError as e:
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail=f"Fecha no válida (formato YYYY-MM-DD): {e!s}",
+        ) from e
+    if d and h and d > h:
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail="'desde' no puede ser posterior a 'hasta'.",
+        )
+    texto = (proveedor or "").strip()
+    if not (texto or d or h):
+        return None
+
+    def _aplicar(query):
+        if texto:
+            query = query.ilike("proveedor", f"%{texto}%")
+        if d:
+            query = query.gte("fecha_presupuesto", d.isoformat())
+        if h:
+            query = query.lte("fecha_presupuesto", h.isoformat())
+        return query
+
+    return _aplicar
+
+
+def _repo(current_user: CurrentUser) -> BaseTenantRepository:
+    return BaseTenantRepository(supabase_client, str(current_user.org_id), "tbl_precios_referencia", "id")
+
+
 @router.get("", response_model=List[PrecioReferencia])
-def list_precios_referencia(current_user: CurrentUserDep) -> List[PrecioReferencia]:
+def list_precios_referencia(
+    current_user: CurrentUserDep,
+    response: Response,
+    id_producto: Optional[int] = Query(None, description="Filtrar por producto."),
+    proveedor: Optional[str] = Query(None, description="Proveedor (o nº de albarán) que contiene el texto."),
+    desde: Optional[str] = Query(None, description="fecha_presupuesto desde (YYYY-MM-DD, incluida)."),
+    hasta: Optional[str] = Query(None, description="fecha_presupuesto hasta (YYYY-MM-DD, incluida)."),
+    limit: Optional[int] = Query(None, ge=1, le=1000, description="Máximo de líneas por página (sin límite si se omite)."),
+    cursor: Optional[str] = Query(
+        None,
+        description="Cursor 'fecha_presupuesto|id' devuelto en la cabecera X-Next-Cursor de la página anterior.",
+    ),
+    stream: Optional[str] = Query(
+        None,
+        pattern=STREAM_FORMATS_PATTERN,
+        description="Respuesta en streaming: 'ndjson' (una línea JSON por precio) o 'json' (array JSON por trozos).",
+    ),
+) -> List[Dict[str, Any]]:
     """
-    Lista todas las líneas de precios de referencia.
+    Lista las líneas de precios de referencia, de la más reciente a la más antigua, con filtros
+    opcionales por producto, proveedor y fechas.
+
+    Orden: fecha_presupuesto desc, id desc, con las líneas sin fecha al final. Sin limit devuelve
+    todas (lectura por keyset, sin el tope de 1000 filas). Con limit, una página: si viene
+    llena, la cabecera X-Next-Cursor trae el cursor de la siguiente. Para exportar la tabla entera
+    mejor GET /precios-referencia/export (NDJSON en streaming). Con stream las líneas se escriben
+    según se leen, página a página (sin X-Next-Cursor: el cursor es la fecha e id de la última).
 
     GET /precios-referencia
+    GET /precios-referencia?id_producto=12&desde=2024-01-01
+    GET /precios-referencia?limit=200&cursor=2024-05-01|5b2c...
     """
+    query_filter = _filtro(proveedor, desde, hasta)
+    after = _parse_cursor(cursor) if cursor else None
+    eq: Dict[str, Any] = {"id_producto": id_producto} if id_producto is not None else {}
     try:
-        response = (
-            supabase_client.table("tbl_precios_referencia")
-            .select("id, id_producto, pvu, pcu, unidades, proveedor, notas, fecha_presupuesto, tbl_productos(nombre)")
-            .eq("organization_id", str(current_user.org_id))
-            .order("fecha_presupuesto", desc=True)
-            .execute()
-        )
-        rows = response.data or []
-        return [
-            PrecioReferencia(
-                id=str(r["id"]),
-                id_producto=int(r["id_producto"]),
-                product_nombre=(r.get("tbl_productos") or {}).get("nombre"),
-                pvu=float(r["pvu"]) if r.get("pvu") is not None else None,
-                pcu=float(r["pcu"]) if r.get("pcu") is not None else None,
-                unidades=float(r["unidades"]) if r.get("unidades") is not None else None,
-                proveedor=r.get("proveedor"),
-                notas=r.get("notas"),
-                fecha_presupuesto=r.get("fecha_presupuesto"),
+        repo = _repo(current_user)
+        # Siempre por keyset (fecha_presupuesto desc con las NULL al final, id desc): el listado
+        # completo, las páginas con cursor, el streaming y /export devuelven el mismo orden.
+        if stream:
+            page_size = min(limit, SUPABASE_PAGE_SIZE) if limit is not None else None
+            rows = repo.iter_keyset(
+                _SELECT, "fecha_presupuesto", after=after, page_size=page_size, query_filter=query_filter, **eq,
             )
-            for r in rows
-        ]
+            if limit is not None:
+                rows = itertools.islice(rows, limit)
+            return stream_response((_precio_dict(r) for r in rows), stream)
+        if limit is None:
+            rows = repo.iter_keyset(_SELECT, "fecha_presupuesto", after=after, query_filter=query_filter, **eq)
+            return [_precio_dict(r) for r in rows]
+        rows = repo.get_page_after(
+            _SELECT, "fecha_presupuesto", after=after, limit=limit, query_filter=query_filter, **eq,
+        )
+        if len(rows) == limit:
+            last = rows[-1]
+            fecha_last = str(last.get("fecha_presupuesto") or "").split("T")[0]
+            response.headers["X-Next-Cursor"] = f"{fecha_last}|{last['id']}"
+        return [_precio_dict(r) for r in rows]
     except Exception as e:
         raise HTTPException(
             status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
@@ -53,6 +163,33 @@ def list_precios_referencia(current_user: CurrentUserDep) -> List[PrecioReferenc
         ) from e
 
 
+@router.get("/export")
+def export_precios_referencia(
+    current_user: CurrentUserDep,
+    id_producto: Optional[int] = Query(None, description="Filtrar por producto."),
+    proveedor: Optional[str] = Query(None, description="Proveedor (o nº de albarán) que contiene el texto."),
+    desde: Optional[str] = Query(None, description="fecha_presupuesto desde (YYYY-MM-DD, incluida)."),
+    hasta: Optional[str] = Query(None, description="fecha_presupuesto hasta (YYYY-MM-DD, incluida)."),
+) -> StreamingResponse:
+    """
+    Exporta las líneas de precios de referencia (mismos filtros y orden que el listado) como NDJSON:
+    una línea JSON por precio, en streaming. Las filas se leen por keyset página a página, así que
+    la memoria no depende del tamaño de la tabla.
+
+    GET /precios-referencia/export?desde=2024-01-01
+    """
+    query_filter = _filtro(proveedor, desde, hasta)
+    eq: Dict[str, Any] = {"id_producto": id_producto} if id_producto is not None else {}
+    rows = _repo(current_user).iter_keyset(_SELECT, "fecha_presupuesto", query_filter=query_filter, **eq)
+    try:
+        return stream_response((_precio_dict(r) for r in rows), "ndjson", filename="precios_referencia.ndjson")
+    except Exception as e:
+        raise HTTPException(
+            status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
+            detail=f"Error exportando precios de referencia: {e!s}",
+        ) from e
+
+
 @router.post("", response_model=PrecioReferencia, status_code=status.HTTP_201_CREATED)
 def create_precio_referencia(payload: PrecioReferenciaCreate, current_user: CurrentUserDep) -> PrecioReferencia:
     """
@@ -107,6 +244,9 @@ def create_precio_referencia(payload: PrecioReferenciaCreate, current_user: Curr
             )
         r = data[0]
         id_producto = int(r["id_producto"])
+        notify_products_changed(org_id, [id_producto])
+        notify_reference_prices(org_id, [r])
+        PriceHistoryRepository(supabase_client, org_id).mark_added([id_producto])
         product_nombre = None
         try:
             prod_resp = (
@@ -6,9 +6,9 @@ from typing import List
 
 from fastapi import APIRouter, HTTPException, Query, status
 
-from backend.config import supabase_client
 from backend.deps import CurrentUserDep
 from backend.schemas.products import ProductoSearchResult
+from backend.services.product_index import product_index
 
 
 router = APIRouter(prefix="/productos", tags=["productos"])
@@ -25,104 +25,22 @@ def search_productos(
     ),
 ) -> List[ProductoSearchResult]:
     """
-    Búsqueda asíncrona de productos por nombre (y referencia si existe).
-    Devuelve id y nombre para poblar combobox/selectores.
+    Búsqueda asíncrona de productos por nombre (autocompletado).
+    Devuelve id, nombre y proveedor para poblar combobox/selectores.
+    Se sirve desde el índice en memoria (product_index), sin tildes ni mayúsculas y por
+    relevancia: primero los nombres que empiezan por q, luego los que tienen una palabra que
+    empieza por q y después el resto de los que contienen q (cada grupo por nombre).
 
     GET /productos/search?q=Planta
     GET /productos/search?q=Planta&only_with_precios_referencia=true  (con datos para tendencia/desviación: referencia o presupuestados en licitaciones)
     """
     try:
-        org_s = str(current_user.org_id)
-        if only_with_precios_referencia:
-            # Productos con precios de referencia
-            ref_resp = (
-                supabase_client.table("tbl_precios_referencia")
-                .select("id_producto")
-                .eq("organization_id", org_s)
-                .execute()
-            )
-            id_productos = set()
-            for r in (ref_resp.data or []):
-                if r.get("id_producto") is not None:
-                    id_productos.add(int(r["id_producto"]))
-            # Productos presupuestados en licitaciones (tbl_licitaciones_detalle)
-            det_resp = (
-                supabase_client.table("tbl_licitaciones_detalle")
-                .select("id_producto")
-                .eq("organization_id", org_s)
-                .eq("activo", True)
-                .execute()
-            )
-            for r in (det_resp.data or []):
-                if r.get("id_producto") is not None:
-                    id_productos.add(int(r["id_producto"]))
-            if not id_productos:
-                return []
-            response = (
-                supabase_client.table("tbl_productos")
-                .select("id, nombre, id_proveedor, nombre_proveedor")
-                .in_("id", list(id_productos))
-                .eq("organization_id", org_s)
-                .ilike("nombre", f"%{q}%")
-                .limit(limit)
-                .order("nombre")
-                .execute()
-            )
-        else:
-            response = (
-                supabase_client.table("tbl_productos")
-                .select("id, nombre, id_proveedor, nombre_proveedor")
-                .eq("organization_id", org_s)
-                .ilike("nombre", f"%{q}%")
-                .limit(limit)
-                .order("nombre")
-                .execute()
-            )
-
-        rows = response.data or []
-
-        # Resolver nombre de proveedor a partir de id_proveedor y tbl_proveedores.
-        # Si algo falla (tabla/columna no existe), hacemos fallback a nombre_proveedor de tbl_productos.
-        proveedor_ids = {
-            int(r["id_proveedor"])
-            for r in rows
-            if r.get("id_proveedor") is not None
-        }
-        proveedores_by_id: dict[int, str | None] = {}
-        if proveedor_ids:
-            try:
-                prov_resp = (
-                    supabase_client.table("tbl_proveedores")
-                    .select("id, nombre")
-                    .eq("organization_id", org_s)
-                    .in_("id", list(proveedor_ids))
-                    .execute()
-                )
-                for p in prov_resp.data or []:
-                    try:
-                        pid = int(p["id"])
-                    except Exception:
-                        continue
-                    nombre = (p.get("nombre") or "").strip() or None
-                    proveedores_by_id[pid] = nombre
-            except Exception:
-                proveedores_by_id = {}
-
+        fichas = product_index.autocompletar(
+            str(current_user.org_id), q, limit, solo_con_historico=only_with_precios_referencia,
+        )
         return [
-            ProductoSearchResult(
-                id=int(r["id"]),
-                nombre=r.get("nombre") or "",
-                nombre_proveedor=(
-                    (
-                        proveedores_by_id.get(int(r["id_proveedor"]))
-                        if r.get("id_proveedor") is not None
-                        else None
-                    )
-                    or (r.get("nombre_proveedor") or "").strip()
-                    or None
-                ),
-            )
-            for r in rows
+            ProductoSearchResult(id=pid, nombre=nombre, nombre_proveedor=proveedor)
+            for pid, nombre, proveedor in fichas
         ]
     except Exception as e:
         raise HTTPException(
@@ -6,13 +6,18 @@ tbl_precios_referencia O en tbl_licitaciones_detalle; luego filtrar por nombre.
 - tbl_precios_referencia: líneas sin licitación (producto, pvu, pcu, unidades, proveedor).
 """
 
-from typing import Dict, List, Optional, Tuple
+from typing import Dict, Iterator, List, Optional, Tuple
 
 from fastapi import APIRouter, HTTPException, Query, status
 
-from backend.config import supabase_client
+from backend.config import SUPABASE_IN_CHUNK_SIZE, supabase_client
 from backend.deps import CurrentUserDep
+from backend.query_executor import run_parallel
+from backend.repositories.base_repository import BaseTenantRepository
 from backend.schemas.products import ProductSearchItem
+from backend.services.product_index import product_index
+from backend.streaming import STREAM_FORMATS_PATTERN, stream_response
+from backend.utils import chunked
 
 
 router = APIRouter(prefix="/search", tags=["search"])
@@ -26,76 +31,31 @@ def _get_proveedor_display(proveedor_raw: Optional[str], producto: Optional[dict
     return nom or None
 
 
+# Máximo de productos por coincidencia de nombre y por coincidencia de referencia.
+MAX_PRODUCTOS_POR_CAMPO = 300
+
+
 def _producto_ids_con_historico_y_nombre(q: str, org_id: str) -> List[int]:
     """
     Productos que coinciden con q (nombre o referencia) y que tienen histórico
     en precios_referencia o licitaciones_detalle.
-    INVERSIÓN: buscamos en tbl_productos PRIMERO (evita límite 1000 de Supabase
-    al cargar 500k+ filas de precios_referencia).
+    Se resuelve en memoria con el índice de productos (product_index: sin tildes ni
+    mayúsculas) y el conjunto de productos con histórico (PriceHistoryRepository).
     """
-    # 1. Buscar en tbl_productos por nombre o referencia (solo org del usuario)
-    pat = f"%{q}%"
-    by_nombre = (
-        supabase_client.table("tbl_productos")
-        .select("id")
-        .eq("organization_id", org_id)
-        .ilike("nombre", pat)
-        .limit(300)
-        .execute()
-    )
-    by_ref = (
-        supabase_client.table("tbl_productos")
-        .select("id")
-        .eq("organization_id", org_id)
-        .ilike("referencia", pat)
-        .limit(300)
-        .execute()
-    )
-    candidatos = list({
-        int(r["id"])
-        for r in (by_nombre.data or []) + (by_ref.data or [])
-        if r.get("id") is not None
-    })
-    if not candidatos:
-        return []
-    # 2. Filtrar solo los que tienen datos en precios_referencia o detalle (org-scoped)
-    ref_resp = (
-        supabase_client.table("tbl_precios_referencia")
-        .select("id_producto")
-        .eq("organization_id", org_id)
-        .in_("id_producto", candidatos)
-        .limit(10000)
-        .execute()
-    )
-    det_resp = (
-        supabase_client.table("tbl_licitaciones_detalle")
-        .select("id_producto")
-        .eq("organization_id", org_id)
-        .in_("id_producto", candidatos)
-        .eq("activo", True)
-        .limit(5000)
-        .execute()
-    )
-    con_historico = set()
-    for r in (ref_resp.data or []) + (det_resp.data or []):
-        if r.get("id_producto") is not None:
-            con_historico.add(int(r["id_producto"]))
-    return [pid for pid in candidatos if pid in con_historico]
+    return product_index.buscar_con_historico(org_id, q, limite=MAX_PRODUCTOS_POR_CAMPO)
 
 
 def _search_detalle(id_productos: List[int], org_id: str) -> List[dict]:
     """Busca en tbl_licitaciones_detalle por id_producto (solo partidas activas)."""
     if not id_productos:
         return []
-    response = (
-        supabase_client.table("tbl_licitaciones_detalle")
-        .select("*, tbl_licitaciones(nombre, numero_expediente), tbl_productos(nombre, nombre_proveedor)")
-        .eq("organization_id", org_id)
-        .in_("id_producto", id_productos)
-        .eq("activo", True)
-        .execute()
+    repo = BaseTenantRepository(supabase_client, org_id, "tbl_licitaciones_detalle", "id_detalle")
+    return repo.get_in(
+        "id_producto",
+        id_productos,
+        "*, tbl_licitaciones(nombre, numero_expediente), tbl_productos(nombre, nombre_proveedor)",
+        activo=True,
     )
-    return response.data or []
 
 
 def _get_pcu_and_proveedor_from_real(id_detalles: List[int], org_id: str) -> Tuple[Dict[int, float], Dict[int, Optional[str]]]:
@@ -105,15 +65,8 @@ def _get_pcu_and_proveedor_from_real(id_detalles: List[int], org_id: str) -> Tup
     """
     if not id_detalles:
         return {}, {}
-    response = (
-        supabase_client.table("tbl_licitaciones_real")
-        .select("id_detalle, pcu, proveedor")
-        .eq("organization_id", org_id)
-        .in_("id_detalle", id_detalles)
-        .order("id_real", desc=True)
-        .execute()
-    )
-    rows = response.data or []
+    repo = BaseTenantRepository(supabase_client, org_id, "tbl_licitaciones_real", "id_real")
+    rows = repo.get_in("id_detalle", id_detalles, "id_detalle, pcu, proveedor", order_by="id_real", order_desc=True)
     pcu_by_id: Dict[int, float] = {}
     proveedor_by_id: Dict[int, Optional[str]] = {}
     for r in rows:
@@ -126,74 +79,91 @@ def _get_pcu_and_proveedor_from_real(id_detalles: List[int], org_id: str) -> Tup
     return pcu_by_id, proveedor_by_id
 
 
-def _search_precios_referencia(id_productos: List[int], org_id: str) -> List[ProductSearchItem]:
+def _search_precios_referencia(id_productos: List[int], org_id: str) -> List[dict]:
     """Busca en tbl_precios_referencia por id_producto."""
     try:
         if not id_productos:
             return []
-        response = (
-            supabase_client.table("tbl_precios_referencia")
-            .select("id_producto, pvu, pcu, unidades, proveedor, tbl_productos(nombre, nombre_proveedor)")
-            .eq("organization_id", org_id)
-            .in_("id_producto", id_productos)
-            .execute()
+        repo = BaseTenantRepository(supabase_client, org_id, "tbl_precios_referencia", "id")
+        rows = repo.get_in(
+            "id_producto", id_productos, "id_producto, pvu, pcu, unidades, proveedor, tbl_productos(nombre, nombre_proveedor)",
         )
-        rows = response.data or []
         return [
-            ProductSearchItem(
-                id_producto=r.get("id_producto"),
-                producto=(r.get("tbl_productos") or {}).get("nombre") or "",
-                pvu=float(r["pvu"]) if r.get("pvu") is not None else None,
-                pcu=float(r["pcu"]) if r.get("pcu") is not None else None,
-                unidades=float(r["unidades"]) if r.get("unidades") is not None else None,
-                licitacion_nombre=None,
-                numero_expediente=None,
-                proveedor=_get_proveedor_display(r.get("proveedor"), r.get("tbl_productos")),
-            )
+            {
+                "id_producto": r.get("id_producto"),
+                "producto": (r.get("tbl_productos") or {}).get("nombre") or "",
+                "pvu": float(r["pvu"]) if r.get("pvu") is not None else None,
+                "pcu": float(r["pcu"]) if r.get("pcu") is not None else None,
+                "unidades": float(r["unidades"]) if r.get("unidades") is not None else None,
+                "licitacion_nombre": None,
+                "numero_expediente": None,
+                "proveedor": _get_proveedor_display(r.get("proveedor"), r.get("tbl_productos")),
+            }
             for r in rows
         ]
     except Exception:
         return []
 
 
+def _iter_resultados(id_productos: List[int], org_id: str, tanda: int) -> Iterator[dict]:
+    """
+    Resultados del buscador (forma de ProductSearchItem) por tandas de productos: para cada
+    tanda, sus partidas activas (con PCU/proveedor de tbl_licitaciones_real) y luego sus
+    precios de referencia. Generador: solo retiene las filas de una tanda.
+    """
+    for ids in chunked(id_productos, max(tanda, 1)):
+        # Partidas y precios de referencia de los productos, a la vez.
+        filas = run_parallel({
+            "detalle": lambda ids=ids: _search_detalle(ids, org_id),
+            "referencia": lambda ids=ids: _search_precios_referencia(ids, org_id),
+        }, label="search")
+        data = filas["detalle"]
+        id_detalles = list({item["id_detalle"] for item in data if item.get("id_detalle") is not None})
+        pcu_by_id, proveedor_by_id = _get_pcu_and_proveedor_from_real(id_detalles, org_id)
+
+        for item in data:
+            lic = item.get("tbl_licitaciones") or {}
+            prod = item.get("tbl_productos") or {}
+            id_d = item.get("id_detalle")
+            pcu = pcu_by_id.get(id_d) if id_d is not None else None
+            prov_raw = proveedor_by_id.get(id_d) if id_d is not None else None
+            yield {
+                "id_producto": item.get("id_producto"),
+                "producto": prod.get("nombre") or "",
+                "pvu": item.get("pvu"),
+                "pcu": pcu,
+                "unidades": item.get("unidades"),
+                "licitacion_nombre": lic.get("nombre"),
+                "numero_expediente": lic.get("numero_expediente"),
+                "proveedor": _get_proveedor_display(prov_raw, prod),
+            }
+        yield from filas["referencia"]
+
+
 @router.get("", response_model=List[ProductSearchItem])
 def search(
     current_user: CurrentUserDep,
     q: str = Query(..., min_length=1, description="Texto de búsqueda por producto."),
-) -> List[ProductSearchItem]:
+    stream: Optional[str] = Query(
+        None,
+        pattern=STREAM_FORMATS_PATTERN,
+        description="Respuesta en streaming: 'ndjson' (una línea JSON por resultado) o 'json' (array JSON por trozos).",
+    ),
+) -> List[dict]:
     """
     Busca por producto en tbl_licitaciones_detalle y en tbl_precios_referencia.
+    Con stream los resultados se escriben por tandas de SUPABASE_IN_CHUNK_SIZE productos
+    (partidas y precios de referencia de cada tanda), sin esperar a tenerlos todos.
     GET /search?q=Planta
+    GET /search?q=Planta&stream=ndjson
     """
     try:
         org_s = str(current_user.org_id)
         id_productos = _producto_ids_con_historico_y_nombre(q, org_s)
-        data = _search_detalle(id_productos, org_s)
-        id_detalles = list({item["id_detalle"] for item in data if item.get("id_detalle") is not None})
-        pcu_by_id, proveedor_by_id = _get_pcu_and_proveedor_from_real(id_detalles, org_s)
-
-        results: List[ProductSearchItem] = []
-        for item in data:
-            lic = item.get("tbl_licitaciones") or {}
-            prod = item.get("tbl_productos") or {}
-            id_d = item.get("id_detalle")
-            pcu = pcu_by_id.get(id_d) if id_d is not None else None
-            prov_raw = proveedor_by_id.get(id_d) if id_d is not None else None
-            proveedor = _get_proveedor_display(prov_raw, prod)
-            results.append(
-                ProductSearchItem(
-                    id_producto=item.get("id_producto"),
-                    producto=prod.get("nombre") or "",
-                    pvu=item.get("pvu"),
-                    pcu=pcu,
-                    unidades=item.get("unidades"),
-                    licitacion_nombre=lic.get("nombre"),
-                    numero_expediente=lic.get("numero_expediente"),
-                    proveedor=proveedor,
-                )
-            )
-        results.extend(_search_precios_referencia(id_productos, org_s))
-        return results
+        if stream:
+            return stream_response(_iter_resultados(id_productos, org_s, SUPABASE_IN_CHUNK_SIZE), stream)
+        # Sin streaming, una sola tanda: todas las partidas y después todos los precios de referencia.
+        return list(_iter_resultados(id_productos, org_s, len(id_productos)))
     except HTTPException:
         raise
     except Exception as e:
@@ -207,9 +177,9 @@ def search(
 def search_products(
     current_user: CurrentUserDep,
     q: str = Query(..., min_length=1, description="Texto de búsqueda en producto."),
-) -> List[ProductSearchItem]:
+) -> List[dict]:
     """
     Misma búsqueda por producto (compatibilidad).
     GET /search/products?q=Planta
     """
-    return search(q=q, current_user=current_user)
\ No newline at end of file
+    return search(q=q, current_user=current_user, stream=None)
\ No newline at end of file
@@ -15,6 +15,7 @@ from backend.repositories.tenders_repository import TendersRepository
 from backend.services.exceptions import ConflictError, NotFoundError
 from backend.services.tenders_service import TenderService
 from backend.config import supabase_client
+from backend.streaming import STREAM_FORMATS_PATTERN, stream_response
 
 
 router = APIRouter(prefix="/tenders", tags=["tenders"])
@@ -43,10 +44,17 @@ def list_tenders(
     estado_id: Optional[int] = Query(None, description="Filtrar por id_estado."),
     nombre: Optional[str] = Query(None, description="Buscar por nombre (ilike)."),
     pais: Optional[str] = Query(None, description="Filtrar por país: España o Portugal."),
+    stream: Optional[str] = Query(
+        None,
+        pattern=STREAM_FORMATS_PATTERN,
+        description="Respuesta en streaming: 'ndjson' (una línea JSON por licitación) o 'json' (array JSON por trozos).",
+    ),
     service: TenderService = Depends(get_tender_service),
 ) -> List[dict]:
     """Lista licitaciones con filtros opcionales. Solo de la organización del usuario."""
     try:
+        if stream:
+            return stream_response(service.iter_tenders(estado_id=estado_id, nombre=nombre, pais=pais), stream)
         return service.list_tenders(estado_id=estado_id, nombre=nombre, pais=pais)
     except (NotFoundError, ConflictError, ValueError) as e:
         raise _map_service_error(e)
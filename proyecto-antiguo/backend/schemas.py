@@ -46,6 +46,7 @@ from backend.schemas.analytics import (
   RiskPipelineItem,
   SweetSpotItem,
   PriceDeviationResult,
+  PriceDeviationCheckItem,
   PriceHistoryPoint,
   VolumeMetrics,
   CompetitorItem,
@@ -94,6 +95,7 @@ __all__ = [
   "RiskPipelineItem",
   "SweetSpotItem",
   "PriceDeviationResult",
+  "PriceDeviationCheckItem",
   "PriceHistoryPoint",
   "VolumeMetrics",
   "CompetitorItem",
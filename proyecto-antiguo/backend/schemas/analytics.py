@@ -1,7 +1,7 @@
 from decimal import Decimal
 from typing import List, Optional
 
-from pydantic import BaseModel, Field
+from pydantic import BaseModel, Field, model_validator
 
 
 class TimelineItem(BaseModel):
@@ -74,6 +74,23 @@ class PriceDeviationResult(BaseModel):
   deviation_percentage: Decimal = Field(..., description="Porcentaje de desviación vs media histórica.")
   historical_avg: Decimal = Field(..., description="Media del precio en el último año.")
   recommendation: str = Field(..., description="Recomendación para el usuario.")
+  sample_size: int = Field(0, description="Nº de precios del histórico usados en la comparación.")
+  historical_median: Optional[Decimal] = Field(None, description="Mediana del precio en el último año.")
+  historical_stddev: Optional[Decimal] = Field(None, description="Desviación típica del precio en el último año.")
+
+
+class PriceDeviationCheckItem(BaseModel):
+  """Línea del presupuesto para la comprobación de desviación en bloque."""
+
+  id_producto: Optional[int] = Field(None, description="ID del producto en tbl_productos (prioritario sobre material_name).")
+  material_name: Optional[str] = Field(None, description="Nombre del material/insumo si no hay id_producto.")
+  current_price: float = Field(..., ge=0, description="Precio actual a comparar (PVU).")
+
+  @model_validator(mode="after")
+  def validar_producto(self) -> "PriceDeviationCheckItem":
+    if self.id_producto is None and not (self.material_name and self.material_name.strip()):
+      raise ValueError("Indica id_producto o material_name.")
+    return self
 
 
 class PriceHistoryPoint(BaseModel):
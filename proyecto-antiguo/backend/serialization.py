@@ -0,0 +1,145 @@
+"""
+Serialización por columnas de las respuestas de analítica.
+
+En vez de recorrer DataFrames con iterrows() y construir un modelo Pydantic por fila,
+las columnas se normalizan y redondean en bloque (numpy/pandas) y se devuelven como
+lista de dicts: el modelo de respuesta valida la lista entera de una vez.
+Incluye la reducción de series largas para gráficas (agregación semanal/mensual y LTTB).
+Sin dependencias de Supabase (lo usa también bench_analytics_serialization.py).
+"""
+
+from typing import Any, Dict, Iterable, List, Optional, Sequence, Tuple
+
+import numpy as np
+import pandas as pd
+
+
+def round_column(values: Iterable[Any], ndigits: int = 2) -> List[float]:
+    """
+    round(v, ndigits) de toda una columna con numpy. np.round escala, redondea y desescala,
+    y eso difiere de round() de Python justo en los empates aparentes (2.275 es 2.27499... en
+    binario): esos pocos valores se redondean uno a uno para dar exactamente lo mismo que round().
+    """
+    arr = np.asarray(values, dtype=float)
+    out = np.round(arr, ndigits)
+    escalado = np.abs(arr) * 10.0 ** ndigits
+    for i in np.flatnonzero(np.abs(escalado - np.floor(escalado) - 0.5) < 1e-6):
+        out[i] = round(float(arr[i]), ndigits)
+    return out.tolist()
+
+
+def _records(cols: Dict[str, List[Any]]) -> List[Dict[str, Any]]:
+    keys = list(cols)
+    return [dict(zip(keys, row)) for row in zip(*cols.values())]
+
+
+def points_records(times: Iterable[Any], values: Iterable[Any], ndigits: int = 2, **extra: Iterable[Any]) -> List[Dict[str, Any]]:
+    """Serie temporal a [{"time", "value", ...extra}]; valores y columnas extra redondeados en bloque."""
+    cols: Dict[str, List[Any]] = {"time": list(times), "value": round_column(values, ndigits)}
+    for name, col in extra.items():
+        cols[name] = round_column(col, ndigits)
+    return _records(cols)
+
+
+def merge_series(columnas: Sequence[Tuple[np.ndarray, ...]]) -> Tuple[np.ndarray, np.ndarray]:
+    """Une varias series (fechas, valores): un punto por día (el de la última serie que lo trae), ordenado."""
+    if not columnas:
+        return np.array([], dtype=object), np.array([], dtype=float)
+    df = pd.DataFrame({
+        "time": np.concatenate([np.asarray(c[0], dtype=object) for c in columnas]),
+        "value": np.concatenate([np.asarray(c[1], dtype=float) for c in columnas]),
+    })
+    df = df.drop_duplicates(subset=["time"], keep="last").sort_values("time", kind="stable")
+    return df["time"].to_numpy(dtype=object), df["value"].to_numpy(dtype=float)
+
+
+def merge_points(columnas: Sequence[Tuple[np.ndarray, ...]], ndigits: int = 2) -> List[Dict[str, Any]]:
+    """merge_series serializado con points_records."""
+    return points_records(*merge_series(columnas), ndigits=ndigits)
+
+
+def aggregate_series(
+    times: np.ndarray, values: np.ndarray, agrupar: str, **extra: np.ndarray,
+) -> Tuple[np.ndarray, np.ndarray, Dict[str, np.ndarray]]:
+    """
+    Agrega una serie diaria por semana (lunes) o mes (día 1): precio medio del periodo y
+    suma de las columnas extra (unidades). agrupar="dia" la devuelve tal cual.
+    """
+    if agrupar == "dia" or len(times) == 0:
+        return times, values, extra
+    freq = "W" if agrupar == "semana" else "M"
+    periodo = pd.to_datetime(pd.Series(times, dtype=object)).dt.to_period(freq).dt.start_time
+    df = pd.DataFrame({"periodo": periodo, "value": values, **extra})
+    agg = df.groupby("periodo", sort=True).agg(value=("value", "mean"), **{k: (k, "sum") for k in extra})
+    fechas = agg.index.strftime("%Y-%m-%d").to_numpy(dtype=object)
+    return fechas, agg["value"].to_numpy(dtype=float), {k: agg[k].to_numpy(dtype=float) for k in extra}
+
+
+def lttb_indices(x: np.ndarray, y: np.ndarray, n_out: int) -> np.ndarray:
+    """
+    Largest-Triangle-Three-Buckets: índices de n_out puntos que conservan la forma de la serie
+    (primero y último siempre; en cada cubo, el que forma el triángulo de mayor área con el
+    punto elegido antes y la media del cubo siguiente). x debe estar ordenado.
+    """
+    n = len(x)
+    if n_out >= n or n_out < 3:
+        return np.arange(n)
+    x = np.asarray(x, dtype=float)
+    y = np.asarray(y, dtype=float)
+    cubo = (n - 2) / (n_out - 2)
+    out = np.empty(n_out, dtype=int)
+    out[0], out[-1] = 0, n - 1
+    a = 0
+    for i in range(n_out - 2):
+        ini = int(i * cubo) + 1
+        fin = int((i + 1) * cubo) + 1
+        sig_fin = min(int((i + 2) * cubo) + 1, n)
+        avg_x = x[fin:sig_fin].mean() if sig_fin > fin else x[-1]
+        avg_y = y[fin:sig_fin].mean() if sig_fin > fin else y[-1]
+        area = np.abs((x[a] - avg_x) * (y[ini:fin] - y[a]) - (x[a] - x[ini:fin]) * (avg_y - y[a]))
+        a = ini + int(np.argmax(area))
+        out[i + 1] = a
+    return out
+
+
+def downsample(
+    times: np.ndarray, values: np.ndarray, agrupar: str = "dia", max_puntos: Optional[int] = None, **extra: np.ndarray,
+) -> Tuple[np.ndarray, np.ndarray, Dict[str, np.ndarray]]:
+    """
+    Reduce una serie para una gráfica: primero agrega (aggregate_series) y, si aún quedan más
+    de max_puntos, elige max_puntos con LTTB. Las columnas extra siguen a los puntos elegidos.
+    """
+    times, values, extra = aggregate_series(times, values, agrupar, **extra)
+    if max_puntos and len(times) > max_puntos:
+        dias = pd.to_datetime(pd.Series(times, dtype=object)).to_numpy(dtype="datetime64[D]").astype(np.int64)
+        idx = lttb_indices(dias, values, max_puntos)
+        times, values, extra = times[idx], values[idx], {k: v[idx] for k, v in extra.items()}
+    return times, values, extra
+
+
+def _texto(col: pd.Series) -> pd.Series:
+    """Texto sin espacios; None/NaN y "nan" pasan a cadena vacía."""
+    txt = col.astype(str)
+    return txt.str.strip().where(col.notna() & (txt != "nan"), "").astype(object)
+
+
+def timeline_records(df: pd.DataFrame) -> List[Dict[str, Any]]:
+    """
+    Registros del timeline de KPIs (TimelineItem) normalizados por columnas, tolerando datos
+    raros o faltantes: id no numérico -> -1, nombre vacío -> "Licitación {id}", fechas vacías -> None.
+    """
+    if df.empty:
+        return []
+    vacia = pd.Series([None] * len(df), index=df.index, dtype=object)
+    ids = pd.to_numeric(df.get("id_licitacion", vacia), errors="coerce").fillna(-1).astype(int)
+    nombre = _texto(df.get("nombre", vacia))
+    nombre = nombre.where(nombre != "", "Licitación " + ids.astype(str))
+    cols = {"id_licitacion": ids, "nombre": nombre}
+    for c in ("fecha_adjudicacion", "fecha_finalizacion"):
+        fecha = _texto(df.get(c, vacia))
+        cols[c] = fecha.where(fecha != "", None)
+    estado = df.get("estado_nombre", vacia).astype(object)
+    cols["estado_nombre"] = estado.where(estado.notna(), None)
+    pres = pd.to_numeric(df.get("pres_maximo", vacia), errors="coerce").astype(float)
+    cols["pres_maximo"] = pres.astype(object).where(pres.notna(), None)
+    return _records({k: c.tolist() for k, c in cols.items()})
@@ -0,0 +1,447 @@
+"""
+Snapshot de KPIs del dashboard por organización (GET /analytics/kpis).
+
+Por organización se materializa en memoria:
+- las licitaciones que cuentan en el dashboard, ya enriquecidas (estado normalizado,
+  fecha de adjudicación parseada);
+- la contribución de cada licitación adjudicada/terminada al margen ponderado
+  (venta y beneficio, presupuestado y real);
+- los KPIs sin filtro de fechas, ya calculados.
+
+Las escrituras de la API avisan con notify_tenders_changed(org_id, ids): en la siguiente
+lectura solo se releen esas licitaciones y sus partidas/entregas. Lo que se escriba fuera
+de la API (scripts de importación, PHP) se recoge al caducar el snapshot
+(KPI_SNAPSHOT_TTL_SECONDS). El filtro por fecha de adjudicación se hace en memoria.
+"""
+
+import logging
+import threading
+import time
+from typing import Any, Dict, Iterable, List, Optional, Set, Tuple
+
+import pandas as pd
+
+from backend.cache import TTLCache
+from backend.config import KPI_SNAPSHOT_TTL_SECONDS, get_maestros, supabase_client
+from backend.query_executor import run_parallel
+from backend.repositories.base_repository import BaseTenantRepository
+from backend.services.price_series import price_series
+from backend.services.price_stats import price_stats
+from backend.schemas.analytics import KPIDashboard
+from backend.serialization import timeline_records
+
+logger = logging.getLogger(__name__)
+
+# Estados (solo los del desplegable; comparación por lower())
+ESTADOS_OFERTADO = {"Adjudicada", "No Adjudicada", "Presentada", "Terminada"}
+ESTADOS_ADJUDICADAS_TERMINADAS = {"Adjudicada", "Terminada"}
+ESTADOS_DESCARTADA = {"Descartada"}
+ESTADOS_EN_ANALISIS = {"EN ANÁLISIS"}
+
+# Versión en minúsculas para comparación insensible a mayúsculas (tbl_estados puede tener "TERMINADA", etc.)
+ESTADOS_OFERTADO_NORM = {s.lower() for s in ESTADOS_OFERTADO}
+ESTADOS_ADJUDICADAS_TERMINADAS_NORM = {s.lower() for s in ESTADOS_ADJUDICADAS_TERMINADAS}
+ESTADOS_DESCARTADA_NORM = {s.lower() for s in ESTADOS_DESCARTADA}
+ESTADOS_EN_ANALISIS_NORM = {s.lower() for s in ESTADOS_EN_ANALISIS}
+
+# Tipos de procedimiento que cuentan en el dashboard: solo ordinarios y "hijos" (contratos derivados).
+# Excluimos ACUERDO_MARCO y SDA (padres); incluimos ORDINARIO, CONTRATO_BASADO y ESPECIFICO_SDA.
+TIPOS_INCLUIDOS_DASHBOARD = {"ORDINARIO", "CONTRATO_BASADO", "ESPECIFICO_SDA"}
+
+_COLUMNAS_LICITACION = (
+    "id_licitacion, nombre, pres_maximo, id_estado, tipo_procedimiento, "
+    "fecha_presentacion, fecha_adjudicacion, fecha_finalizacion"
+)
+
+# (venta, beneficio) de una licitación; el margen ponderado es sum(beneficio) / sum(venta).
+Contribucion = Tuple[float, float]
+
+MARGEN_COLUMNAS = ["venta_presupuestada", "beneficio_presupuestado", "venta_real", "beneficio_real"]
+
+
+def empty_kpis() -> KPIDashboard:
+    """Devuelve un objeto KPIDashboard vacío/neutral para casos de error o sin datos."""
+    return KPIDashboard(
+        timeline=[],
+        total_oportunidades_uds=0,
+        total_oportunidades_euros=0.0,
+        total_ofertado_uds=0,
+        total_ofertado_euros=0.0,
+        ratio_ofertado_oportunidades_uds=0.0,
+        ratio_ofertado_oportunidades_euros=0.0,
+        ratio_adjudicadas_terminadas_ofertado=0.0,
+        margen_medio_ponderado_presupuestado=None,
+        margen_medio_ponderado_real=None,
+        pct_descartadas_uds=None,
+        pct_descartadas_euros=None,
+        ratio_adjudicacion=0.0,
+    )
+
+
+def _to_int_ids(values: Iterable[Any]) -> List[int]:
+    """Normaliza IDs a enteros puros (evita "118.0" -> error 22P02 en Postgres)."""
+    try:
+        return [int(x) for x in values if x is not None]
+    except (TypeError, ValueError):
+        return []
+
+
+def _fetch_licitaciones(org_id: str, ids: Optional[List[int]] = None) -> List[Dict[str, Any]]:
+    """Licitaciones de la organización (todas, o solo ids) con las columnas del dashboard (paginado)."""
+    repo = BaseTenantRepository(supabase_client, org_id, "tbl_licitaciones", "id_licitacion")
+    if ids is None:
+        return list(repo.iter_all(_COLUMNAS_LICITACION, parallel=True))
+    return repo.get_in("id_licitacion", ids, _COLUMNAS_LICITACION)
+
+
+def _paged_in(org_id: str, table: str, pk: str, select: str, column: str, values: List[int]) -> List[Dict[str, Any]]:
+    """Todas las filas con column IN values (IN troceado y paginado: una licitación grande supera las 1000 líneas)."""
+    return BaseTenantRepository(supabase_client, org_id, table, pk).get_in(column, values, select)
+
+
+def compute_margenes(org_id: str, ids: List[int]) -> pd.DataFrame:
+    """
+    Motor de margen combinado (presupuestado y real) para un conjunto de licitaciones.
+
+    - Una sola lectura de tbl_licitaciones_detalle (id_detalle, id_licitacion, unidades, pvu, pcu, activo):
+      sirve para el margen presupuestado (partidas activas) y como mapa de pvu del real.
+    - Una lectura de tbl_licitaciones_real, en paralelo con la anterior.
+    - Un paso vectorizado que agrega por licitación.
+
+    Devuelve un DataFrame indexado por id_licitacion con venta_presupuestada, beneficio_presupuestado,
+    venta_real, beneficio_real y los márgenes por licitación (%; NaN si no hay venta).
+    """
+    cols = MARGEN_COLUMNAS + ["margen_presupuestado", "margen_real"]
+    if not ids:
+        return pd.DataFrame(columns=cols, dtype=float)
+    res = run_parallel({
+        "detalle": lambda: _paged_in(
+            org_id, "tbl_licitaciones_detalle", "id_detalle",
+            "id_detalle, id_licitacion, unidades, pvu, pcu, activo", "id_licitacion", ids,
+        ),
+        "real": lambda: _paged_in(
+            org_id, "tbl_licitaciones_real", "id_real",
+            "id_licitacion, id_detalle, cantidad, pcu", "id_licitacion", ids,
+        ),
+    }, label="margenes")
+    det = pd.DataFrame(res["detalle"], columns=["id_detalle", "id_licitacion", "unidades", "pvu", "pcu", "activo"])
+    real = pd.DataFrame(res["real"], columns=["id_licitacion", "id_detalle", "cantidad", "pcu"])
+    for df, numericas in ((det, ("unidades", "pvu", "pcu")), (real, ("cantidad", "pcu"))):
+        for col in numericas:
+            df[col] = pd.to_numeric(df[col], errors="coerce").fillna(0)
+
+    # pvu por id_detalle para valorar lo entregado. Si alguna línea real apunta a una partida
+    # de otra licitación (no debería), se completa el mapa con una consulta aparte.
+    pvu_map: Dict[Any, float] = {r.id_detalle: float(r.pvu) for r in det.itertuples() if r.id_detalle is not None}
+    faltan = _to_int_ids(set(real["id_detalle"].dropna().unique().tolist()) - set(pvu_map))
+    if faltan:
+        extra = _paged_in(org_id, "tbl_licitaciones_detalle", "id_detalle", "id_detalle, pvu", "id_detalle", faltan)
+        pvu_map.update({r["id_detalle"]: float(r.get("pvu") or 0) for r in extra})
+
+    activas = det[det["activo"].eq(True)]
+    venta_p = activas["unidades"] * activas["pvu"]
+    presupuestado = pd.DataFrame({
+        "id_licitacion": activas["id_licitacion"],
+        "venta_presupuestada": venta_p,
+        "beneficio_presupuestado": venta_p - activas["unidades"] * activas["pcu"],
+    }).groupby("id_licitacion").sum()
+    venta_r = real["cantidad"] * real["id_detalle"].map(pvu_map).fillna(0)
+    reales = pd.DataFrame({
+        "id_licitacion": real["id_licitacion"],
+        "venta_real": venta_r,
+        "beneficio_real": venta_r - real["cantidad"] * real["pcu"],
+    }).groupby("id_licitacion").sum()
+
+    out = presupuestado.join(reales, how="outer")
+    out.index = out.index.astype(int)
+    vp, vr = out["venta_presupuestada"], out["venta_real"]
+    out["margen_presupuestado"] = (out["beneficio_presupuestado"] / vp * 100).where(vp > 0)
+    out["margen_real"] = (out["beneficio_real"] / vr * 100).where(vr > 0)
+    return out[cols]
+
+
+def _contribuciones(margenes: pd.DataFrame, tipo: str) -> Dict[int, Contribucion]:
+    """{id_licitacion: (venta, beneficio)} de un tipo ("presupuestado" / "real") desde compute_margenes."""
+    venta_col = "venta_presupuestada" if tipo == "presupuestado" else "venta_real"
+    beneficio_col = "beneficio_presupuestado" if tipo == "presupuestado" else "beneficio_real"
+    sub = margenes[[venta_col, beneficio_col]].dropna()
+    return {int(i): (float(v), float(b)) for i, v, b in zip(sub.index, sub[venta_col], sub[beneficio_col])}
+
+
+def _estado_norm(row: Dict[str, Any], estados_map: Dict[Any, str]) -> str:
+    return str(estados_map.get(row.get("id_estado"), "Desconocido")).strip().lower()
+
+
+def _es_facturable(row: Dict[str, Any]) -> bool:
+    return str(row.get("tipo_procedimiento") or "").upper().strip() in TIPOS_INCLUIDOS_DASHBOARD
+
+
+def _cuenta_para_margen(row: Dict[str, Any], estados_map: Dict[Any, str]) -> bool:
+    """Solo las facturables adjudicadas/terminadas entran en el margen ponderado."""
+    return _es_facturable(row) and _estado_norm(row, estados_map) in ESTADOS_ADJUDICADAS_TERMINADAS_NORM
+
+
+def _margen(contribuciones: Dict[int, Contribucion], ids: Iterable[int]) -> Optional[float]:
+    venta = 0.0
+    beneficio = 0.0
+    for i in ids:
+        c = contribuciones.get(i)
+        if c:
+            venta += c[0]
+            beneficio += c[1]
+    if venta > 0:
+        return beneficio / venta * 100
+    return None
+
+
+class KpiSnapshot:
+    """
+    Datos materializados de una organización, por id de licitación. No se modifica una vez
+    creado: el refresco incremental construye uno nuevo (copiando lo que no cambia) y lo
+    sustituye en la caché, así que los lectores concurrentes nunca ven datos a medias. El
+    DataFrame y los KPIs sin filtro se calculan en memoria (sin consultas) en la primera lectura.
+    """
+
+    def __init__(
+        self,
+        licitaciones: Dict[int, Dict[str, Any]],
+        margen_presupuestado: Dict[int, Contribucion],
+        margen_real: Dict[int, Contribucion],
+        expires_at: Optional[float] = None,
+    ) -> None:
+        self.licitaciones = licitaciones
+        self.margen_presupuestado = margen_presupuestado
+        self.margen_real = margen_real
+        # Caducidad (time.monotonic()) del snapshot completo del que viene; los refrescos la heredan.
+        self.expires_at = expires_at
+        self._df: Optional[pd.DataFrame] = None
+        self._kpis: Optional[KPIDashboard] = None
+
+    def dataframe(self) -> pd.DataFrame:
+        """Licitaciones facturables enriquecidas (estado_nombre, _estado_norm, _f_adj)."""
+        if self._df is None:
+            estados_map = get_maestros(supabase_client).get("estados_id_map", {})
+            df = pd.DataFrame([r for r in self.licitaciones.values() if _es_facturable(r)])
+            if df.empty:
+                self._df = df
+                return df
+            df["pres_maximo"] = pd.to_numeric(df["pres_maximo"], errors="coerce").fillna(0.0)
+            df["estado_nombre"] = df["id_estado"].map(estados_map).fillna("Desconocido")
+            df["_estado_norm"] = df["estado_nombre"].astype(str).str.strip().str.lower()
+            df["_f_adj"] = pd.to_datetime(df["fecha_adjudicacion"], errors="coerce")
+            self._df = df
+        return self._df
+
+    def kpis(self, desde: Optional[str] = None, hasta: Optional[str] = None) -> KPIDashboard:
+        """KPIs del dashboard; sin rango de fechas devuelve el resultado precalculado."""
+        if not desde and not hasta:
+            if self._kpis is None:
+                self._kpis = self._compute(self.dataframe())
+            return self._kpis
+        df = self.dataframe()
+        if df.empty:
+            return empty_kpis()
+        mask = pd.Series(True, index=df.index)
+        if desde:
+            mask = mask & (df["_f_adj"] >= pd.Timestamp(desde))
+        if hasta:
+            mask = mask & (df["_f_adj"] <= pd.Timestamp(hasta))
+        return self._compute(df[mask])
+
+    def _compute(self, df_fact: pd.DataFrame) -> KPIDashboard:
+        if df_fact.empty:
+            return empty_kpis()
+
+        # Total oportunidades = solo incluidas (ORDINARIO, CONTRATO_BASADO, ESPECIFICO_SDA)
+        total_oportunidades_uds = len(df_fact)
+        total_oportunidades_euros = float(df_fact["pres_maximo"].sum())
+
+        # Total ofertado = facturables en estados Adjudicada, No Adjudicada, Presentada, Terminada
+        mask_ofertado = df_fact["_estado_norm"].isin(ESTADOS_OFERTADO_NORM)
+        df_ofertado = df_fact[mask_ofertado]
+        total_ofertado_uds = len(df_ofertado)
+        total_ofertado_euros = float(df_ofertado["pres_maximo"].sum())
+
+        ratio_ofertado_oportunidades_uds = (
+            (total_ofertado_uds / total_oportunidades_uds * 100) if total_oportunidades_uds else 0.0
+        )
+        ratio_ofertado_oportunidades_euros = (
+            (total_ofertado_euros / total_oportunidades_euros * 100) if total_oportunidades_euros else 0.0
+        )
+
+        # Adjudicadas + Terminadas (solo facturables)
+        mask_adj_ter = df_fact["_estado_norm"].isin(ESTADOS_ADJUDICADAS_TERMINADAS_NORM)
+        count_adj_ter = mask_adj_ter.sum()
+        ratio_adjudicadas_terminadas_ofertado = (
+            (count_adj_ter / total_ofertado_uds * 100) if total_ofertado_uds else 0.0
+        )
+
+        # Margen medio ponderado a partir de las contribuciones precalculadas por licitación
+        ids_adj_ter = _to_int_ids(df_fact.loc[mask_adj_ter, "id_licitacion"].dropna().tolist())
+        margen_presu = _margen(self.margen_presupuestado, ids_adj_ter)
+        margen_real = _margen(self.margen_real, ids_adj_ter)
+
+        # % descartadas = descartadas / (total facturables - en análisis)
+        mask_des = df_fact["_estado_norm"].isin(ESTADOS_DESCARTADA_NORM)
+        mask_an_val = df_fact["_estado_norm"].isin(ESTADOS_EN_ANALISIS_NORM)
+        count_des = mask_des.sum()
+        denom = total_oportunidades_uds - mask_an_val.sum()
+        pct_descartadas_uds = (count_des / denom * 100) if denom and denom > 0 else None
+        euros_des = float(df_fact.loc[mask_des, "pres_maximo"].sum())
+        euros_total_menos_an_val = float(df_fact.loc[~mask_an_val, "pres_maximo"].sum())
+        pct_descartadas_euros = (euros_des / euros_total_menos_an_val * 100) if euros_total_menos_an_val else None
+
+        # Ratio adjudicación = (Adjudicadas+Terminadas) / (Adjudicadas+No Adjudicadas+Terminadas)
+        ratio_adjudicacion = ratio_adjudicadas_terminadas_ofertado / 100.0 if total_ofertado_uds else 0.0
+
+        return KPIDashboard(
+            timeline=timeline_records(df_fact),
+            total_oportunidades_uds=int(total_oportunidades_uds),
+            total_oportunidades_euros=total_oportunidades_euros,
+            total_ofertado_uds=int(total_ofertado_uds),
+            total_ofertado_euros=total_ofertado_euros,
+            ratio_ofertado_oportunidades_uds=round(ratio_ofertado_oportunidades_uds, 2),
+            ratio_ofertado_oportunidades_euros=round(ratio_ofertado_oportunidades_euros, 2),
+            ratio_adjudicadas_terminadas_ofertado=round(ratio_adjudicadas_terminadas_ofertado, 2),
+            margen_medio_ponderado_presupuestado=round(margen_presu, 2) if margen_presu is not None else None,
+            margen_medio_ponderado_real=round(margen_real, 2) if margen_real is not None else None,
+            pct_descartadas_uds=round(pct_descartadas_uds, 2) if pct_descartadas_uds is not None else None,
+            pct_descartadas_euros=round(pct_descartadas_euros, 2) if pct_descartadas_euros is not None else None,
+            ratio_adjudicacion=round(ratio_adjudicacion, 4),
+        )
+
+
+class KpiSnapshotStore:
+    """
+    Snapshots por organización con refresco incremental.
+
+    - get(org_id): devuelve el snapshot; lo construye si no existe o ha caducado,
+      o relee solo las licitaciones notificadas como cambiadas.
+    - notify(org_id, ids): marca licitaciones a refrescar en la próxima lectura.
+    - ttl_seconds <= 0 desactiva el snapshot (se reconstruye en cada lectura).
+    """
+
+    def __init__(self, ttl_seconds: float, maxsize: Optional[int] = None) -> None:
+        self._ttl = float(ttl_seconds)
+        self._snapshots = TTLCache(ttl_seconds=max(self._ttl, 0.0), maxsize=maxsize)
+        self._pending: Dict[str, Set[int]] = {}
+        self._lock = threading.Lock()
+        self._org_locks: Dict[str, threading.Lock] = {}
+        self.full_builds = 0
+        self.incremental_refreshes = 0
+
+    def _org_lock(self, org_id: str) -> threading.Lock:
+        with self._lock:
+            return self._org_locks.setdefault(org_id, threading.Lock())
+
+    def _take_pending(self, org_id: str) -> Set[int]:
+        with self._lock:
+            return self._pending.pop(org_id, set())
+
+    def notify(self, org_id: str, tender_ids: Iterable[Any]) -> None:
+        ids = _to_int_ids(tender_ids)
+        if not ids:
+            return
+        with self._lock:
+            self._pending.setdefault(str(org_id), set()).update(ids)
+
+    def invalidate(self, org_id: Optional[str] = None) -> None:
+        """Descarta el snapshot de una organización (o todos): se reconstruye en la próxima lectura."""
+        if org_id is None:
+            self._snapshots.clear()
+        else:
+            self._snapshots.invalidate(str(org_id))
+
+    def get(self, org_id: str) -> KpiSnapshot:
+        org_id = str(org_id)
+        with self._org_lock(org_id):
+            snap = self._snapshots.get(org_id) if self._ttl > 0 else None
+            if snap is None:
+                return self._build(org_id)
+            pending = self._take_pending(org_id)
+            if pending:
+                try:
+                    snap = self._refresh(org_id, snap, sorted(pending))
+                except Exception:
+                    # Que el aviso no se pierda: se reintenta en la siguiente lectura.
+                    self.notify(org_id, pending)
+                    raise
+            return snap
+
+    def _build(self, org_id: str) -> KpiSnapshot:
+        self._take_pending(org_id)  # lo notificado antes de empezar ya entra en la lectura completa
+        base = run_parallel({
+            "maestros": lambda: get_maestros(supabase_client),
+            "licitaciones": lambda: _fetch_licitaciones(org_id),
+        }, label="kpis")
+        estados_map = base["maestros"].get("estados_id_map", {})
+        licitaciones = {
+            int(r["id_licitacion"]): r for r in base["licitaciones"] if r.get("id_licitacion") is not None
+        }
+        ids_margen = [i for i, r in licitaciones.items() if _cuenta_para_margen(r, estados_map)]
+        margenes = compute_margenes(org_id, ids_margen)
+        snap = KpiSnapshot(
+            licitaciones,
+            _contribuciones(margenes, "presupuestado"),
+            _contribuciones(margenes, "real"),
+            expires_at=time.monotonic() + self._ttl,
+        )
+        if self._ttl > 0:
+            self._snapshots.set(org_id, snap, expires_at=snap.expires_at)
+        self.full_builds += 1
+        logger.info("Snapshot KPIs org %s: %d licitaciones, %d en margen", org_id, len(licitaciones), len(ids_margen))
+        return snap
+
+    def _refresh(self, org_id: str, snap: KpiSnapshot, ids: List[int]) -> KpiSnapshot:
+        """Nuevo snapshot con las licitaciones ids releídas; sustituye al anterior en la caché."""
+        base = run_parallel({
+            "maestros": lambda: get_maestros(supabase_client),
+            "licitaciones": lambda: _fetch_licitaciones(org_id, ids),
+        }, label="kpis_refresh")
+        estados_map = base["maestros"].get("estados_id_map", {})
+        rows = {int(r["id_licitacion"]): r for r in base["licitaciones"]}
+        ids_margen = [i for i, r in rows.items() if _cuenta_para_margen(r, estados_map)]
+        margenes = compute_margenes(org_id, ids_margen)
+        presupuestado = _contribuciones(margenes, "presupuestado")
+        real = _contribuciones(margenes, "real")
+        licitaciones = dict(snap.licitaciones)
+        margen_presupuestado = dict(snap.margen_presupuestado)
+        margen_real = dict(snap.margen_real)
+        for i in ids:
+            if i in rows:
+                licitaciones[i] = rows[i]
+            else:
+                licitaciones.pop(i, None)  # borrada
+            margen_presupuestado.pop(i, None)
+            margen_real.pop(i, None)
+        margen_presupuestado.update(presupuestado)
+        margen_real.update(real)
+        nuevo = KpiSnapshot(licitaciones, margen_presupuestado, margen_real, expires_at=snap.expires_at)
+        # Conserva la caducidad del snapshot completo: el TTL sigue recogiendo lo escrito fuera de la API.
+        self._snapshots.set(org_id, nuevo, expires_at=snap.expires_at)
+        self.incremental_refreshes += 1
+        return nuevo
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            pending = sum(len(v) for v in self._pending.values())
+        return {
+            **self._snapshots.stats(),
+            "full_builds": self.full_builds,
+            "incremental_refreshes": self.incremental_refreshes,
+            "pending_tenders": pending,
+        }
+
+
+kpi_snapshots = KpiSnapshotStore(ttl_seconds=KPI_SNAPSHOT_TTL_SECONDS, maxsize=256)
+
+
+def notify_tenders_changed(org_id: Any, tender_ids: Iterable[Any]) -> None:
+    """
+    Avisa de que licitaciones (o sus partidas/entregas) han cambiado; refresco en la próxima lectura
+    del snapshot de KPIs y de las series y estadísticas de precio de los productos afectados.
+    """
+    tender_ids = list(tender_ids)
+    kpi_snapshots.notify(str(org_id), tender_ids)
+    price_series.notify_tenders(str(org_id), tender_ids)
+    price_stats.notify_tenders(str(org_id), tender_ids)
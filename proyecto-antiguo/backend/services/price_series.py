@@ -0,0 +1,379 @@
+"""
+Series diarias de precio por producto (gráficas de tendencia y analíticas de producto).
+
+Reconstruir el histórico de un producto exige cruzar tbl_precios_referencia,
+tbl_licitaciones_detalle, tbl_licitaciones, tbl_licitaciones_real y tbl_entregas.
+Aquí se hace una vez por producto y se guarda, por día:
+
+- pvu: último PVU del día (partidas con fecha de adjudicación + precios de referencia).
+- pcu: último PCU del día (precios de referencia + líneas reales con fecha de entrega).
+- unidades: unidades vendidas (precios de referencia sin PCU, es decir, albaranes de venta).
+- pvu_tendencia: PVU para /analytics/material-trends, que además cuenta las licitaciones sin
+  adjudicar (fecha de presentación) y solo las partidas activas.
+
+junto con los agregados que usa /analytics/product (total licitado, proveedores...).
+La serie es columnar: fechas ordenadas (un rango [desde, hasta] es una búsqueda binaria)
+y un array numpy por métrica con NaN en los días sin dato.
+
+Mantenimiento incremental: notify_products_changed(org_id, ids) descarta las series de
+esos productos; notify_tenders_changed (kpi_snapshot) avisa también de las licitaciones
+cambiadas y en la siguiente lectura se descartan solo los productos con partidas en ellas.
+Lo escrito fuera de la API (scripts de importación, PHP) se recoge al caducar (PRICE_SERIES_TTL_SECONDS).
+"""
+
+import logging
+import threading
+from typing import Any, Dict, Iterable, List, Optional, Set, Tuple
+
+import numpy as np
+import pandas as pd
+
+from backend.cache import TTLCache
+from backend.config import PRICE_SERIES_TTL_SECONDS, supabase_client
+from backend.query_executor import run_parallel
+from backend.repositories.base_repository import BaseTenantRepository
+from backend.utils import to_float
+
+logger = logging.getLogger(__name__)
+
+
+def norm_date(fecha: Any) -> Optional[str]:
+    """Extrae YYYY-MM-DD de fecha (ISO o string)."""
+    if not fecha:
+        return None
+    s = str(fecha).split("T")[0] if isinstance(fecha, str) else str(fecha)[:10]
+    return s if len(s) >= 10 else None
+
+
+def _pcu_es_nulo(pcu: Any) -> bool:
+    """True si no hay coste (NULL, vacío o 0): línea de albarán de venta."""
+    if pcu is None:
+        return True
+    if isinstance(pcu, str) and (not pcu.strip() or pcu.strip().lower() == "null"):
+        return True
+    try:
+        return float(pcu) == 0
+    except (TypeError, ValueError):
+        return False
+
+
+class PriceSeries:
+    """Serie diaria de un producto (fechas ordenadas) y agregados para sus analíticas."""
+
+    __slots__ = (
+        "product_id", "nombre", "fechas", "pvu", "pcu", "unidades", "pvu_tendencia", "licitaciones",
+        "total_licitado", "proveedores", "ref_pvu_suma", "ref_pvu_n",
+    )
+
+    def __init__(self, product_id: int, nombre: str) -> None:
+        self.product_id = product_id
+        self.nombre = nombre
+        self.fechas: np.ndarray = np.array([], dtype=object)
+        self.pvu: np.ndarray = np.array([], dtype=float)
+        self.pcu: np.ndarray = np.array([], dtype=float)
+        self.unidades: np.ndarray = np.array([], dtype=float)
+        self.pvu_tendencia: np.ndarray = np.array([], dtype=float)
+        self.licitaciones: Set[int] = set()
+        self.total_licitado = 0.0
+        # proveedor -> (suma pcu, nº líneas reales); proveedor NULL como "—"
+        self.proveedores: Dict[str, Tuple[float, int]] = {}
+        self.ref_pvu_suma = 0.0
+        self.ref_pvu_n = 0
+
+    def _bounds(self, desde: Optional[str], hasta: Optional[str]) -> Tuple[int, int]:
+        lo = int(np.searchsorted(self.fechas, desde, side="left")) if desde else 0
+        hi = int(np.searchsorted(self.fechas, hasta, side="right")) if hasta else len(self.fechas)
+        return lo, hi
+
+    def _columna(
+        self, valores: np.ndarray, desde: Optional[str], hasta: Optional[str], *extra: np.ndarray,
+    ) -> Tuple[np.ndarray, ...]:
+        """Fechas y valores (y columnas extra alineadas) de los días con dato dentro del rango."""
+        lo, hi = self._bounds(desde, hasta)
+        mask = ~np.isnan(valores[lo:hi])
+        return (self.fechas[lo:hi][mask], valores[lo:hi][mask]) + tuple(col[lo:hi][mask] for col in extra)
+
+    def pvu_points(self, desde: Optional[str] = None, hasta: Optional[str] = None) -> Tuple[np.ndarray, ...]:
+        """(fechas, pvu, unidades vendidas) de los días con PVU dentro del rango."""
+        return self._columna(self.pvu, desde, hasta, self.unidades)
+
+    def pvu_tendencia_points(self, desde: Optional[str] = None, hasta: Optional[str] = None) -> Tuple[np.ndarray, ...]:
+        """(fechas, pvu) de la gráfica de tendencia dentro del rango."""
+        return self._columna(self.pvu_tendencia, desde, hasta)
+
+    def pcu_points(self, desde: Optional[str] = None, hasta: Optional[str] = None) -> Tuple[np.ndarray, ...]:
+        """(fechas, pcu) de los días con PCU dentro del rango."""
+        return self._columna(self.pcu, desde, hasta)
+
+    def competidores(self, top: int = 3) -> pd.DataFrame:
+        """Proveedores con más líneas reales: proveedor, precio_medio, cantidad_adjudicaciones."""
+        if not self.proveedores:
+            return pd.DataFrame(columns=["proveedor", "precio_medio", "cantidad_adjudicaciones"])
+        agg = pd.DataFrame([
+            {"proveedor": p, "precio_medio": suma / n, "cantidad_adjudicaciones": n}
+            for p, (suma, n) in sorted(self.proveedores.items())
+        ])
+        return agg.sort_values("cantidad_adjudicaciones", ascending=False).head(top)
+
+    @property
+    def precio_referencia_medio(self) -> Optional[float]:
+        return self.ref_pvu_suma / self.ref_pvu_n if self.ref_pvu_n else None
+
+
+def _build_series(org_id: str, product_ids: List[int]) -> Dict[int, PriceSeries]:
+    """Lee las cinco tablas para un lote de productos y construye sus series."""
+
+    def _repo(table: str, pk: str) -> BaseTenantRepository:
+        return BaseTenantRepository(supabase_client, org_id, table, pk)
+
+    base = run_parallel({
+        "productos": lambda: _repo("tbl_productos", "id").get_in("id", product_ids, "id, nombre"),
+        "detalle": lambda: _repo("tbl_licitaciones_detalle", "id_detalle").get_in(
+            "id_producto", product_ids, "id_detalle, id_producto, id_licitacion, pvu, unidades, activo",
+        ),
+        "referencia": lambda: _repo("tbl_precios_referencia", "id").get_in(
+            "id_producto", product_ids, "id_producto, pvu, pcu, unidades, fecha_presupuesto",
+        ),
+    }, label="price_series")
+    det_rows = base["detalle"]
+    id_licitaciones = list({r["id_licitacion"] for r in det_rows if r.get("id_licitacion") is not None})
+    producto_por_detalle = {
+        r["id_detalle"]: int(r["id_producto"])
+        for r in det_rows
+        if r.get("id_detalle") is not None and r.get("id_producto") is not None
+    }
+
+    def _lic_fechas() -> Tuple[Dict[int, str], Dict[int, str]]:
+        """Fecha de adjudicación y, para la tendencia, adjudicación o presentación."""
+        rows = _repo("tbl_licitaciones", "id_licitacion").get_in(
+            "id_licitacion", id_licitaciones, "id_licitacion, fecha_presentacion, fecha_adjudicacion",
+        )
+        adjudicacion: Dict[int, str] = {}
+        tendencia: Dict[int, str] = {}
+        for r in rows:
+            if r.get("id_licitacion") is None:
+                continue
+            lid = int(r["id_licitacion"])
+            if r.get("fecha_adjudicacion"):
+                adjudicacion[lid] = str(r["fecha_adjudicacion"]).split("T")[0][:10]
+            t = norm_date(r.get("fecha_adjudicacion") or r.get("fecha_presentacion"))
+            if t:
+                tendencia[lid] = t
+        return adjudicacion, tendencia
+
+    def _real_con_fechas() -> Tuple[List[Dict[str, Any]], Dict[Any, str]]:
+        real_rows = _repo("tbl_licitaciones_real", "id_real").get_in(
+            "id_detalle", list(producto_por_detalle), "id_detalle, id_entrega, pcu, proveedor",
+        )
+        id_entregas = list({r["id_entrega"] for r in real_rows if r.get("id_entrega") is not None})
+        ent_rows = _repo("tbl_entregas", "id_entrega").get_in("id_entrega", id_entregas, "id_entrega, fecha_entrega")
+        entrega_fechas = {}
+        for r in ent_rows:
+            t = norm_date(r.get("fecha_entrega"))
+            if r.get("id_entrega") is not None and t:
+                entrega_fechas[r["id_entrega"]] = t
+        return real_rows, entrega_fechas
+
+    deps = run_parallel({"fechas": _lic_fechas, "real": _real_con_fechas}, label="price_series")
+    lic_fechas, lic_fechas_tendencia = deps["fechas"]
+    real_rows, entrega_fechas = deps["real"]
+
+    series = {
+        int(r["id"]): PriceSeries(int(r["id"]), str(r.get("nombre") or ""))
+        for r in base["productos"]
+        if r.get("id") is not None
+    }
+    # Por producto y día: el último valor gana (partidas antes que referencias, como en el endpoint).
+    pvu_dia: Dict[int, Dict[str, float]] = {pid: {} for pid in series}
+    pcu_dia: Dict[int, Dict[str, float]] = {pid: {} for pid in series}
+    uds_dia: Dict[int, Dict[str, float]] = {pid: {} for pid in series}
+    # Tendencia: las partidas pisan a las referencias del mismo día.
+    tend_ref_dia: Dict[int, Dict[str, float]] = {pid: {} for pid in series}
+    tend_det_dia: Dict[int, Dict[str, float]] = {pid: {} for pid in series}
+
+    for r in det_rows:
+        s = series.get(int(r["id_producto"])) if r.get("id_producto") is not None else None
+        if s is None:
+            continue
+        id_lic = r.get("id_licitacion")
+        if id_lic is not None:
+            s.licitaciones.add(int(id_lic))
+        pvu, un = to_float(r.get("pvu")), to_float(r.get("unidades"))
+        if pvu is not None and un is not None:
+            s.total_licitado += pvu * un
+        time_str = lic_fechas.get(int(id_lic)) if id_lic is not None else None
+        if pvu is not None and time_str:
+            pvu_dia[s.product_id][time_str] = pvu
+        time_str = lic_fechas_tendencia.get(int(id_lic)) if id_lic is not None else None
+        if pvu is not None and time_str and r.get("activo") is True:
+            tend_det_dia[s.product_id][time_str] = pvu
+
+    for r in base["referencia"]:
+        s = series.get(int(r["id_producto"])) if r.get("id_producto") is not None else None
+        if s is None:
+            continue
+        fecha = r.get("fecha_presupuesto")
+        if r.get("pvu") is not None:
+            s.ref_pvu_suma += float(r["pvu"])
+            s.ref_pvu_n += 1
+            pvu, time_str = to_float(r["pvu"]), norm_date(fecha)
+            if pvu is not None and time_str:
+                pvu_dia[s.product_id][time_str] = pvu
+                tend_ref_dia[s.product_id][time_str] = pvu
+        if r.get("pcu") is not None and fecha:
+            pcu = to_float(r["pcu"])
+            if pcu is not None:
+                pcu_dia[s.product_id][str(fecha).split("T")[0][:10]] = pcu
+        if _pcu_es_nulo(r.get("pcu")):
+            time_str = norm_date(fecha)
+            qty = to_float(r.get("unidades") or 0)
+            if time_str and qty is not None:
+                uds_dia[s.product_id][time_str] = uds_dia[s.product_id].get(time_str, 0.0) + qty
+
+    for r in real_rows:
+        pid = producto_por_detalle.get(r.get("id_detalle"))
+        s = series.get(pid) if pid is not None else None
+        if s is None:
+            continue
+        proveedor = r.get("proveedor")
+        proveedor = "—" if proveedor is None else str(proveedor)
+        pcu = to_float(r.get("pcu"))
+        suma, n = s.proveedores.get(proveedor, (0.0, 0))
+        s.proveedores[proveedor] = (suma + (pcu if pcu is not None and pcu == pcu else 0.0), n + 1)
+        time_str = entrega_fechas.get(r.get("id_entrega")) if r.get("id_entrega") is not None else None
+        if pcu is not None and time_str:
+            pcu_dia[pid][time_str] = pcu
+
+    for pid, s in series.items():
+        tendencia = {**tend_ref_dia[pid], **tend_det_dia[pid]}
+        fechas = sorted(set(pvu_dia[pid]) | set(pcu_dia[pid]) | set(uds_dia[pid]) | set(tendencia))
+        s.fechas = np.array(fechas, dtype=object)
+        s.pvu_tendencia = np.array([tendencia.get(f, np.nan) for f in fechas], dtype=float)
+        s.pvu = np.array([pvu_dia[pid].get(f, np.nan) for f in fechas], dtype=float)
+        s.pcu = np.array([pcu_dia[pid].get(f, np.nan) for f in fechas], dtype=float)
+        s.unidades = np.array([uds_dia[pid].get(f, 0.0) for f in fechas], dtype=float)
+    return series
+
+
+def productos_en_licitaciones(org_id: str, tender_ids: Iterable[int]) -> Set[int]:
+    """Productos con alguna partida en esas licitaciones."""
+    repo = BaseTenantRepository(supabase_client, org_id, "tbl_licitaciones_detalle", "id_detalle")
+    return {
+        int(r["id_producto"])
+        for r in repo.get_in("id_licitacion", sorted(tender_ids), "id_producto")
+        if r.get("id_producto") is not None
+    }
+
+
+class PriceSeriesStore:
+    """
+    Series por (organización, producto) con TTL e invalidación por producto o por licitación.
+
+    - get_many(org_id, ids): devuelve las series cacheadas y construye en un solo lote las que falten.
+    - notify_products(org_id, ids): descarta esas series.
+    - notify_tenders(org_id, ids): en la siguiente lectura descarta los productos con partidas en esas licitaciones.
+
+    Cada aviso sube una versión (por producto en notify_products, por organización en
+    notify_tenders e invalidate); get_many solo guarda una serie construida si la versión no ha
+    cambiado mientras se leía, para no cachear datos anteriores a una escritura concurrente.
+    """
+
+    def __init__(self, ttl_seconds: float, maxsize: Optional[int] = None) -> None:
+        self._ttl = float(ttl_seconds)
+        self._series = TTLCache(ttl_seconds=max(self._ttl, 0.0), maxsize=maxsize)
+        self._pending_tenders: Dict[str, Set[int]] = {}
+        # Versiones por (org, producto) y por organización; solo suben.
+        self._versiones: Dict[Tuple[str, int], int] = {}
+        self._versiones_org: Dict[str, int] = {}
+        self._version_global = 0
+        self._lock = threading.Lock()
+        self.builds = 0
+
+    def _version(self, org_id: str, product_id: int) -> Tuple[int, int, int]:
+        return (
+            self._version_global,
+            self._versiones_org.get(org_id, 0),
+            self._versiones.get((org_id, product_id), 0),
+        )
+
+    def notify_products(self, org_id: str, product_ids: Iterable[Any]) -> None:
+        org_id = str(org_id)
+        ids = {int(i) for i in product_ids if i is not None}
+        if ids:
+            with self._lock:
+                for pid in ids:
+                    self._versiones[(org_id, pid)] = self._versiones.get((org_id, pid), 0) + 1
+                self._series.invalidate_where(lambda k, _v: k[0] == org_id and k[1] in ids)
+
+    def notify_tenders(self, org_id: str, tender_ids: Iterable[Any]) -> None:
+        org_id = str(org_id)
+        ids = {int(i) for i in tender_ids if i is not None}
+        if ids:
+            with self._lock:
+                self._pending_tenders.setdefault(org_id, set()).update(ids)
+                # Aún no se sabe qué productos afecta: vale para toda la organización.
+                self._versiones_org[org_id] = self._versiones_org.get(org_id, 0) + 1
+
+    def invalidate(self, org_id: Optional[str] = None) -> None:
+        with self._lock:
+            if org_id is None:
+                self._version_global += 1
+                self._series.clear()
+            else:
+                self._versiones_org[str(org_id)] = self._versiones_org.get(str(org_id), 0) + 1
+                self._series.invalidate_where(lambda k, _v: k[0] == str(org_id))
+
+    def _apply_pending(self, org_id: str) -> None:
+        with self._lock:
+            tenders = self._pending_tenders.pop(org_id, set())
+        if not tenders:
+            return
+        # Productos con partidas ahora en esas licitaciones (altas) o antes (bajas: ya en la serie).
+        afectados = productos_en_licitaciones(org_id, tenders)
+        self._series.invalidate_where(
+            lambda k, v: k[0] == org_id and (k[1] in afectados or not v.licitaciones.isdisjoint(tenders))
+        )
+
+    def get_many(self, org_id: str, product_ids: Iterable[Any]) -> Dict[int, PriceSeries]:
+        """Series de los productos pedidos que existen en la organización."""
+        org_id = str(org_id)
+        ids = list(dict.fromkeys(int(i) for i in product_ids if i is not None))
+        self._apply_pending(org_id)
+        out: Dict[int, PriceSeries] = {}
+        faltan: List[int] = []
+        for pid in ids:
+            s = self._series.get((org_id, pid)) if self._ttl > 0 else None
+            if s is None:
+                faltan.append(pid)
+            else:
+                out[pid] = s
+        if faltan:
+            with self._lock:
+                versiones = {pid: self._version(org_id, pid) for pid in faltan}
+            nuevas = _build_series(org_id, faltan)
+            self.builds += 1
+            logger.debug("Series de precio org %s: %d productos construidos", org_id, len(nuevas))
+            if self._ttl > 0:
+                # Las que recibieron un aviso durante la lectura se devuelven, pero no se cachean.
+                with self._lock:
+                    for pid, s in nuevas.items():
+                        if self._version(org_id, pid) == versiones[pid]:
+                            self._series.set((org_id, pid), s)
+            out.update(nuevas)
+        return {pid: out[pid] for pid in ids if pid in out}
+
+    def get(self, org_id: str, product_id: int) -> Optional[PriceSeries]:
+        return self.get_many(org_id, [product_id]).get(int(product_id))
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            pending = sum(len(v) for v in self._pending_tenders.values())
+        return {**self._series.stats(), "builds": self.builds, "pending_tenders": pending}
+
+
+price_series = PriceSeriesStore(ttl_seconds=PRICE_SERIES_TTL_SECONDS, maxsize=20000)
+
+
+def notify_products_changed(org_id: Any, product_ids: Iterable[Any]) -> None:
+    """Avisa de que cambiaron precios de referencia de estos productos."""
+    price_series.notify_products(str(org_id), product_ids)
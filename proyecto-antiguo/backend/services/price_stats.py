@@ -0,0 +1,230 @@
+"""
+Estadísticas de PVU por producto para /analytics/price-deviation-check.
+
+La comprobación de desviación se llama mientras el usuario teclea precios en el presupuesto:
+en vez de releer tbl_precios_referencia y tbl_licitaciones_detalle en cada llamada, se guarda
+por producto la muestra de PVU que usa el endpoint:
+
+- precios de referencia con PVU y fecha, ordenados por fecha: la ventana móvil del último año
+  (fecha >= hoy - 365 días) es una búsqueda binaria sobre el array de fechas;
+- PVU de las partidas activas (sin filtro de fecha, como el endpoint).
+
+resumen_pvu() combina la muestra de varios productos (nº, media, mediana, desviación típica).
+
+Mantenimiento: notify_reference_prices(org_id, filas) descarta las estadísticas de los productos
+de los precios de referencia recién insertados (se releen en la siguiente lectura);
+notify_tenders_changed (kpi_snapshot) marca licitaciones cambiadas y en la siguiente lectura se
+descartan solo los productos con partidas en ellas. Como en PriceSeriesStore, cada aviso sube una
+versión y no se cachea lo construido mientras llegaba un aviso. Lo escrito fuera de la API se
+recoge al caducar (PRICE_SERIES_TTL_SECONDS).
+"""
+
+import logging
+import threading
+from typing import Any, Dict, Iterable, List, Optional, Set, Tuple
+
+import numpy as np
+
+from backend.cache import TTLCache
+from backend.config import PRICE_SERIES_TTL_SECONDS, supabase_client
+from backend.query_executor import run_parallel
+from backend.repositories.base_repository import BaseTenantRepository
+from backend.services.price_series import norm_date, productos_en_licitaciones
+from backend.utils import to_float
+
+logger = logging.getLogger(__name__)
+
+
+class PriceStats:
+    """Muestra de PVU de un producto: referencias ordenadas por fecha y partidas activas."""
+
+    __slots__ = ("product_id", "ref", "detalle_pvu", "licitaciones")
+
+    def __init__(self, product_id: int) -> None:
+        self.product_id = product_id
+        # (fechas ordenadas, pvu alineados).
+        self.ref: Tuple[np.ndarray, np.ndarray] = (np.array([], dtype=object), np.array([], dtype=float))
+        self.detalle_pvu: np.ndarray = np.array([], dtype=float)
+        self.licitaciones: Set[int] = set()
+
+    def muestra(self, desde: str) -> np.ndarray:
+        """PVU de referencias con fecha >= desde más los PVU de partidas activas."""
+        fechas, valores = self.ref
+        i = int(np.searchsorted(fechas, desde, side="left"))
+        return np.concatenate((valores[i:], self.detalle_pvu))
+
+
+def resumen_pvu(stats: Iterable[PriceStats], desde: str) -> Optional[Dict[str, float]]:
+    """
+    Nº de precios, media, mediana y desviación típica (poblacional) de la muestra conjunta
+    de los productos; None si no hay ningún precio.
+    """
+    partes = [s.muestra(desde) for s in stats]
+    valores = np.concatenate(partes) if partes else np.array([], dtype=float)
+    if not len(valores):
+        return None
+    return {
+        "n": int(len(valores)),
+        "media": float(valores.mean()),
+        "mediana": float(np.median(valores)),
+        "desviacion": float(valores.std()),
+    }
+
+
+def _build_stats(org_id: str, product_ids: List[int]) -> Dict[int, PriceStats]:
+    """Lee referencias y partidas activas de un lote de productos."""
+
+    def _repo(table: str, pk: str) -> BaseTenantRepository:
+        return BaseTenantRepository(supabase_client, org_id, table, pk)
+
+    rows = run_parallel({
+        "referencia": lambda: _repo("tbl_precios_referencia", "id").get_in(
+            "id_producto", product_ids, "id_producto, pvu, fecha_presupuesto",
+        ),
+        "detalle": lambda: _repo("tbl_licitaciones_detalle", "id_detalle").get_in(
+            "id_producto", product_ids, "id_producto, id_licitacion, pvu", activo=True,
+        ),
+    }, label="price_stats")
+
+    stats = {pid: PriceStats(pid) for pid in product_ids}
+    ref: Dict[int, List[Tuple[str, float]]] = {pid: [] for pid in product_ids}
+    for r in rows["referencia"]:
+        pid = int(r["id_producto"]) if r.get("id_producto") is not None else None
+        pvu = to_float(r.get("pvu"))
+        if pid in ref and pvu is not None and norm_date(r.get("fecha_presupuesto")):
+            ref[pid].append((str(r["fecha_presupuesto"])[:10], pvu))
+    det: Dict[int, List[float]] = {pid: [] for pid in product_ids}
+    for r in rows["detalle"]:
+        pid = int(r["id_producto"]) if r.get("id_producto") is not None else None
+        if pid not in det:
+            continue
+        if r.get("id_licitacion") is not None:
+            stats[pid].licitaciones.add(int(r["id_licitacion"]))
+        pvu = to_float(r.get("pvu"))
+        if pvu is not None:
+            det[pid].append(pvu)
+
+    for pid, s in stats.items():
+        ref[pid].sort(key=lambda t: t[0])
+        s.ref = (np.array([f for f, _ in ref[pid]], dtype=object), np.array([v for _, v in ref[pid]], dtype=float))
+        s.detalle_pvu = np.array(det[pid], dtype=float)
+    return stats
+
+
+class PriceStatsStore:
+    """
+    PriceStats por (organización, producto) con TTL.
+
+    - get_many(org_id, ids): devuelve las cacheadas y construye en un solo lote las que falten.
+    - notify_products(org_id, ids): descarta las de esos productos (p. ej. precios de referencia nuevos).
+    - notify_tenders(org_id, ids): en la siguiente lectura descarta los productos con partidas en esas licitaciones.
+
+    Cada aviso sube una versión (por producto en notify_products, por organización en
+    notify_tenders e invalidate); get_many solo guarda lo construido si la versión no ha cambiado
+    mientras se leía. Los avisos descartan en vez de sumar a lo cacheado: una construcción que ya
+    leyó la fila nueva no la cuenta dos veces.
+    """
+
+    def __init__(self, ttl_seconds: float, maxsize: Optional[int] = None) -> None:
+        self._ttl = float(ttl_seconds)
+        self._stats = TTLCache(ttl_seconds=max(self._ttl, 0.0), maxsize=maxsize)
+        self._pending_tenders: Dict[str, Set[int]] = {}
+        # Versiones por (org, producto) y por organización; solo suben.
+        self._versiones: Dict[Tuple[str, int], int] = {}
+        self._versiones_org: Dict[str, int] = {}
+        self._version_global = 0
+        self._lock = threading.Lock()
+        self.builds = 0
+
+    def _version(self, org_id: str, product_id: int) -> Tuple[int, int, int]:
+        return (
+            self._version_global,
+            self._versiones_org.get(org_id, 0),
+            self._versiones.get((org_id, product_id), 0),
+        )
+
+    def notify_products(self, org_id: str, product_ids: Iterable[Any]) -> None:
+        org_id = str(org_id)
+        ids = {int(i) for i in product_ids if i is not None}
+        if ids:
+            with self._lock:
+                for pid in ids:
+                    self._versiones[(org_id, pid)] = self._versiones.get((org_id, pid), 0) + 1
+                self._stats.invalidate_where(lambda k, _v: k[0] == org_id and k[1] in ids)
+
+    def notify_tenders(self, org_id: str, tender_ids: Iterable[Any]) -> None:
+        org_id = str(org_id)
+        ids = {int(i) for i in tender_ids if i is not None}
+        if ids:
+            with self._lock:
+                self._pending_tenders.setdefault(org_id, set()).update(ids)
+                # Aún no se sabe qué productos afecta: vale para toda la organización.
+                self._versiones_org[org_id] = self._versiones_org.get(org_id, 0) + 1
+
+    def invalidate(self, org_id: Optional[str] = None) -> None:
+        with self._lock:
+            if org_id is None:
+                self._version_global += 1
+                self._stats.clear()
+            else:
+                self._versiones_org[str(org_id)] = self._versiones_org.get(str(org_id), 0) + 1
+                self._stats.invalidate_where(lambda k, _v: k[0] == str(org_id))
+
+    def _apply_pending(self, org_id: str) -> None:
+        with self._lock:
+            tenders = self._pending_tenders.pop(org_id, set())
+        if not tenders:
+            return
+        try:
+            afectados = productos_en_licitaciones(org_id, tenders)
+        except Exception:
+            # Sin la consulta no se sabe qué descartar: se vuelven a encolar para la próxima lectura.
+            with self._lock:
+                self._pending_tenders.setdefault(org_id, set()).update(tenders)
+            raise
+        self._stats.invalidate_where(
+            lambda k, v: k[0] == org_id and (k[1] in afectados or not v.licitaciones.isdisjoint(tenders))
+        )
+
+    def get_many(self, org_id: str, product_ids: Iterable[Any]) -> Dict[int, PriceStats]:
+        org_id = str(org_id)
+        ids = list(dict.fromkeys(int(i) for i in product_ids if i is not None))
+        self._apply_pending(org_id)
+        out: Dict[int, PriceStats] = {}
+        faltan: List[int] = []
+        for pid in ids:
+            s = self._stats.get((org_id, pid)) if self._ttl > 0 else None
+            if s is None:
+                faltan.append(pid)
+            else:
+                out[pid] = s
+        if faltan:
+            with self._lock:
+                versiones = {pid: self._version(org_id, pid) for pid in faltan}
+            nuevas = _build_stats(org_id, faltan)
+            self.builds += 1
+            logger.debug("Estadísticas de precio org %s: %d productos construidos", org_id, len(nuevas))
+            if self._ttl > 0:
+                # Las que recibieron un aviso durante la lectura se devuelven, pero no se cachean.
+                with self._lock:
+                    for pid, s in nuevas.items():
+                        if self._version(org_id, pid) == versiones[pid]:
+                            self._stats.set((org_id, pid), s)
+            out.update(nuevas)
+        return {pid: out[pid] for pid in ids if pid in out}
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            pending = sum(len(v) for v in self._pending_tenders.values())
+        return {**self._stats.stats(), "builds": self.builds, "pending_tenders": pending}
+
+
+price_stats = PriceStatsStore(ttl_seconds=PRICE_SERIES_TTL_SECONDS, maxsize=20000)
+
+
+def notify_reference_prices(org_id: Any, rows: Iterable[Dict[str, Any]]) -> None:
+    """Avisa de precios de referencia recién insertados (filas devueltas por el insert)."""
+    price_stats.notify_products(str(org_id), (
+        r.get("id_producto") for r in rows
+        if to_float(r.get("pvu")) is not None and norm_date(r.get("fecha_presupuesto"))
+    ))
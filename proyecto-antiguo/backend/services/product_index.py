@@ -0,0 +1,380 @@
+"""
+Índice en memoria de nombres y referencias de producto por organización.
+
+Los endpoints de analítica por material (/analytics/material-trends, /analytics/price-deviation-check)
+resolvían material_name con un ilike('%nombre%') sobre tbl_productos en cada llamada. Aquí se
+carga una vez el catálogo de la organización y se indexa:
+
+- nombre normalizado: minúsculas, sin tildes ni diacríticos y con los espacios colapsados
+  ("  Plátano   Canario" -> "platano canario"); la consulta se normaliza igual.
+- trigramas: cada trigrama del nombre normalizado -> ids que lo contienen. Una búsqueda
+  "contiene" interseca las listas de los trigramas de la consulta y confirma los candidatos
+  con una comparación de subcadena, así que devuelve lo mismo que un ILIKE '%texto%' sobre
+  los nombres normalizados (los % y _ de la consulta se tratan como texto literal).
+
+Se indexan igual el nombre y la referencia. Todos los endpoints resuelven con el mismo índice,
+así que obtienen el mismo conjunto de ids.
+
+El buscador histórico (/search) solo quiere productos con histórico de precios (precios de
+referencia o partidas activas): los candidatos se filtran con PriceHistoryRepository, que mantiene
+por organización el conjunto de productos con histórico.
+
+El combobox de productos (/productos/search) usa el autocompletado del índice: nombres
+normalizados ordenados (rango por bisect para "empieza por"), resultados por relevancia y el
+nombre del proveedor ya resuelto.
+
+El catálogo lo mantienen fuera de la API (PHP, scripts): se reconstruye en segundo plano al
+caducar (PRODUCT_INDEX_TTL_SECONDS), sin más de una reconstrucción cada
+PRODUCT_INDEX_REFRESH_DEBOUNCE_SECONDS.
+"""
+
+import bisect
+import itertools
+import logging
+import re
+import threading
+import time
+import unicodedata
+from typing import Any, Dict, Iterable, Iterator, List, Optional, Set, Tuple
+
+import numpy as np
+
+from backend.config import (
+    PRODUCT_INDEX_REFRESH_DEBOUNCE_SECONDS,
+    PRODUCT_INDEX_TTL_SECONDS,
+    SUPABASE_IN_CHUNK_SIZE,
+    supabase_client,
+)
+from backend.repositories.base_repository import BaseTenantRepository
+from backend.repositories.price_history_repository import PriceHistoryRepository
+
+logger = logging.getLogger(__name__)
+
+_ESPACIOS = re.compile(r"\s+")
+_MAX_CHAR = chr(0x10FFFF)
+
+
+def normalizar(texto: Any) -> str:
+    """Texto comparable: sin tildes/diacríticos, casefold y espacios colapsados."""
+    if texto is None:
+        return ""
+    descompuesto = unicodedata.normalize("NFKD", str(texto))
+    sin_marcas = "".join(c for c in descompuesto if not unicodedata.combining(c))
+    return _ESPACIOS.sub(" ", sin_marcas.casefold()).strip()
+
+
+def trigramas(texto: str) -> Set[str]:
+    """Trigramas (subcadenas de 3 caracteres) de un texto ya normalizado."""
+    return {texto[i:i + 3] for i in range(len(texto) - 2)}
+
+
+class _TrigramIndex:
+    """Textos normalizados por id y sus trigramas; búsqueda "contiene" (ILIKE '%texto%')."""
+
+    __slots__ = ("textos", "_trigramas")
+
+    def __init__(self) -> None:
+        self.textos: Dict[int, str] = {}
+        self._trigramas: Dict[str, Set[int]] = {}
+
+    def add(self, pid: int, texto: Any) -> None:
+        norm = normalizar(texto)
+        self.textos[pid] = norm
+        for tri in trigramas(norm):
+            self._trigramas.setdefault(tri, set()).add(pid)
+
+    def buscar(self, texto: str) -> List[int]:
+        """Ids (ordenados) cuyo texto normalizado contiene texto normalizado."""
+        q = normalizar(texto)
+        if not q:
+            return sorted(self.textos)
+        if len(q) < 3:
+            return sorted(pid for pid, norm in self.textos.items() if q in norm)
+        listas = sorted((self._trigramas.get(tri, set()) for tri in trigramas(q)), key=len)
+        if not listas[0]:
+            return []
+        candidatos = set(listas[0]).intersection(*listas[1:])
+        return sorted(pid for pid in candidatos if q in self.textos[pid])
+
+
+class _Typeahead:
+    """
+    Autocompletado sobre nombres normalizados, todo en arrays ordenados:
+
+    - nombres en orden alfabético: los que empiezan por la consulta son un rango contiguo (bisect);
+    - sufijos que empiezan en cada palabra interior ("rosa canario" -> "canario"), ordenados: los
+      nombres con una palabra que empieza por la consulta son otro rango;
+    - los nombres unidos en un solo texto (en el mismo orden): el resto de coincidencias "contiene"
+      salen con str.find ya ordenadas, y solo hasta donde se necesiten.
+    """
+
+    __slots__ = ("orden", "_nombres", "_texto", "_inicios", "_sufijos", "_sufijo_pos")
+
+    def __init__(self, nombres: Dict[int, str]) -> None:
+        # Orden alfabético (nombre normalizado, id): la posición en esta lista ordena los resultados.
+        self.orden: List[int] = sorted(nombres, key=lambda pid: (nombres[pid], pid))
+        self._nombres: List[str] = [nombres[pid] for pid in self.orden]
+        self._texto = "\n".join(self._nombres)
+        self._inicios: List[int] = []
+        offset = 0
+        for nombre in self._nombres:
+            self._inicios.append(offset)
+            offset += len(nombre) + 1
+        sufijos = sorted(
+            (nombre[i + 1:], pos)
+            for pos, nombre in enumerate(self._nombres)
+            for i, c in enumerate(nombre)
+            if c == " "
+        )
+        self._sufijos: List[str] = [suf for suf, _ in sufijos]
+        self._sufijo_pos = np.array([pos for _, pos in sufijos], dtype=np.int64)
+
+    def posiciones(self, q: str) -> Iterator[int]:
+        """Posiciones (en orden) de los nombres que contienen q, por grupos de relevancia."""
+        a = bisect.bisect_left(self._nombres, q)
+        b = bisect.bisect_left(self._nombres, q + _MAX_CHAR, a)
+        yield from range(a, b)
+
+        lo = bisect.bisect_left(self._sufijos, q)
+        hi = bisect.bisect_left(self._sufijos, q + _MAX_CHAR, lo)
+        palabra = np.unique(self._sufijo_pos[lo:hi])
+        palabra = palabra[(palabra < a) | (palabra >= b)]
+        yield from palabra.tolist()
+
+        vistos = set(palabra.tolist())
+        i = self._texto.find(q)
+        while i != -1:
+            pos = bisect.bisect_right(self._inicios, i) - 1
+            if not (a <= pos < b or pos in vistos):
+                yield pos
+            if pos + 1 >= len(self._inicios):
+                return
+            i = self._texto.find(q, self._inicios[pos + 1])
+
+
+class ProductNameIndex:
+    """
+    Nombres y referencias normalizados de los productos de una organización, con sus trigramas,
+    y el autocompletado por nombre (nombre y proveedor ya resueltos para el combobox).
+    """
+
+    __slots__ = ("_nombre", "_referencia", "_typeahead", "fichas")
+
+    def __init__(self, productos: Iterable[Dict[str, Any]], proveedores: Optional[Dict[int, str]] = None) -> None:
+        self._nombre = _TrigramIndex()
+        self._referencia = _TrigramIndex()
+        # id -> (nombre tal cual, nombre del proveedor resuelto)
+        self.fichas: Dict[int, Tuple[str, Optional[str]]] = {}
+        proveedores = proveedores or {}
+        for r in productos:
+            if r.get("id") is None:
+                continue
+            pid = int(r["id"])
+            self._nombre.add(pid, r.get("nombre"))
+            if r.get("referencia"):
+                self._referencia.add(pid, r.get("referencia"))
+            proveedor = proveedores.get(int(r["id_proveedor"])) if r.get("id_proveedor") is not None else None
+            self.fichas[pid] = (
+                r.get("nombre") or "",
+                proveedor or (r.get("nombre_proveedor") or "").strip() or None,
+            )
+        self._typeahead = _Typeahead(self._nombre.textos)
+
+    @property
+    def nombres(self) -> Dict[int, str]:
+        return self._nombre.textos
+
+    def __len__(self) -> int:
+        return len(self._nombre.textos)
+
+    def buscar(self, texto: str) -> List[int]:
+        """Ids (ordenados) cuyo nombre normalizado contiene texto normalizado."""
+        return self._nombre.buscar(texto)
+
+    def buscar_referencia(self, texto: str) -> List[int]:
+        """Ids (ordenados) cuya referencia normalizada contiene texto normalizado."""
+        return self._referencia.buscar(texto)
+
+    def sugerencias(self, texto: str) -> Iterator[int]:
+        """
+        Ids cuyo nombre contiene texto, por relevancia: primero los que empiezan por texto, luego
+        los que tienen una palabra que empieza por texto y al final el resto; dentro de cada grupo,
+        por nombre. Generador: cada grupo solo se calcula si se piden más resultados.
+        """
+        q = normalizar(texto)
+        if not q:
+            return iter(self._typeahead.orden)
+        return (self._typeahead.orden[pos] for pos in self._typeahead.posiciones(q))
+
+
+def _build_index(org_id: str) -> ProductNameIndex:
+    """Lee el catálogo y los proveedores de la organización y construye el índice."""
+
+    def _proveedores() -> Dict[int, str]:
+        # Si tbl_proveedores no existe o falla, se usa nombre_proveedor de tbl_productos.
+        try:
+            repo = BaseTenantRepository(supabase_client, org_id, "tbl_proveedores", "id")
+            return {
+                int(p["id"]): (p.get("nombre") or "").strip()
+                for p in repo.iter_all("id, nombre")
+                if p.get("id") is not None and (p.get("nombre") or "").strip()
+            }
+        except Exception:
+            logger.warning("Índice de productos org %s: sin tbl_proveedores", org_id, exc_info=True)
+            return {}
+
+    # Catálogo con páginas en paralelo (fuera de run_parallel, que no anida) y luego los proveedores.
+    repo = BaseTenantRepository(supabase_client, org_id, "tbl_productos", "id")
+    productos = list(repo.iter_all("id, nombre, referencia, id_proveedor, nombre_proveedor", parallel=True))
+    index = ProductNameIndex(productos, _proveedores())
+    logger.debug("Índice de productos org %s: %d nombres", org_id, len(index))
+    return index
+
+
+class ProductIndexStore:
+    """
+    Un ProductNameIndex por organización.
+
+    La primera lectura lo construye (una sola vez por organización aunque lleguen muchas
+    peticiones a la vez: las demás esperan a esa construcción); después, si ha caducado (TTL) o
+    falló la última reconstrucción, se sigue sirviendo el índice actual mientras otro hilo lo
+    reconstruye: el autocompletado nunca espera a releer tbl_productos. Como mucho una
+    reconstrucción por organización a la vez y no más de una cada debounce_seconds.
+    invalidate(org_id) descarta el índice y obliga a reconstruir en la siguiente lectura.
+    """
+
+    def __init__(self, ttl_seconds: float, debounce_seconds: float = 0.0) -> None:
+        self._ttl = float(ttl_seconds)
+        self._debounce = float(debounce_seconds)
+        # org -> (índice, instante de construcción en time.monotonic())
+        self._indices: Dict[str, Tuple[ProductNameIndex, float]] = {}
+        # Organizaciones cuya última reconstrucción falló (se reintenta en la siguiente lectura).
+        self._pendientes: Set[str] = set()
+        self._reconstruyendo: Set[str] = set()
+        # org -> lock de la primera construcción (las lecturas en frío no la repiten en paralelo).
+        self._build_locks: Dict[str, threading.Lock] = {}
+        self._lock = threading.Lock()
+        self.builds = 0
+
+    def _build(self, org_id: str) -> ProductNameIndex:
+        self.builds += 1
+        return _build_index(org_id)
+
+    def get(self, org_id: str) -> ProductNameIndex:
+        org_id = str(org_id)
+        if self._ttl <= 0:
+            return self._build(org_id)
+        with self._lock:
+            entry = self._indices.get(org_id)
+        if entry is None:
+            return self._primera_construccion(org_id)
+        index, construido = entry
+        if org_id in self._pendientes or time.monotonic() - construido >= self._ttl:
+            self._programar_reconstruccion(org_id, construido)
+        return index
+
+    def _primera_construccion(self, org_id: str) -> ProductNameIndex:
+        with self._lock:
+            build_lock = self._build_locks.setdefault(org_id, threading.Lock())
+        with build_lock:
+            # Otra petición pudo construirlo mientras se esperaba el lock.
+            with self._lock:
+                entry = self._indices.get(org_id)
+            if entry is not None:
+                return entry[0]
+            index = self._build(org_id)
+            with self._lock:
+                self._indices[org_id] = (index, time.monotonic())
+            return index
+
+    def _programar_reconstruccion(self, org_id: str, construido: float) -> None:
+        with self._lock:
+            if org_id in self._reconstruyendo or time.monotonic() - construido < self._debounce:
+                return
+            self._reconstruyendo.add(org_id)
+            self._pendientes.discard(org_id)
+        threading.Thread(
+            target=self._reconstruir, args=(org_id,), name=f"product-index-{org_id}", daemon=True,
+        ).start()
+
+    def _reconstruir(self, org_id: str) -> None:
+        try:
+            index = self._build(org_id)
+            with self._lock:
+                self._indices[org_id] = (index, time.monotonic())
+        except Exception:
+            logger.exception("Error reconstruyendo el índice de productos de la org %s", org_id)
+            with self._lock:
+                self._pendientes.add(org_id)
+        finally:
+            with self._lock:
+                self._reconstruyendo.discard(org_id)
+
+    def buscar(self, org_id: str, texto: str) -> List[int]:
+        return self.get(org_id).buscar(texto)
+
+    def autocompletar(
+        self, org_id: str, texto: str, limite: int, solo_con_historico: bool = False,
+    ) -> List[Tuple[int, str, Optional[str]]]:
+        """
+        (id, nombre, proveedor) de los primeros `limite` productos por relevancia (sugerencias).
+        solo_con_historico: se descartan los productos sin precios ni partidas; el histórico se
+        comprueba por tandas de candidatos hasta completar el límite (O(1) por candidato en
+        cuanto el conjunto de la organización está construido).
+        """
+        org_id = str(org_id)
+        index = self.get(org_id)
+        candidatos = index.sugerencias(texto)
+        if not solo_con_historico:
+            ids = list(itertools.islice(candidatos, limite))
+        else:
+            ids = []
+            while len(ids) < limite:
+                tanda = list(itertools.islice(candidatos, SUPABASE_IN_CHUNK_SIZE))
+                if not tanda:
+                    break
+                con = self.con_historico(org_id, tanda)
+                ids.extend(pid for pid in tanda if pid in con)
+            ids = ids[:limite]
+        return [(pid, *index.fichas[pid]) for pid in ids]
+
+    def con_historico(self, org_id: str, product_ids: Iterable[int]) -> Set[int]:
+        """Los productos (de la lista) con precios de referencia o partidas activas."""
+        return PriceHistoryRepository(supabase_client, str(org_id)).filter_with_history(product_ids)
+
+    def buscar_con_historico(self, org_id: str, texto: str, limite: Optional[int] = None) -> List[int]:
+        """
+        Productos cuyo nombre o referencia contiene texto y que tienen histórico de precios.
+        limite: máximo de productos por coincidencia de nombre y por coincidencia de referencia.
+        """
+        index = self.get(str(org_id))
+        por_nombre = index.buscar(texto)
+        por_referencia = index.buscar_referencia(texto)
+        con = self.con_historico(str(org_id), set(por_nombre) | set(por_referencia))
+        elegidos = [pid for pid in por_nombre if pid in con][:limite]
+        elegidos += [pid for pid in por_referencia if pid in con][:limite]
+        return sorted(set(elegidos))
+
+    def invalidate(self, org_id: Optional[str] = None) -> None:
+        with self._lock:
+            if org_id is None:
+                self._indices.clear()
+            else:
+                self._indices.pop(str(org_id), None)
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            return {
+                "size": len(self._indices),
+                "builds": self.builds,
+                "pending": len(self._pendientes),
+                "rebuilding": len(self._reconstruyendo),
+                "ttl_seconds": self._ttl,
+                "debounce_seconds": self._debounce,
+            }
+
+
+product_index = ProductIndexStore(
+    ttl_seconds=PRODUCT_INDEX_TTL_SECONDS, debounce_seconds=PRODUCT_INDEX_REFRESH_DEBOUNCE_SECONDS,
+)
+
@@ -8,7 +8,7 @@ Recibe TendersRepository por inyección. Lanza excepciones de dominio
 import logging
 from datetime import date
 from decimal import Decimal
-from typing import Any, Dict, List, Optional
+from typing import Any, Dict, Iterator, List, Optional
 
 from backend.schemas.tenders import (
     ESTADOS_BLOQUEO_EDICION,
@@ -22,6 +22,7 @@ from backend.schemas.tenders import (
 )
 from backend.repositories.tenders_repository import TendersRepository
 from backend.services.exceptions import ConflictError, NotFoundError
+from backend.services.kpi_snapshot import notify_tenders_changed
 
 # Campos que no se pueden modificar cuando estado >= PRESENTADA
 CAMPOS_BLOQUEADOS_EDICION = {
@@ -71,6 +72,10 @@ class TenderService:
     def __init__(self, repository: TendersRepository) -> None:
         self._repo = repository
 
+    def _notify_kpis(self, tender_id: Any) -> None:
+        """Marca la licitación para refrescar el snapshot de KPIs del dashboard."""
+        notify_tenders_changed(self._repo.organization_id, [tender_id])
+
     def list_tenders(
         self,
         estado_id: Optional[int] = None,
@@ -80,6 +85,15 @@ class TenderService:
         """Lista licitaciones con filtros opcionales. Contratos Basado (id_licitacion_padre) se tratan como licitaciones estándar e individuales en el listado, sin subdivisiones de lotes anidadas."""
         return self._repo.list_tenders(estado_id=estado_id, nombre=nombre, pais=pais)
 
+    def iter_tenders(
+        self,
+        estado_id: Optional[int] = None,
+        nombre: Optional[str] = None,
+        pais: Optional[str] = None,
+    ) -> Iterator[Dict[str, Any]]:
+        """Como list_tenders, pero generador (para respuestas en streaming)."""
+        return self._repo.iter_tenders(estado_id=estado_id, nombre=nombre, pais=pais)
+
     def get_tender(self, tender_id: int) -> Dict[str, Any]:
         """Detalle de licitación con partidas. Lanza NotFoundError si no existe."""
         out = self._repo.get_tender_with_details(tender_id)
@@ -121,7 +135,9 @@ class TenderService:
             "tipo_procedimiento": tipo.value if isinstance(tipo, TipoProcedimiento) else tipo,
             "id_licitacion_padre": payload.id_licitacion_padre,
         }
-        return self._repo.create(row)
+        created = self._repo.create(row)
+        self._notify_kpis(created.get("id_licitacion"))
+        return created
 
     def _is_edition_blocked(self, tender_id: int) -> bool:
         """True si la licitación está en un estado que bloquea edición económica."""
@@ -155,6 +171,7 @@ class TenderService:
             update_data = {k: v for k, v in update_data.items() if k in CAMPOS_PERMITIDOS_CUANDO_BLOQUEADO}
 
         updated = self._repo.update(tender_id, update_data)
+        self._notify_kpis(tender_id)
         return updated
 
     def delete_tender(self, tender_id: int) -> None:
@@ -163,6 +180,7 @@ class TenderService:
         if not existing:
             raise NotFoundError("Licitación no encontrada.")
         self._repo.delete(tender_id)
+        self._notify_kpis(tender_id)
 
     def change_tender_status(self, tender_id: int, payload: TenderStatusChange) -> Dict[str, Any]:
         """
@@ -244,6 +262,7 @@ class TenderService:
             raise ConflictError(
                 "Conflicto de concurrencia: el estado de la licitación cambió. Recarga y vuelve a intentar."
             )
+        self._notify_kpis(tender_id)
         return {**result, "message": "Estado actualizado correctamente."}
 
     def add_partida(self, tender_id: int, payload: PartidaCreate) -> Dict[str, Any]:
@@ -263,7 +282,9 @@ class TenderService:
             "pmaxu": float(payload.pmaxu) if payload.pmaxu is not None else 0.0,
             "activo": payload.activo if payload.activo is not None else True,
         }
-        return self._repo.add_partida(tender_id, row)
+        partida = self._repo.add_partida(tender_id, row)
+        self._notify_kpis(tender_id)
+        return partida
 
     def update_partida(self, tender_id: int, detalle_id: int, payload: PartidaUpdate) -> Dict[str, Any]:
         """Actualiza partida. Lanza ValueError si edición bloqueada."""
@@ -282,9 +303,11 @@ class TenderService:
                 raise NotFoundError("Partida no encontrada.")
             return partida
         try:
-            return self._repo.update_partida(tender_id, detalle_id, update_data)
+            partida = self._repo.update_partida(tender_id, detalle_id, update_data)
         except ValueError:
             raise NotFoundError("Partida no encontrada.")
+        self._notify_kpis(tender_id)
+        return partida
 
     def delete_partida(self, tender_id: int, detalle_id: int) -> None:
         """Elimina partida. Lanza ValueError si edición bloqueada."""
@@ -296,3 +319,4 @@ class TenderService:
             self._repo.delete_partida(tender_id, detalle_id)
         except ValueError:
             raise NotFoundError("Partida no encontrada.")
+        self._notify_kpis(tender_id)
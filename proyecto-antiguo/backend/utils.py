@@ -2,11 +2,17 @@
 Utilidades compartidas para el backend.
 Migrado desde src/utils.py (sin dependencias de Streamlit).
 
-Incluye ayudas de limpieza vitales para parsear precios y números desde Excel.
+Incluye ayudas de limpieza vitales para parsear precios y números desde Excel,
+tanto celda a celda (get_clean_number) como por columnas completas (clean_*_series).
 """
 
 from datetime import date, datetime
-from typing import Any, List, Union
+from typing import Any, Iterable, Iterator, List, Optional, TypeVar, Union
+
+import pandas as pd
+from pandas.api.types import is_bool_dtype, is_datetime64_any_dtype, is_numeric_dtype
+
+T = TypeVar("T")
 
 
 def get_clean_number(
@@ -43,6 +49,87 @@ def get_clean_number(
         return 0.0
 
 
+def _as_text_series(series: pd.Series) -> pd.Series:
+    """Columna como texto (strip); NaN/None pasan a cadena vacía."""
+    obj = series.astype(object)
+    return obj.where(obj.notna(), "").astype(str).str.strip()
+
+
+def clean_number_series(series: pd.Series) -> pd.Series:
+    """
+    Versión vectorizada de get_clean_number para una columna completa.
+
+    Misma semántica: números tal cual; cadenas con € y formato europeo
+    (1.234,56) o americano (1,234.56); vacíos, "nan" o no parseables -> 0.0.
+    Devuelve una Series float64 con el mismo índice.
+    """
+    if is_bool_dtype(series) or (is_numeric_dtype(series) and not is_datetime64_any_dtype(series)):
+        return pd.to_numeric(series, errors="coerce").astype(float).fillna(0.0)
+
+    txt = _as_text_series(series).str.replace("€", "", regex=False).str.strip()
+    pos_coma = txt.str.find(",")
+    pos_punto = txt.str.find(".")
+    tiene_coma = pos_coma >= 0
+    tiene_punto = pos_punto >= 0
+    # "1,234.56": la coma es separador de miles
+    americano = tiene_coma & tiene_punto & (pos_coma < pos_punto)
+    # "1.234,56": el punto es separador de miles y la coma decimal
+    europeo = tiene_coma & tiene_punto & ~americano
+    solo_coma = tiene_coma & ~tiene_punto
+
+    txt = txt.mask(americano, txt.str.replace(",", "", regex=False))
+    txt = txt.mask(europeo, txt.str.replace(".", "", regex=False).str.replace(",", ".", regex=False))
+    txt = txt.mask(solo_coma, txt.str.replace(",", ".", regex=False))
+    return pd.to_numeric(txt, errors="coerce").astype(float).fillna(0.0)
+
+
+def clean_text_series(series: pd.Series) -> pd.Series:
+    """Columna de texto limpia: strip y "nan"/NaN/None -> "" (como el str(...).strip() de la importación)."""
+    txt = _as_text_series(series)
+    return txt.mask(txt.str.lower() == "nan", "")
+
+
+def clean_date_series(series: pd.Series) -> pd.Series:
+    """
+    Columna de fechas como 'YYYY-MM-DD' (o los 10 primeros caracteres del texto).
+    Vacíos/NaN/NaT -> None. Devuelve Series de objetos.
+    """
+    if is_datetime64_any_dtype(series):
+        out = series.dt.strftime("%Y-%m-%d").astype(object)
+        return out.where(series.notna(), None)
+    obj = series.astype(object)
+    vacio = obj.isna() | (_as_text_series(obj) == "")
+    # str(Timestamp/datetime)[:10] == strftime("%Y-%m-%d"); cadenas: primeros 10 caracteres
+    out = obj.where(~vacio, "").astype(str).str.slice(0, 10).astype(object)
+    return out.where(~vacio, None)
+
+
+def to_float(value: Any) -> Optional[float]:
+    """float(value), o None si no es convertible (None, texto, etc.)."""
+    try:
+        return float(value)
+    except (TypeError, ValueError):
+        return None
+
+
+def chunked(values: Iterable[T], size: int) -> Iterator[List[T]]:
+    """
+    Parte una secuencia en listas de como máximo size elementos.
+    Usado para trocear filtros .in_() (la URL de PostgREST tiene longitud limitada)
+    e inserciones masivas.
+    """
+    if size <= 0:
+        raise ValueError("size debe ser mayor que 0.")
+    batch: List[T] = []
+    for v in values:
+        batch.append(v)
+        if len(batch) >= size:
+            yield batch
+            batch = []
+    if batch:
+        yield batch
+
+
 def normalize_excel_columns(columns: Any) -> List[str]:
     """
     Normaliza nombres de columnas de un Excel (strip, string).
@@ -0,0 +1,172 @@
+#!/usr/bin/env python3
+"""
+Micro-benchmark de la construcción de respuestas de analítica: fila a fila
+(df.iterrows() / un modelo Pydantic por punto, lógica anterior) frente a columnas
+(backend.serialization: points_records, merge_points, timeline_records).
+
+Casos:
+- tendencia de material: puntos con fechas repetidas, último valor por día (dedup_sorted).
+- histórico de producto: PVU por día con unidades para el tooltip (df_hist).
+- timeline de KPIs: licitaciones con nombres/fechas/importes sucios (_norm_timeline_record).
+
+Comprueba además que ambos caminos serializan exactamente el mismo JSON.
+
+Ejecutar desde la raíz del proyecto (no necesita Supabase):
+  python bench_analytics_serialization.py [puntos]
+"""
+
+import os
+import random
+import sys
+import time
+from datetime import date, timedelta
+
+import pandas as pd
+
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+from backend.schemas.analytics import (
+    KPIDashboard,
+    MaterialTrendPoint,
+    MaterialTrendResponse,
+    PriceHistoryPoint,
+    TimelineItem,
+)
+from backend.serialization import merge_points, points_records, timeline_records
+
+N_POINTS = int(sys.argv[1]) if len(sys.argv) > 1 else 100_000
+
+
+def _build_points(n: int, rnd: random.Random):
+    """n puntos (fecha, precio con 3 decimales) sobre ~n/4 días distintos, sin ordenar."""
+    base = date(2000, 1, 1)
+    dias = max(n // 4, 1)
+    times = [(base + timedelta(days=rnd.randrange(dias))).isoformat() for _ in range(n)]
+    values = [rnd.randint(1, 2_000_000) / 1000 for _ in range(n)]
+    return times, values
+
+
+def _build_timeline(n: int, rnd: random.Random) -> pd.DataFrame:
+    nombres = ["Suministro plantas", "  Obra parque ", None, float("nan"), "", "nan"]
+    fechas = ["2024-03-01", " 2024-05-02 ", None, float("nan"), ""]
+    return pd.DataFrame({
+        "id_licitacion": [rnd.choice([i, i, i, None, "x"]) for i in range(n)],
+        "nombre": [rnd.choice(nombres) for _ in range(n)],
+        "fecha_adjudicacion": [rnd.choice(fechas) for _ in range(n)],
+        "fecha_finalizacion": [rnd.choice(fechas) for _ in range(n)],
+        "estado_nombre": [rnd.choice(["Adjudicada", "Presentada", "Desconocido"]) for _ in range(n)],
+        "pres_maximo": [rnd.choice([rnd.uniform(0, 1e6), 0.0, 12345.0]) for _ in range(n)],
+    })
+
+
+# ---------- Camino anterior (fila a fila) ----------
+
+def _trend_filas(times, values) -> MaterialTrendResponse:
+    points = [MaterialTrendPoint(time=t, value=round(float(v), 2)) for t, v in zip(times, values)]
+    df = pd.DataFrame([{"time": p.time, "value": p.value} for p in points])
+    df = df.sort_values("time", kind="stable").drop_duplicates(subset=["time"], keep="last")
+    pvu = [MaterialTrendPoint(time=row["time"], value=round(float(row["value"]), 2)) for _, row in df.iterrows()]
+    return MaterialTrendResponse(pvu=pvu, pcu=[])
+
+
+def _history_filas(times, values, unidades) -> list:
+    df_hist = pd.DataFrame({"time": times, "value": values})
+    df_hist = df_hist.sort_values("time", kind="stable").groupby("time", as_index=False).agg(value=("value", "last"))
+    return [
+        PriceHistoryPoint(
+            time=row["time"],
+            value=round(float(row["value"]), 2),
+            unidades=round(unidades.get(row["time"], 0.0), 2),
+        )
+        for _, row in df_hist.iterrows()
+    ]
+
+
+def _timeline_item(r) -> TimelineItem:
+    raw_id = r.get("id_licitacion")
+    try:
+        id_lic = int(raw_id) if raw_id is not None else -1
+    except (TypeError, ValueError):
+        id_lic = -1
+    raw_nombre = r.get("nombre")
+    nombre = (
+        str(raw_nombre).strip() if raw_nombre is not None and str(raw_nombre) != "nan" else ""
+    ) or f"Licitación {id_lic}"
+    raw_adj = r.get("fecha_adjudicacion")
+    raw_fin = r.get("fecha_finalizacion")
+    fecha_adj = str(raw_adj).strip() if raw_adj is not None and str(raw_adj) != "nan" else None
+    fecha_fin = str(raw_fin).strip() if raw_fin is not None and str(raw_fin) != "nan" else None
+    raw_pres = r.get("pres_maximo")
+    try:
+        pres_max = float(raw_pres) if raw_pres is not None else None
+    except (TypeError, ValueError):
+        pres_max = None
+    return TimelineItem(
+        id_licitacion=id_lic,
+        nombre=nombre,
+        fecha_adjudicacion=fecha_adj or None,
+        fecha_finalizacion=fecha_fin or None,
+        estado_nombre=r.get("estado_nombre"),
+        pres_maximo=pres_max,
+    )
+
+
+def _timeline_filas(df: pd.DataFrame) -> KPIDashboard:
+    return KPIDashboard(timeline=[_timeline_item(r) for r in df.to_dict(orient="records")])
+
+
+# ---------- Camino por columnas ----------
+
+def _trend_columnas(times, values) -> MaterialTrendResponse:
+    return MaterialTrendResponse(pvu=merge_points([(times, values)]), pcu=[])
+
+
+def _history_columnas(times, values, unidades) -> list:
+    df = pd.DataFrame({"time": times, "value": values})
+    df = df.drop_duplicates(subset=["time"], keep="last").sort_values("time", kind="stable")
+    uds = df["time"].map(unidades).fillna(0.0)
+    return [PriceHistoryPoint.model_validate(p) for p in points_records(df["time"], df["value"], unidades=uds)]
+
+
+def _timeline_columnas(df: pd.DataFrame) -> KPIDashboard:
+    return KPIDashboard(timeline=timeline_records(df))
+
+
+def _timed(fn, *args):
+    t0 = time.perf_counter()
+    out = fn(*args)
+    return out, time.perf_counter() - t0
+
+
+def _json(obj) -> str:
+    if isinstance(obj, list):
+        return "[" + ",".join(p.model_dump_json() for p in obj) + "]"
+    return obj.model_dump_json()
+
+
+def main() -> None:
+    rnd = random.Random(42)
+    times, values = _build_points(N_POINTS, rnd)
+    unidades = {t: rnd.randint(0, 50) / 4 for t in set(times[::3])}
+    timeline = _build_timeline(N_POINTS, rnd)
+
+    casos = [
+        ("tendencia material", _trend_filas, _trend_columnas, (times, values)),
+        ("histórico producto", _history_filas, _history_columnas, (times, values, unidades)),
+        ("timeline KPIs", _timeline_filas, _timeline_columnas, (timeline,)),
+    ]
+    print(f"Puntos: {N_POINTS}")
+    for nombre, filas, columnas, args in casos:
+        ref, t_rows = _timed(filas, *args)
+        vec, t_cols = _timed(columnas, *args)
+        if _json(ref) != _json(vec):
+            print(f"FAIL: {nombre}: la serialización difiere")
+            sys.exit(1)
+        print(f"  {nombre}:")
+        print(f"    fila a fila (iterrows/modelos): {t_rows:8.3f} s")
+        print(f"    por columnas:                   {t_cols:8.3f} s")
+        print(f"    speedup: x{t_rows / t_cols:.1f}  (JSON idéntico)")
+
+
+if __name__ == "__main__":
+    main()
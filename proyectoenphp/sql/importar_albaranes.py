@@ -7,6 +7,11 @@ Cambio respecto a v1:
   - tbl_albaranes_lineas ahora tiene columnas pvu y pcu separadas.
   - Las ventas rellenan pvu, las compras rellenan pcu.
   - precio_unitario se mantiene también como respaldo.
+  - Escritura por lotes: cabeceras y líneas se acumulan y se insertan con
+    executemany (INSERT multi-fila) cada BATCH_SIZE líneas, un commit por lote.
+  - WARM_UP: productos, contactos y albaranes existentes se cargan en memoria
+    al arrancar; durante la importación no se consulta MySQL para resolver ids.
+  - PARALLEL: venta y compra se importan a la vez en dos procesos.
  
 Requisito previo: ejecutar migracion_pcu_pvu.sql en MySQL
 para añadir las columnas si ya tienes datos importados.
@@ -18,6 +23,8 @@ Uso:
  
 import sys
 import logging
+import unicodedata
+from concurrent.futures import ProcessPoolExecutor
 from datetime import datetime, date
 from pathlib import Path
  
@@ -42,6 +49,8 @@ EXCEL_COMPRA = Path("Albaranes_de_compra.xlsx")
  
 DRY_RUN    = False
 BATCH_SIZE = 500
+WARM_UP    = True   # precargar productos/contactos/albaranes en memoria al arrancar
+PARALLEL   = False  # VENTA y COMPRA en procesos separados (una conexión cada uno)
 # ─────────────────────────────────────────────
  
 logging.basicConfig(
@@ -96,30 +105,93 @@ def lote_str(val) -> str | None:
 #  CACHÉ DE IDs
 # ══════════════════════════════════════════════
  
+def clave(val: str) -> str:
+    """
+    Clave de caché equivalente a la comparación de MySQL con utf8mb4_unicode_ci: sin distinguir
+    mayúsculas ni tildes/diacríticos ("Camión" = "camion") y sin espacios finales.
+    """
+    descompuesto = unicodedata.normalize("NFKD", val)
+    return "".join(c for c in descompuesto if not unicodedata.combining(c)).casefold().rstrip()
+ 
+
+def tamano_dict(d: dict) -> int:
+    """Bytes aproximados de un dict de cachés (contenedor + claves + valores)."""
+    total = sys.getsizeof(d)
+    for k, v in d.items():
+        total += sys.getsizeof(v)
+        if isinstance(k, tuple):
+            total += sys.getsizeof(k) + sum(sys.getsizeof(x) for x in k)
+        else:
+            total += sys.getsizeof(k)
+    return total
+ 
+
 class Cache:
+    """
+    Caché de ids (productos, contactos, albaranes).
+ 
+    Por defecto consulta la BD la primera vez que ve cada clave. Con warm_up()
+    carga las tres tablas de una vez y a partir de ahí no vuelve a consultar:
+    lo que no está en memoria no existe en la BD.
+    """
+ 
     def __init__(self, conn):
         self.conn = conn
+        self.precargada = False
         self._productos: dict[str, int] = {}
         self._contactos: dict[str, int] = {}
         self._albaranes: dict[tuple, int] = {}
         self._refs_sin_producto: set[str] = set()
  
+    def warm_up(self):
+        """Precarga tbl_productos.referencia, contactos y claves de tbl_albaranes."""
+        with self.conn.cursor() as cur:
+            cur.execute(
+                "SELECT id, referencia FROM tbl_productos "
+                "WHERE referencia IS NOT NULL AND referencia <> '' ORDER BY id"
+            )
+            for row in cur.fetchall():
+                self._productos.setdefault(clave(row["referencia"]), row["id"])
+ 
+            cur.execute("SELECT id, nombre, nombre_fiscal FROM contactos ORDER BY id")
+            for row in cur.fetchall():
+                for nombre in (row["nombre"], row["nombre_fiscal"]):
+                    if nombre:
+                        self._contactos.setdefault(clave(nombre), row["id"])
+ 
+            cur.execute("SELECT id_albaran, numero_albaran, tipo_albaran FROM tbl_albaranes ORDER BY id_albaran")
+            for row in cur.fetchall():
+                self._albaranes.setdefault(
+                    (clave(row["numero_albaran"]), row["tipo_albaran"]), row["id_albaran"]
+                )
+        self.precargada = True
+ 
+        log.info(
+            "Caché precargada: %d referencias (%.1f MB), %d contactos (%.1f MB), %d albaranes (%.1f MB)",
+            len(self._productos), tamano_dict(self._productos) / 1e6,
+            len(self._contactos), tamano_dict(self._contactos) / 1e6,
+            len(self._albaranes), tamano_dict(self._albaranes) / 1e6,
+        )
+ 
     def get_id_producto(self, ref: str) -> int | None:
         if ref in self._refs_sin_producto:
             return None
-        if ref not in self._productos:
-            with self.conn.cursor() as cur:
-                cur.execute(
-                    "SELECT id FROM tbl_productos WHERE referencia = %s LIMIT 1",
-                    (ref,)
-                )
-                row = cur.fetchone()
+        k = clave(ref)
+        if k not in self._productos:
+            row = None
+            if not self.precargada:
+                with self.conn.cursor() as cur:
+                    cur.execute(
+                        "SELECT id FROM tbl_productos WHERE referencia = %s LIMIT 1",
+                        (ref,)
+                    )
+                    row = cur.fetchone()
             if row:
-                self._productos[ref] = row["id"]
+                self._productos[k] = row["id"]
             else:
                 self._refs_sin_producto.add(ref)
                 return None
-        return self._productos[ref]
+        return self._productos[k]
  
     def get_id_contacto(self, nombre: str) -> int | None:
         if not nombre:
@@ -129,6 +201,14 @@ class Cache:
         candidatos = [nombre]
         if " / " in nombre:
             candidatos.append(nombre.split(" / ")[0].strip())
+        if self.precargada:
+            for candidato in candidatos:
+                id_contacto = self._contactos.get(clave(candidato))
+                if id_contacto:
+                    self._contactos[nombre] = id_contacto
+                    return id_contacto
+            self._contactos[nombre] = None
+            return None
         with self.conn.cursor() as cur:
             for candidato in candidatos:
                 cur.execute(
@@ -142,92 +222,173 @@ class Cache:
         self._contactos[nombre] = None
         return None
  
-    def albaran_exists(self, numero: str, tipo: str) -> int | None:
-        key = (numero, tipo)
-        if key not in self._albaranes:
-            with self.conn.cursor() as cur:
+    def get_albaran_cached(self, numero: str, tipo: str) -> int | None:
+        """Solo caché, sin consultar la BD (None = desconocido o no existe)."""
+        return self._albaranes.get((clave(numero), tipo))
+ 
+    def resolver_albaranes(self, numeros, tipo: str, forzar: bool = False) -> None:
+        """
+        Resuelve en bloque (SELECT … IN) los id_albaran de los números aún no cacheados.
+        Con la caché precargada solo consulta si forzar=True (cabeceras recién insertadas).
+        """
+        if self.precargada and not forzar:
+            return
+        pendientes = list(dict.fromkeys(
+            n for n in numeros if self._albaranes.get((clave(n), tipo)) is None
+        ))
+        with self.conn.cursor() as cur:
+            for i in range(0, len(pendientes), BATCH_SIZE):
+                trozo = pendientes[i:i + BATCH_SIZE]
                 cur.execute(
-                    "SELECT id_albaran FROM tbl_albaranes "
-                    "WHERE numero_albaran = %s AND tipo_albaran = %s LIMIT 1",
-                    (numero, tipo)
+                    "SELECT id_albaran, numero_albaran FROM tbl_albaranes "
+                    "WHERE tipo_albaran = %s AND numero_albaran IN ("
+                    + ", ".join(["%s"] * len(trozo)) + ")",
+                    (tipo, *trozo)
                 )
-                row = cur.fetchone()
-            self._albaranes[key] = row["id_albaran"] if row else None
-        return self._albaranes[key]
- 
-    def set_albaran(self, numero: str, tipo: str, id_albaran: int):
-        self._albaranes[(numero, tipo)] = id_albaran
+                for row in cur.fetchall():
+                    self._albaranes[(clave(row["numero_albaran"]), tipo)] = row["id_albaran"]
  
+    def olvidar_albaranes(self, numeros, tipo: str) -> None:
+        """Descarta ids cacheados (p. ej. cabeceras insertadas en un lote que se ha deshecho)."""
+        for n in numeros:
+            self._albaranes.pop((clave(n), tipo), None)
  
+
 # ══════════════════════════════════════════════
-#  INSERT HELPERS
+#  ESCRITURA POR LOTES
 # ══════════════════════════════════════════════
  
-def insert_albaran(cur, cache: Cache, numero: str, tipo: str, fecha: date,
-                   num_factura, nombre_contacto, comercial) -> int:
-    existing = cache.albaran_exists(numero, tipo)
-    if existing:
-        return existing
-    id_contacto = cache.get_id_contacto(nombre_contacto) if nombre_contacto else None
-    cur.execute(
-        """
-        INSERT INTO tbl_albaranes
-            (numero_albaran, tipo_albaran, fecha_albaran,
-             numero_factura, id_contacto, nombre_contacto, comercial)
-        VALUES (%s, %s, %s, %s, %s, %s, %s)
-        """,
-        (numero, tipo, fecha, num_factura, id_contacto,
-         to_str(nombre_contacto, 255), to_str(comercial, 255))
-    )
-    id_albaran = cur.lastrowid
-    cache.set_albaran(numero, tipo, id_albaran)
-    return id_albaran
+SQL_INSERT_ALBARAN = """
+    INSERT INTO tbl_albaranes
+        (numero_albaran, tipo_albaran, fecha_albaran,
+         numero_factura, id_contacto, nombre_contacto, comercial)
+    VALUES (%s, %s, %s, %s, %s, %s, %s)
+"""
  
+# Todos los valores como %s (sin NULL literales) para que pymysql.executemany
+# lo reescriba como un único INSERT multi-fila.
+SQL_INSERT_LINEA = """
+    INSERT INTO tbl_albaranes_lineas
+        (id_albaran, id_producto, ref_articulo, nombre_articulo,
+         familia, lote, cantidad,
+         precio_unitario, pvu, pcu,
+         iva_pct, descuento_pct, importe)
+    VALUES (%s, %s, %s, %s, %s, %s, %s,
+            %s, %s, %s,
+            %s, %s, %s)
+"""
+ 
+ 
+def linea_venta(id_producto, ref: str, nombre_art: str, familia, lote,
+                cantidad: float, pvu, iva_pct, dto_pct, importe) -> tuple:
+    """Línea de VENTA — rellena pvu, deja pcu a NULL. Tupla sin id_albaran."""
+    return (id_producto,
+            to_str(ref, 255), to_str(nombre_art, 500),
+            to_str(familia, 255), lote, cantidad,
+            pvu, pvu, None,     # precio_unitario y pvu son el mismo valor
+            iva_pct, dto_pct, importe)
+ 
+ 
+def linea_compra(id_producto, ref: str, nombre_art: str, familia,
+                 cantidad: float, pcu, iva_pct, dto_pct, importe) -> tuple:
+    """Línea de COMPRA — rellena pcu, deja pvu a NULL. Tupla sin id_albaran."""
+    return (id_producto,
+            to_str(ref, 255), to_str(nombre_art, 500),
+            to_str(familia, 255), None, cantidad,
+            pcu, None, pcu,     # precio_unitario y pcu son el mismo valor
+            iva_pct, dto_pct, importe)
  
-def insert_linea_venta(cur, id_albaran: int, id_producto, ref: str,
-                       nombre_art: str, familia, lote, cantidad: float,
-                       pvu, iva_pct, dto_pct, importe):
-    """Línea de VENTA — rellena pvu, deja pcu a NULL."""
-    cur.execute(
-        """
-        INSERT INTO tbl_albaranes_lineas
-            (id_albaran, id_producto, ref_articulo, nombre_articulo,
-             familia, lote, cantidad,
-             precio_unitario, pvu, pcu,
-             iva_pct, descuento_pct, importe)
-        VALUES (%s, %s, %s, %s, %s, %s, %s,
-                %s,  %s, NULL,
-                %s,  %s,  %s)
-        """,
-        (id_albaran, id_producto,
-         to_str(ref, 255), to_str(nombre_art, 500),
-         to_str(familia, 255), lote, cantidad,
-         pvu, pvu,          # precio_unitario y pvu son el mismo valor
-         iva_pct, dto_pct, importe)
-    )
  
+class AlbaranWriter:
+    """
+    Acumula cabeceras y líneas de un tipo (VENTA/COMPRA) y las vuelca cada
+    BATCH_SIZE líneas: cabeceras nuevas con executemany, sus id_albaran con un
+    SELECT … IN, y las líneas con executemany. Un commit por lote; si el lote
+    falla se deshace y se reintenta fila a fila para no perder las filas buenas.
+    """
  
-def insert_linea_compra(cur, id_albaran: int, id_producto, ref: str,
-                        nombre_art: str, familia, cantidad: float,
-                        pcu, iva_pct, dto_pct, importe):
-    """Línea de COMPRA — rellena pcu, deja pvu a NULL."""
-    cur.execute(
+    def __init__(self, conn, cache: Cache, tipo: str, stats: dict):
+        self.conn = conn
+        self.cache = cache
+        self.tipo = tipo
+        self.stats = stats
+        self._cabeceras: dict[str, tuple] = {}
+        self._lineas: list[tuple[int, str, tuple]] = []
+ 
+    def add(self, fila: int, numero: str, fecha: date, num_factura,
+            nombre_contacto, comercial, linea: tuple):
+        k = clave(numero)
+        if k not in self._cabeceras and self.cache.get_albaran_cached(numero, self.tipo) is None:
+            self._cabeceras[k] = (numero, fecha, num_factura, nombre_contacto, comercial)
+        self._lineas.append((fila, numero, linea))
+        if len(self._lineas) >= BATCH_SIZE:
+            self.flush()
+ 
+    def _insertar_cabeceras(self, cur, cabeceras: list[tuple]) -> list[str]:
+        """Inserta las cabeceras aún sin id_albaran y cachea sus ids. Devuelve los números insertados."""
+        self.cache.resolver_albaranes([c[0] for c in cabeceras], self.tipo)
+        pendientes = [c for c in cabeceras
+                      if self.cache.get_albaran_cached(c[0], self.tipo) is None]
+        nuevas = [c[0] for c in pendientes]
+        if nuevas:
+            params = []
+            for numero, fecha, num_factura, contacto, comercial in pendientes:
+                id_contacto = self.cache.get_id_contacto(contacto) if contacto else None
+                params.append((numero, self.tipo, fecha, num_factura, id_contacto,
+                               to_str(contacto, 255), to_str(comercial, 255)))
+            cur.executemany(SQL_INSERT_ALBARAN, params)
+            self.cache.resolver_albaranes(nuevas, self.tipo, forzar=True)
+        return nuevas
+ 
+    def flush(self):
+        if not self._lineas:
+            return
+        cabeceras, self._cabeceras = self._cabeceras, {}
+        lineas, self._lineas = self._lineas, []
+        nuevas: list[str] = []
+        try:
+            with self.conn.cursor() as cur:
+                nuevas = self._insertar_cabeceras(cur, list(cabeceras.values()))
+                cur.executemany(SQL_INSERT_LINEA, [
+                    (self.cache.get_albaran_cached(numero, self.tipo), *linea)
+                    for _fila, numero, linea in lineas
+                ])
+            if not DRY_RUN:
+                self.conn.commit()
+        except Exception as exc:
+            self.conn.rollback()
+            self.cache.olvidar_albaranes(nuevas, self.tipo)
+            log.warning("Filas %d-%d (%s) error en el lote, se reintenta fila a fila: %s",
+                        lineas[0][0], lineas[-1][0], self.tipo, exc)
+            self._fila_a_fila(cabeceras, lineas)
+            return
+        self.stats["lineas_ok"] += len(lineas)
+        log.info("  %s: %d filas procesadas …", self.tipo, self.stats["filas"])
+ 
+    def _fila_a_fila(self, cabeceras: dict[str, tuple], lineas: list[tuple[int, str, tuple]]):
         """
-        INSERT INTO tbl_albaranes_lineas
-            (id_albaran, id_producto, ref_articulo, nombre_articulo,
-             familia, lote, cantidad,
-             precio_unitario, pvu, pcu,
-             iva_pct, descuento_pct, importe)
-        VALUES (%s, %s, %s, %s, %s, NULL, %s,
-                %s, NULL, %s,
-                %s,  %s,  %s)
-        """,
-        (id_albaran, id_producto,
-         to_str(ref, 255), to_str(nombre_art, 500),
-         to_str(familia, 255), cantidad,
-         pcu, pcu,          # precio_unitario y pcu son el mismo valor
-         iva_pct, dto_pct, importe)
-    )
+        Reintento de un lote fallido: cada línea (con su cabecera si aún no existe) en su propia
+        transacción, de modo que solo se pierden las filas que fallan de verdad.
+        """
+        for fila, numero, linea in lineas:
+            nuevas: list[str] = []
+            try:
+                with self.conn.cursor() as cur:
+                    cabecera = cabeceras.get(clave(numero))
+                    if cabecera is not None:
+                        nuevas = self._insertar_cabeceras(cur, [cabecera])
+                    cur.execute(SQL_INSERT_LINEA,
+                                (self.cache.get_albaran_cached(numero, self.tipo), *linea))
+                if not DRY_RUN:
+                    self.conn.commit()
+            except Exception as exc:
+                self.conn.rollback()
+                self.cache.olvidar_albaranes(nuevas, self.tipo)
+                self.stats["errores"] += 1
+                log.warning("Fila %d (%s) error: %s", fila, self.tipo, exc)
+                continue
+            self.stats["lineas_ok"] += 1
+        log.info("  %s: %d filas procesadas …", self.tipo, self.stats["filas"])
  
  
 # ══════════════════════════════════════════════
@@ -245,35 +406,34 @@ def importar_venta(conn, cache: Cache):
     ws = wb.active
     stats = {"filas": 0, "lineas_ok": 0, "lineas_sin_ref": 0, "errores": 0}
  
-    with conn.cursor() as cur:
-        for i, row in enumerate(ws.iter_rows(min_row=2, values_only=True), start=2):
-            num_alb, fecha, num_fac, cliente, comercial, \
-            familia, ref, lote, articulo, cantidad, precio, \
-            iva, dto, importe = row
- 
-            if not num_alb or not fecha:
-                continue
- 
-            stats["filas"] += 1
-            ref      = to_str(ref, 255)
-            cantidad = to_decimal(cantidad) or 0.0
- 
-            try:
-                id_albaran = insert_albaran(
-                    cur, cache,
-                    numero=to_str(num_alb, 50),
-                    tipo="VENTA",
-                    fecha=to_date(fecha),
-                    num_factura=to_str(num_fac, 50),
-                    nombre_contacto=to_str(cliente, 255),
-                    comercial=to_str(comercial, 255),
-                )
-                id_prod = cache.get_id_producto(ref) if ref else None
-                if not ref or id_prod is None:
-                    stats["lineas_sin_ref"] += 1
- 
-                insert_linea_venta(
-                    cur, id_albaran, id_prod,
+    writer = AlbaranWriter(conn, cache, "VENTA", stats)
+ 
+    for i, row in enumerate(ws.iter_rows(min_row=2, values_only=True), start=2):
+        num_alb, fecha, num_fac, cliente, comercial, \
+        familia, ref, lote, articulo, cantidad, precio, \
+        iva, dto, importe = row
+ 
+        if not num_alb or not fecha:
+            continue
+ 
+        stats["filas"] += 1
+        ref      = to_str(ref, 255)
+        cantidad = to_decimal(cantidad) or 0.0
+ 
+        try:
+            id_prod = cache.get_id_producto(ref) if ref else None
+            if not ref or id_prod is None:
+                stats["lineas_sin_ref"] += 1
+ 
+            writer.add(
+                i,
+                numero=to_str(num_alb, 50),
+                fecha=to_date(fecha),
+                num_factura=to_str(num_fac, 50),
+                nombre_contacto=to_str(cliente, 255),
+                comercial=to_str(comercial, 255),
+                linea=linea_venta(
+                    id_prod,
                     ref=ref or "",
                     nombre_art=to_str(articulo, 500) or "",
                     familia=to_str(familia, 255),
@@ -283,22 +443,15 @@ def importar_venta(conn, cache: Cache):
                     iva_pct=to_decimal(iva),
                     dto_pct=to_decimal(dto),
                     importe=to_decimal(importe),
-                )
-                stats["lineas_ok"] += 1
+                ),
+            )
  
-            except Exception as exc:
-                stats["errores"] += 1
-                log.warning("Fila %d (VENTA) error: %s", i, exc)
-                conn.rollback()
-                continue
- 
-            if stats["filas"] % BATCH_SIZE == 0:
-                if not DRY_RUN:
-                    conn.commit()
-                log.info("  VENTA: %d filas procesadas …", stats["filas"])
+        except Exception as exc:
+            stats["errores"] += 1
+            log.warning("Fila %d (VENTA) error: %s", i, exc)
+            continue
  
-    if not DRY_RUN:
-        conn.commit()
+    writer.flush()
     wb.close()
     log.info("VENTA completado: %s", stats)
     return stats
@@ -321,35 +474,34 @@ def importar_compra(conn, cache: Cache):
     ws = wb.active
     stats = {"filas": 0, "lineas_ok": 0, "lineas_sin_ref": 0, "errores": 0}
  
-    with conn.cursor() as cur:
-        for i, row in enumerate(ws.iter_rows(min_row=2, values_only=True), start=2):
-            fecha, num_alb, proveedor, familia, ref, articulo, \
-            cantidad, precio_bruto, precio_gi, iva, dto, importe = row
- 
-            if not num_alb or not fecha:
-                continue
- 
-            stats["filas"] += 1
-            ref      = to_str(ref, 255)
-            cantidad = to_decimal(cantidad) or 0.0
-            pcu      = to_decimal(precio_gi) or to_decimal(precio_bruto)
- 
-            try:
-                id_albaran = insert_albaran(
-                    cur, cache,
-                    numero=to_str(num_alb, 50),
-                    tipo="COMPRA",
-                    fecha=to_date(fecha),
-                    num_factura=None,
-                    nombre_contacto=to_str(proveedor, 255),
-                    comercial=None,
-                )
-                id_prod = cache.get_id_producto(ref) if ref else None
-                if not ref or id_prod is None:
-                    stats["lineas_sin_ref"] += 1
- 
-                insert_linea_compra(
-                    cur, id_albaran, id_prod,
+    writer = AlbaranWriter(conn, cache, "COMPRA", stats)
+ 
+    for i, row in enumerate(ws.iter_rows(min_row=2, values_only=True), start=2):
+        fecha, num_alb, proveedor, familia, ref, articulo, \
+        cantidad, precio_bruto, precio_gi, iva, dto, importe = row
+ 
+        if not num_alb or not fecha:
+            continue
+ 
+        stats["filas"] += 1
+        ref      = to_str(ref, 255)
+        cantidad = to_decimal(cantidad) or 0.0
+        pcu      = to_decimal(precio_gi) or to_decimal(precio_bruto)
+ 
+        try:
+            id_prod = cache.get_id_producto(ref) if ref else None
+            if not ref or id_prod is None:
+                stats["lineas_sin_ref"] += 1
+ 
+            writer.add(
+                i,
+                numero=to_str(num_alb, 50),
+                fecha=to_date(fecha),
+                num_factura=None,
+                nombre_contacto=to_str(proveedor, 255),
+                comercial=None,
+                linea=linea_compra(
+                    id_prod,
                     ref=ref or "",
                     nombre_art=to_str(articulo, 500) or "",
                     familia=to_str(familia, 255),
@@ -358,22 +510,15 @@ def importar_compra(conn, cache: Cache):
                     iva_pct=to_decimal(iva),
                     dto_pct=to_decimal(dto),
                     importe=to_decimal(importe),
-                )
-                stats["lineas_ok"] += 1
+                ),
+            )
  
-            except Exception as exc:
-                stats["errores"] += 1
-                log.warning("Fila %d (COMPRA) error: %s", i, exc)
-                conn.rollback()
-                continue
+        except Exception as exc:
+            stats["errores"] += 1
+            log.warning("Fila %d (COMPRA) error: %s", i, exc)
+            continue
  
-            if stats["filas"] % BATCH_SIZE == 0:
-                if not DRY_RUN:
-                    conn.commit()
-                log.info("  COMPRA: %d filas procesadas …", stats["filas"])
- 
-    if not DRY_RUN:
-        conn.commit()
+    writer.flush()
     wb.close()
     log.info("COMPRA completado: %s", stats)
     return stats
@@ -383,15 +528,7 @@ def importar_compra(conn, cache: Cache):
 #  MAIN
 # ══════════════════════════════════════════════
  
-def main():
-    for f in (EXCEL_VENTA, EXCEL_COMPRA):
-        if not f.exists():
-            log.error("No se encuentra el fichero: %s", f.resolve())
-            sys.exit(1)
- 
-    if DRY_RUN:
-        log.warning("═══ MODO DRY RUN — no se escribirá nada en la BD ═══")
- 
+def conectar():
     log.info("Conectando a MySQL %s:%s/%s …", DATABASE["host"], DATABASE["port"], DATABASE["db"])
     conn = pymysql.connect(
         **DATABASE,
@@ -399,30 +536,73 @@ def main():
         autocommit=False,
     )
     log.info("Conexión OK.")
-    cache = Cache(conn)
+    return conn
  
+
+def importar_en_proceso(tipo: str) -> tuple[dict, set[str]]:
+    """
+    Trabajo de un proceso del modo PARALLEL: conexión y caché propias.
+    Devuelve (stats, referencias sin producto) para fusionarlas en el resumen.
+    """
+    conn = conectar()
     try:
-        t0 = datetime.now()
-        stats_v = importar_venta(conn, cache)
-        stats_c = importar_compra(conn, cache)
-        elapsed = (datetime.now() - t0).total_seconds()
- 
-        log.info("═══════════════════════════════════════════")
-        log.info("RESUMEN FINAL (%.1f s)", elapsed)
-        log.info("  VENTA  → %d líneas (pvu relleno), %d sin id_producto, %d errores",
-                 stats_v["lineas_ok"], stats_v["lineas_sin_ref"], stats_v["errores"])
-        log.info("  COMPRA → %d líneas (pcu relleno), %d sin id_producto, %d errores",
-                 stats_c["lineas_ok"], stats_c["lineas_sin_ref"], stats_c["errores"])
-        if cache._refs_sin_producto:
-            log.info("  Referencias no encontradas en tbl_productos: %d únicas",
-                     len(cache._refs_sin_producto))
-            log.info("    Muestra: %s", list(cache._refs_sin_producto)[:10])
-        log.info("═══════════════════════════════════════════")
- 
+        cache = Cache(conn)
+        if WARM_UP:
+            cache.warm_up()
+        importar = importar_venta if tipo == "VENTA" else importar_compra
+        return importar(conn, cache), cache._refs_sin_producto
     finally:
         conn.close()
  
+
+def main():
+    for f in (EXCEL_VENTA, EXCEL_COMPRA):
+        if not f.exists():
+            log.error("No se encuentra el fichero: %s", f.resolve())
+            sys.exit(1)
+ 
+    if DRY_RUN:
+        log.warning("═══ MODO DRY RUN — no se escribirá nada en la BD ═══")
  
+    t0 = datetime.now()
+    if PARALLEL:
+        # Los dos libros son independientes (tipo_albaran distinto): un proceso por libro,
+        # cada uno con su conexión. El tiempo total lo marca el fichero más grande.
+        log.info("Modo PARALLEL: VENTA y COMPRA en procesos separados.")
+        with ProcessPoolExecutor(max_workers=2) as pool:
+            fut_v = pool.submit(importar_en_proceso, "VENTA")
+            fut_c = pool.submit(importar_en_proceso, "COMPRA")
+            stats_v, refs_v = fut_v.result()
+            stats_c, refs_c = fut_c.result()
+        refs_sin_producto = refs_v | refs_c
+    else:
+        conn = conectar()
+        try:
+            cache = Cache(conn)
+            if WARM_UP:
+                cache.warm_up()
+            stats_v = importar_venta(conn, cache)
+            stats_c = importar_compra(conn, cache)
+            refs_sin_producto = cache._refs_sin_producto
+        finally:
+            conn.close()
+    elapsed = (datetime.now() - t0).total_seconds()
+ 
+    total = {k: stats_v[k] + stats_c[k] for k in stats_v}
+    log.info("═══════════════════════════════════════════")
+    log.info("RESUMEN FINAL (%.1f s)", elapsed)
+    log.info("  VENTA  → %d líneas (pvu relleno), %d sin id_producto, %d errores",
+             stats_v["lineas_ok"], stats_v["lineas_sin_ref"], stats_v["errores"])
+    log.info("  COMPRA → %d líneas (pcu relleno), %d sin id_producto, %d errores",
+             stats_c["lineas_ok"], stats_c["lineas_sin_ref"], stats_c["errores"])
+    log.info("  TOTAL  → %d filas, %d líneas, %d sin id_producto, %d errores",
+             total["filas"], total["lineas_ok"], total["lineas_sin_ref"], total["errores"])
+    if refs_sin_producto:
+        log.info("  Referencias no encontradas en tbl_productos: %d únicas",
+                 len(refs_sin_producto))
+        log.info("    Muestra: %s", list(refs_sin_producto)[:10])
+    log.info("═══════════════════════════════════════════")
+ 
+
 if __name__ == "__main__":
     main()
- 
\ No newline at end of file